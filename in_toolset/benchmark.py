@@ -0,0 +1,151 @@
+"""A benchmark suite that measures the toolset on generated industries of increasing size.
+
+For every size, an industry is generated with :py:func:`~in_toolset.model.generator.generateIndustry` and timed while it is
+saved and loaded in both project formats, exported to PNML, played with the token game of the model, simulated as a
+:py:class:`~in_toolset.model.compiled.CompiledNet` and explored. The results are plain data that can be written as JSON
+and compared with the results of another version, see :py:func:`compareResults`.
+
+Like :py:mod:`~in_toolset.cli`, this module only depends on the model layer."""
+
+from .model.generator import generateIndustry
+from .model.project import saveIndustry, loadIndustry, atomicOpen
+from .model.pnml import PNMLWriter
+from .model.compiled import compileIndustry
+import platform
+import tempfile
+import random
+import time
+import os
+
+
+METRICS = (
+	"generate", "save", "load", "save binary", "load binary", "export", "token game", "simulate", "explore"
+) #: The names of the timed operations, in the order in which they are run
+
+
+def measure(func, repeat):
+	"""Call `func` `repeat` times and return the shortest duration in seconds and the result of the last call"""
+	best = None
+	for i in range(repeat):
+		start = time.perf_counter()
+		result = func()
+		duration = time.perf_counter() - start
+		if best is None or duration < best:
+			best = duration
+	return best, result
+
+
+def playTokenGame(net, steps, rng):
+	"""Trigger `steps` random transitions of the :py:class:`~in_toolset.model.base.PetriNet` `net` the way the editor does,
+	resetting the marking whenever the net is in deadlock"""
+	for step in range(steps):
+		if net.deadlock:
+			net.setInitialMarking()
+			if net.deadlock:
+				return step
+		rng.choice(net.enabledTransitions()).trigger()
+	return steps
+
+
+def simulate(net, steps, rng):
+	"""Fire `steps` random transitions of the :py:class:`~in_toolset.model.compiled.CompiledNet` `net`, starting over
+	from its initial marking whenever it is in deadlock"""
+	initial = net.marking[:]
+	fired = 0
+	while fired < steps:
+		net.marking = initial[:]
+		count = net.run(steps - fired, rng)
+		if count == 0:
+			break
+		fired += count
+	net.marking = initial
+	return fired
+
+
+def benchmarkSize(enterprises, repeat=3, steps=10000, limit=1000, seed=0, **options):
+	"""Return the results of the benchmarks for an industry of `enterprises` enterprises, as a dictionary.
+	`options` are passed on to :py:func:`~in_toolset.model.generator.generateIndustry`."""
+	timings = {}
+	timings["generate"], industry = measure(lambda: generateIndustry(enterprises, seed=seed, **options), 1)
+
+	net = compileIndustry(industry)
+	result = {
+		"enterprises": enterprises,
+		"places": net.placeCount(),
+		"transitions": net.transitionCount(),
+		"channels": sum(1 for arrow in industry.graph.arrows),
+		"timings": timings,
+	}
+
+	with tempfile.TemporaryDirectory() as directory:
+		flow = os.path.join(directory, "bench.flow")
+		binary = os.path.join(directory, "bench.flowb")
+		def export():
+			with atomicOpen(os.path.join(directory, "bench.pnml"), encoding="utf-8") as f:
+				PNMLWriter(industry.net, industry.graph).save(f)
+
+		timings["save"], _ = measure(lambda: saveIndustry(industry, flow), repeat)
+		timings["load"], _ = measure(lambda: loadIndustry(flow), repeat)
+		timings["save binary"], _ = measure(lambda: saveIndustry(industry, binary), repeat)
+		timings["load binary"], _ = measure(lambda: loadIndustry(binary), repeat)
+		timings["export"], _ = measure(export, repeat)
+
+	# The token game is much slower than the compiled net, so it fires fewer transitions
+	tokenSteps = max(1, steps // 10)
+	timings["token game"], result["token game steps"] = measure(
+		lambda: playTokenGame(industry.net, tokenSteps, random.Random(seed)), 1
+	)
+	timings["simulate"], result["simulated steps"] = measure(lambda: simulate(net, steps, random.Random(seed)), repeat)
+
+	timings["explore"], space = measure(lambda: net.explore(limit), 1)
+	result["states"] = space.states
+	result["complete"] = space.complete
+	return result
+
+
+def runSuite(sizes, repeat=3, steps=10000, limit=1000, seed=0, label="", report=None, **options):
+	"""Run :py:func:`benchmarkSize` for every number of enterprises in `sizes` and return the results as a dictionary,
+	which also describes the parameters and the environment. `report` is called with the result of every size as it is done."""
+	results = []
+	for size in sizes:
+		result = benchmarkSize(size, repeat, steps, limit, seed, **options)
+		results.append(result)
+		if report:
+			report(result)
+
+	return {
+		"label": label,
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+		"parameters": dict(options, repeat=repeat, steps=steps, limit=limit, seed=seed),
+		"results": results,
+	}
+
+
+def formatResult(result):
+	"""Return the lines that describe the result of one size"""
+	lines = ["%i enterprises, %i places, %i transitions, %i channels" %(
+		result["enterprises"], result["places"], result["transitions"], result["channels"]
+	)]
+	for metric in METRICS:
+		lines.append("  %-16s %10.2f ms" %(metric, result["timings"][metric] * 1000))
+	return lines
+
+
+def compareResults(old, new):
+	"""Return lines that compare the timings of two results of :py:func:`runSuite` for the sizes they have in common,
+	as the ratio of the new to the old duration"""
+	previous = {result["enterprises"]: result for result in old["results"]}
+	lines = []
+	for result in new["results"]:
+		other = previous.get(result["enterprises"])
+		if other is None:
+			continue
+		lines.append("%i enterprises (%s -> %s)" %(result["enterprises"], old.get("label") or "old", new.get("label") or "new"))
+		for metric in METRICS:
+			before = other["timings"].get(metric)
+			after = result["timings"][metric]
+			if before:
+				lines.append("  %-16s %10.2f ms %10.2f ms %7.2fx" %(metric, before * 1000, after * 1000, after / before))
+	return lines
@@ -0,0 +1,399 @@
+"""The command-line interface of in-toolset, for using the toolset in batch jobs without a display.
+
+This module, and everything it imports, only depends on the model layer, so none of the commands import PyQt5."""
+
+from .model.project import Project, loadIndustry, saveIndustry, atomicOpen
+from .model.pnml import PNMLReader, PNMLWriter
+from .model.compiled import compileIndustry
+from .model.binary import BinaryProjectReader, isBinaryProject
+from .model.layout import layoutEnterprise, layoutIndustry
+from .model.wiring import autoWire
+from .model.generator import generateIndustry, SHAPES
+from .model.statistics import FiringStatistics, objectNames, compiledNames, summary
+from .model.timed import simulateTimed, writeCSV, DEFAULT_DELAY
+from . import benchmark
+from . import memory
+from .common import profileSignals
+from .commands import isCommand
+from .model.ui import UIPetriNet
+import argparse
+import json
+import random
+import time
+import sys
+
+
+PNML_EXTENSION = ".pnml"
+
+
+def readIndustry(filename):
+	"""Load an industry from a project file or a PNML file"""
+	if filename.endswith(PNML_EXTENSION):
+		return PNMLReader().loadIndustry(filename)
+	return loadIndustry(filename)
+
+
+def writeIndustry(industry, filename):
+	"""Save an industry to a project file or export it to a PNML file"""
+	if filename.endswith(PNML_EXTENSION):
+		with atomicOpen(filename, encoding="utf-8") as f:
+			PNMLWriter(industry.net, industry.graph).save(f)
+	else:
+		saveIndustry(industry, filename)
+
+
+def readCompiled(filename):
+	"""Load the net in `filename` into a :py:class:`~in_toolset.model.compiled.CompiledNet`,
+	without building the model if the file is a binary project"""
+	if not filename.endswith(PNML_EXTENSION) and isBinaryProject(filename):
+		return BinaryProjectReader().loadCompiled(filename)
+	return compileIndustry(readIndustry(filename))
+
+
+def readCompiledNames(filename):
+	"""Load the net in `filename` like :py:func:`readCompiled` and return it with the names of
+	:py:func:`~in_toolset.model.statistics.compiledNames`"""
+	if not filename.endswith(PNML_EXTENSION) and isBinaryProject(filename):
+		reader = BinaryProjectReader()
+		return reader.loadCompiled(filename), reader.loadNames(filename)
+	industry = readIndustry(filename)
+	net = compileIndustry(industry)
+	return net, compiledNames(industry, net)
+
+
+def simulateCommand(args):
+	rng = random.Random(args.seed)
+	if args.output or args.statistics:
+		industry = readIndustry(args.input)
+		net = compileIndustry(industry)
+	else:
+		net = readCompiled(args.input)
+
+	statistics = FiringStatistics.forNet(net) if args.statistics else None
+	fired = net.run(args.steps, rng, statistics)
+	print("fired: %i" %fired)
+	print("deadlock: %s" %("yes" if fired < args.steps else "no"))
+	print("tokens: %i" %sum(net.marking))
+	if statistics:
+		for line in summary(statistics, net, objectNames(industry), args.statistics):
+			print(line)
+
+	if args.output:
+		net.writeBack()
+		writeIndustry(industry, args.output)
+	return 0
+
+
+def timedCommand(args):
+	# Binary projects are simulated without building the model
+	net, (placeNames, transitionNames, enterprises) = readCompiledNames(args.input)
+	result = simulateTimed(net, args.events, args.cases, args.until, random.Random(args.seed), args.default_delay)
+	for line in result.summary(placeNames, enterprises, args.top):
+		print(line)
+
+	if args.output:
+		with atomicOpen(args.output, newline="") as f:
+			writeCSV(result.rows(placeNames, transitionNames, enterprises), f)
+	return 0
+
+
+def analyzeCommand(args):
+	industry = readIndustry(args.input)
+	net = compileIndustry(industry)
+
+	channels = sum(1 for arrow in industry.graph.arrows)
+	unconnected = 0
+	for trans in industry.net.transitions:
+		if trans.type and not trans.channel:
+			unconnected += 1
+
+	print("enterprises: %i" %len(industry.graph.nodes))
+	print("places: %i" %net.placeCount())
+	print("transitions: %i" %net.transitionCount())
+	print("arcs: %i" %sum(len(p) + len(q) for p, q in zip(net.presets, net.postsets)))
+	print("channels: %i" %channels)
+	print("unconnected message transitions: %i" %unconnected)
+	print("tokens: %i" %sum(net.marking))
+
+	if args.limit > 0:
+		space = net.explore(args.limit)
+		print("reachable markings: %i%s" %(space.states, "" if space.complete else " (limit reached)"))
+		print("reachable deadlocks: %i" %space.deadlocks)
+		print("bound: %i" %space.bound)
+	return 0
+
+
+def exportCommand(args):
+	project = Project()
+	project.load(args.input)
+	project.export(args.output)
+	return 0
+
+
+def convertCommand(args):
+	writeIndustry(readIndustry(args.input), args.output)
+	return 0
+
+
+def layoutCommand(args):
+	industry = readIndustry(args.input)
+	if not args.skip_enterprises:
+		for node in industry.graph.nodes:
+			if isinstance(node.obj, UIPetriNet):
+				layoutEnterprise(node.obj)
+	if not args.skip_industry:
+		layoutIndustry(industry)
+	writeIndustry(industry, args.output or args.input)
+	return 0
+
+
+def wireCommand(args):
+	industry = readIndustry(args.input)
+	report = autoWire(industry, pairAmbiguous=args.ambiguous)
+	for line in report.summary():
+		print(line)
+	writeIndustry(industry, args.output or args.input)
+	return 0
+
+
+def generateCommand(args):
+	industry = generateIndustry(
+		args.enterprises, args.steps, args.shape, args.branches, args.fanout, args.density, args.seed, not args.no_layout
+	)
+	writeIndustry(industry, args.output)
+	return 0
+
+
+def benchmarkCommand(args):
+	def report(result):
+		for line in benchmark.formatResult(result):
+			print(line)
+		sys.stdout.flush()
+
+	results = benchmark.runSuite(
+		args.sizes, args.repeat, args.steps, args.limit, args.seed, args.label, report,
+		shape=args.shape, fanout=args.fanout, density=args.density
+	)
+	if args.output:
+		with atomicOpen(args.output) as f:
+			json.dump(results, f, indent=1)
+	if args.compare:
+		with open(args.compare) as f:
+			old = json.load(f)
+		for line in benchmark.compareResults(old, results):
+			print(line)
+	return 0
+
+
+def memoryCommand(args):
+	if args.input:
+		load = lambda: readIndustry(args.input)
+	else:
+		load = lambda: generateIndustry(args.enterprises, seed=args.seed)
+
+	costs = memory.unitCosts(args.count)
+	print("bytes per object:")
+	for name, size in costs.items():
+		print("  %-20s %12s" %(name, memory.formatBytes(size)))
+
+	footprint, industry = memory.projectFootprint(load, costs)
+	for line in footprint.summary(args.top):
+		print(line)
+
+	census = memory.signalCensus()
+	print("live signals: %(signals)i with %(callbacks)i callbacks" %census)
+	print("object lists: %(lists)i with %(entries)i entries, %(tombstones)i of them deleted or inactive" %census)
+
+	if args.cycles < 2:
+		return 0
+	samples = memory.checkGrowth(lambda: memory.visitScenes(industry), args.cycles)
+	increase = memory.growth(samples)
+	print("scene cycles: %i, %s retained per cycle" %(
+		args.cycles, memory.formatBytes((samples[-1]["bytes"] - samples[0]["bytes"]) / (args.cycles - 1))
+	))
+	for name, count in increase.items():
+		print("  growing: %.1f %s per cycle" %(count, name))
+	if not increase:
+		print("  no growth")
+	return 1 if increase else 0
+
+
+def profileCommand(args):
+	with profileSignals() as profiler:
+		with profiler.section("load"):
+			industry = readIndustry(args.input)
+		with profiler.section("visit scenes"):
+			memory.visitScenes(industry)
+		with profiler.section("move"):
+			for node in list(industry.graph.nodes):
+				node.move(node.x + 10, node.y)
+				for child in list(node.obj.graph.nodes):
+					child.move(child.x + 10, child.y)
+		with profiler.section("token game"):
+			industry.net.setInitialMarking()
+			benchmark.playTokenGame(industry.net, args.steps, random.Random(0))
+		with profiler.section("delete and restore"):
+			for node in list(industry.graph.nodes):
+				node.delete()
+				node.restore()
+
+	for line in profiler.report(args.limit):
+		print(line)
+	if args.output:
+		with atomicOpen(args.output) as f:
+			profiler.writeFolded(f)
+	return 0
+
+
+def sizeList(text):
+	return [int(size) for size in text.split(",")]
+
+
+def bench(name, func, repeat):
+	best = None
+	for i in range(repeat):
+		start = time.perf_counter()
+		result = func()
+		duration = time.perf_counter() - start
+		if best is None or duration < best:
+			best = duration
+	print("%-16s %10.2f ms" %(name, best * 1000))
+	return result
+
+
+def benchCommand(args):
+	import os
+	import tempfile
+
+	repeat = args.repeat
+	with tempfile.TemporaryDirectory() as directory:
+		industry = bench("load", lambda: readIndustry(args.input), repeat)
+		bench("save", lambda: saveIndustry(industry, os.path.join(directory, "bench.flow")), repeat)
+		bench("save binary", lambda: saveIndustry(industry, os.path.join(directory, "bench.flowb")), repeat)
+		bench("load binary", lambda: loadIndustry(os.path.join(directory, "bench.flowb")), repeat)
+		bench("load compiled", lambda: readCompiled(os.path.join(directory, "bench.flowb")), repeat)
+		bench("export", lambda: writeIndustry(industry, os.path.join(directory, "bench.pnml")), repeat)
+
+		net = compileIndustry(industry)
+		marking = net.marking[:]
+		def simulate():
+			net.marking = marking[:]
+			return net.run(args.steps, random.Random(0))
+		bench("simulate", simulate, repeat)
+	return 0
+
+
+def createParser():
+	parser = argparse.ArgumentParser(
+		prog="in-toolset",
+		description="Editor and simulator for industry workflow nets. Run without arguments to start the graphical editor."
+	)
+	commands = parser.add_subparsers(dest="command", metavar="command")
+	commands.required = True
+
+	command = commands.add_parser("simulate", help="fire random transitions of a net")
+	command.add_argument("input", help="project or PNML file")
+	command.add_argument("-n", "--steps", type=int, default=1000, help="maximum number of transitions to fire (default: 1000)")
+	command.add_argument("-s", "--seed", type=int, help="seed for the random number generator")
+	command.add_argument("-o", "--output", help="save the net with its final marking to this file")
+	command.add_argument("-t", "--statistics", type=int, metavar="N", help="list the N transitions that fired most often and the N places with the most tokens on average")
+	command.set_defaults(func=simulateCommand)
+
+	command = commands.add_parser("timed", help="simulate a net with the delays of its transitions and report throughput, latency and utilisation")
+	command.add_argument("input", help="project or PNML file")
+	command.add_argument("-n", "--events", type=int, default=100000, help="maximum number of firings (default: 100000)")
+	command.add_argument("-c", "--cases", type=int, default=0, help="maximum number of cases, each starting from the initial marking (default: no limit)")
+	command.add_argument("-u", "--until", type=float, default=0, help="simulated time at which to stop (default: no limit)")
+	command.add_argument("-d", "--default-delay", default=DEFAULT_DELAY, help="delay of transitions without one, e.g. 'exp 2' (default: %s)" %DEFAULT_DELAY)
+	command.add_argument("-s", "--seed", type=int, default=0, help="seed for the random number generator (default: 0)")
+	command.add_argument("-t", "--top", type=int, default=10, help="number of enterprises and channels to list (default: 10)")
+	command.add_argument("-o", "--output", help="write all results to this CSV file")
+	command.set_defaults(func=timedCommand)
+
+	command = commands.add_parser("analyze", help="print statistics and explore the reachable markings of a net")
+	command.add_argument("input", help="project or PNML file")
+	command.add_argument("-l", "--limit", type=int, default=100000, help="maximum number of markings to explore, 0 to skip exploration (default: 100000)")
+	command.set_defaults(func=analyzeCommand)
+
+	command = commands.add_parser("export", help="export a project to PNML")
+	command.add_argument("input", help="project file")
+	command.add_argument("output", help="PNML file")
+	command.set_defaults(func=exportCommand)
+
+	command = commands.add_parser("convert", help="convert between .flow, .flowb and .pnml files")
+	command.add_argument("input", help="project or PNML file")
+	command.add_argument("output", help="project or PNML file, the format is chosen by extension")
+	command.set_defaults(func=convertCommand)
+
+	command = commands.add_parser("layout", help="arrange the nodes of the enterprises and the industry automatically")
+	command.add_argument("input", help="project or PNML file")
+	command.add_argument("-o", "--output", help="save the result to this file instead of overwriting the input")
+	command.add_argument("--skip-enterprises", action="store_true", help="keep the layout of the workflow nets of the enterprises")
+	command.add_argument("--skip-industry", action="store_true", help="keep the positions of the enterprises in the industry")
+	command.set_defaults(func=layoutCommand)
+
+	command = commands.add_parser("wire", help="connect output and input transitions with the same message type")
+	command.add_argument("input", help="project or PNML file")
+	command.add_argument("-o", "--output", help="save the result to this file instead of overwriting the input")
+	command.add_argument("-a", "--ambiguous", action="store_true", help="also connect message types with several outputs or inputs, in the order of the transitions")
+	command.set_defaults(func=wireCommand)
+
+	command = commands.add_parser("generate", help="generate a synthetic industry for testing and benchmarks")
+	command.add_argument("output", help="project or PNML file")
+	command.add_argument("-e", "--enterprises", type=int, default=10, help="number of enterprises (default: 10)")
+	command.add_argument("-s", "--steps", type=int, default=10, help="number of steps of every workflow net (default: 10)")
+	command.add_argument("--shape", choices=SHAPES, default="mixed", help="shape of the steps (default: mixed)")
+	command.add_argument("-b", "--branches", type=int, default=2, help="number of branches of choices and parallel steps (default: 2)")
+	command.add_argument("-f", "--fanout", type=int, default=2, help="number of message types sent by every enterprise (default: 2)")
+	command.add_argument("-d", "--density", type=float, default=.8, help="share of the message types that are received by another enterprise (default: 0.8)")
+	command.add_argument("--seed", type=int, default=0, help="seed for the random number generator (default: 0)")
+	command.add_argument("--no-layout", action="store_true", help="skip laying out the workflow nets")
+	command.set_defaults(func=generateCommand)
+
+	command = commands.add_parser("benchmark", help="time the toolset on generated industries of increasing size")
+	command.add_argument("-s", "--sizes", type=sizeList, default=[10, 100, 1000], help="comma-separated numbers of enterprises (default: 10,100,1000)")
+	command.add_argument("-r", "--repeat", type=int, default=3, help="number of repetitions, the best time is reported (default: 3)")
+	command.add_argument("-n", "--steps", type=int, default=10000, help="number of transitions to fire when simulating (default: 10000)")
+	command.add_argument("-l", "--limit", type=int, default=1000, help="maximum number of markings to explore (default: 1000)")
+	command.add_argument("--shape", choices=SHAPES, default="mixed", help="shape of the steps of the workflow nets (default: mixed)")
+	command.add_argument("-f", "--fanout", type=int, default=2, help="number of message types sent by every enterprise (default: 2)")
+	command.add_argument("-d", "--density", type=float, default=.8, help="share of the message types that are received by another enterprise (default: 0.8)")
+	command.add_argument("--seed", type=int, default=0, help="seed for the random number generator (default: 0)")
+	command.add_argument("--label", default="", help="name of this run in the results, e.g. the version")
+	command.add_argument("-o", "--output", help="write the results to this JSON file")
+	command.add_argument("-c", "--compare", help="compare the results with those in this JSON file")
+	command.set_defaults(func=benchmarkCommand)
+
+	command = commands.add_parser("memory", help="report the memory used by the model of a net and check scene switches for leaks")
+	command.add_argument("input", nargs="?", help="project or PNML file, a generated industry is used if it is not given")
+	command.add_argument("-e", "--enterprises", type=int, default=100, help="number of enterprises of the generated industry (default: 100)")
+	command.add_argument("--seed", type=int, default=0, help="seed for generating the industry (default: 0)")
+	command.add_argument("-n", "--count", type=int, default=1000, help="number of objects of each type to measure (default: 1000)")
+	command.add_argument("-c", "--cycles", type=int, default=3, help="number of times to visit every scene, 0 to skip (default: 3)")
+	command.add_argument("-t", "--top", type=int, default=5, help="number of largest enterprises to list (default: 5)")
+	command.set_defaults(func=memoryCommand)
+
+	command = commands.add_parser("profile", help="record the signals emitted while loading and editing a net")
+	command.add_argument("input", help="project or PNML file")
+	command.add_argument("-n", "--steps", type=int, default=100, help="number of transitions to fire in the token game (default: 100)")
+	command.add_argument("-l", "--limit", type=int, default=20, help="number of signals to list, the slowest first (default: 20)")
+	command.add_argument("-o", "--output", help="write the stacks of signals and callbacks to this file, in the collapsed format of flame graphs")
+	command.set_defaults(func=profileCommand)
+
+	command = commands.add_parser("bench", help="time loading, saving, exporting and simulating a net")
+	command.add_argument("input", help="project or PNML file")
+	command.add_argument("-r", "--repeat", type=int, default=3, help="number of repetitions, the best time is reported (default: 3)")
+	command.add_argument("-n", "--steps", type=int, default=10000, help="number of transitions to fire when simulating (default: 10000)")
+	command.set_defaults(func=benchCommand)
+
+	return parser
+
+
+def run(argv):
+	"""Run the command given by `argv` and return its exit status"""
+	args = createParser().parse_args(argv)
+	try:
+		return args.func(args)
+	except (OSError, ValueError, KeyError) as e:
+		print("in-toolset %s: error: %s" %(args.command, e), file=sys.stderr)
+		return 1
@@ -0,0 +1,9 @@
+"""The names of the commands of the :py:mod:`~in_toolset.cli`, kept apart from it so that starting the editor
+does not import the modules that only the commands need"""
+
+COMMANDS = ("simulate", "timed", "analyze", "export", "convert", "layout", "wire", "generate", "benchmark", "memory", "profile", "bench") #: The commands of :py:func:`~in_toolset.cli.run`
+
+
+def isCommand(argv):
+	"""Return whether the command-line arguments `argv` (without the program name) should be handled by :py:func:`~in_toolset.cli.run` instead of the editor"""
+	return len(argv) > 0 and (argv[0] in COMMANDS or argv[0] in ("-h", "--help"))
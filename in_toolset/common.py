@@ -1,6 +1,12 @@
 """This module allows for signalling with callbacks and interconnectable signals.
 To do this, the :py:class:`~in_toolset.common.Signal` and :py:class:`~in_toolset.common.SignalListener` classes are used.
-Furthermore, it provides the class :py:class:`~in_toolset.common.Property` which allows the creation of object properties with associated signals to signify changes."""
+Furthermore, it provides the class :py:class:`~in_toolset.common.Property` which allows the creation of object properties with associated signals to signify changes.
+:py:class:`~in_toolset.common.SignalProfiler` records which signals are emitted while it is active, and how long their callbacks take."""
+
+import collections
+import contextlib
+import time
+import gc
 
 class Signal:
 	"""A Signal basically consists of a list of callbacks and associated params that will be called when :py:meth:`~in_toolset.common.Signal.emit` is called."""
@@ -28,17 +34,35 @@ class SignalListener:
 
 	def __init__(self):
 		self.listeners = []
+		self.suspended = False
 		
 	def connect(self, signal, callback):
 		"""Connect `callback` to `signal` and store it in `this`"""
 		self.listeners.append((signal, callback))
-		signal.connect(callback)
+		if not self.suspended:
+			signal.connect(callback)
 		
 	def disconnect(self):
 		"""Disconnect all callbacks stored in `this`"""
-		for signal, callback in self.listeners:
-			signal.disconnect(callback)
+		if not self.suspended:
+			for signal, callback in self.listeners:
+				signal.disconnect(callback)
 		self.listeners = []
+		self.suspended = False
+		
+	def suspend(self):
+		"""Disconnect all callbacks stored in `this`, but keep them so that :py:meth:`resume` can connect them again"""
+		if not self.suspended:
+			for signal, callback in self.listeners:
+				signal.disconnect(callback)
+			self.suspended = True
+			
+	def resume(self):
+		"""Connect the callbacks again after :py:meth:`suspend`"""
+		if self.suspended:
+			for signal, callback in self.listeners:
+				signal.connect(callback)
+			self.suspended = False
 
 			
 class Property:
@@ -58,7 +82,216 @@ class Property:
 			self.write(instance, value)
 			
 	def __get__(self, instance, owner):
+		if instance is None:
+			return self
 		return self.read(instance)
 		
+	def assign(self, instance, value):
+		"""Set the value without emitting the signal and return whether it changed.
+		This allows changing several properties that share a signal with only one emission."""
+		if value != self.read(instance):
+			instance.__dict__[self.name] = value
+			return True
+		return False
+		
 	def __set_name__(self, owner, name):
 		self.name = name
+
+
+@contextlib.contextmanager
+def gcPaused():
+	"""Disable the cyclic garbage collector for the duration of a `with` block.
+	Objects connected through signals always form reference cycles, so building many of them at once triggers frequent, useless collections."""
+	enabled = gc.isenabled()
+	gc.disable()
+	try:
+		yield
+	finally:
+		if enabled:
+			gc.enable()
+
+
+class SignalStats:
+	"""What a :py:class:`SignalProfiler` recorded for one signal, or for all signals with the same name"""
+	__slots__ = ("emits", "callbacks", "fanout", "depth", "time", "cascade")
+	
+	def __init__(self):
+		self.emits = 0 #: The number of emissions
+		self.callbacks = 0 #: The number of callbacks called by all emissions, not counting those of connected signals
+		self.fanout = 0 #: The largest number of callbacks of one emission
+		self.depth = 0 #: The deepest nesting of this signal inside the callbacks of other signals, 0 if it was only emitted directly
+		self.time = 0 #: The seconds spent in the emissions, including the callbacks and the signals they emit
+		self.cascade = 0 #: The largest number of callbacks of all signals that one direct emission caused
+		
+	def merge(self, other):
+		self.emits += other.emits
+		self.callbacks += other.callbacks
+		self.fanout = max(self.fanout, other.fanout)
+		self.depth = max(self.depth, other.depth)
+		self.time += other.time
+		self.cascade = max(self.cascade, other.cascade)
+		
+		
+class SignalProfiler:
+	"""Records every :py:meth:`Signal.emit` and every write of a :py:class:`Property` between :py:meth:`start` and :py:meth:`stop`.
+	Profiling replaces the methods of the classes, so signals cost nothing extra while no profiler is active.
+	
+	The signals are named after the attribute that holds them and the type of its owner, e.g. ``UINode.changed``,
+	which is looked up once when profiling stops. The nested emissions and callbacks can be written as
+	collapsed stacks with :py:meth:`writeFolded`, the input format of flame graph tools."""
+	def __init__(self):
+		self.stats = {} #: Maps the id of every emitted signal to its :py:class:`SignalStats`
+		self.signals = {} # Keeps the emitted signals alive, so that their ids are not reused
+		self.names = {} #: Maps the id of every emitted signal to its name, once profiling stopped
+		self.folded = collections.Counter() # Maps stacks of frames to the seconds spent in the last frame itself
+		self.frames = [] # The current stack, with the start time and the time spent in nested frames of every frame
+		self.cascade = 0
+		self.saved = None
+		
+	def start(self):
+		"""Start recording, there can only be one active profiler"""
+		if self.saved:
+			return
+		self.saved = (Signal.emit, Signal.__call__, Property.write)
+		profiler = self
+		def emit(signal, *args):
+			profiler.emit(signal, args)
+		def write(prop, inst, value):
+			profiler.write(prop, inst, value)
+		Signal.emit = Signal.__call__ = emit
+		Property.write = write
+		
+	def stop(self):
+		"""Stop recording and name the recorded signals"""
+		if not self.saved:
+			return
+		Signal.emit, Signal.__call__, Property.write = self.saved
+		self.saved = None
+		self.resolveNames()
+		
+	@contextlib.contextmanager
+	def section(self, name):
+		"""Group the stacks that are recorded during a `with` block under the frame `name`"""
+		self.push(name)
+		try:
+			yield
+		finally:
+			self.pop()
+			
+	def push(self, frame):
+		self.frames.append([frame, time.perf_counter(), 0])
+		
+	def pop(self):
+		frame, start, nested = self.frames.pop()
+		duration = time.perf_counter() - start
+		self.folded[tuple(frame for frame, start, nested in self.frames) + (frame,)] += duration - nested
+		if self.frames:
+			self.frames[-1][2] += duration
+		return duration
+		
+	def emit(self, signal, args):
+		key = id(signal)
+		stats = self.stats.get(key)
+		if stats is None:
+			stats = self.stats[key] = SignalStats()
+			self.signals[key] = signal
+			
+		depth = sum(type(frame) is int for frame, start, nested in self.frames)
+		if depth == 0:
+			self.cascade = 0
+		self.push(key)
+		try:
+			fanout = 0
+			for func, param in signal.callbacks:
+				fanout += 1
+				if type(func) is Signal:
+					func(*args, *param)
+					continue
+				self.push(callbackName(func))
+				try:
+					func(*args, *param)
+				finally:
+					self.pop()
+		finally:
+			stats.time += self.pop()
+			stats.emits += 1
+			stats.callbacks += fanout
+			stats.fanout = max(stats.fanout, fanout)
+			stats.depth = max(stats.depth, depth)
+			self.cascade += fanout
+			if depth == 0:
+				stats.cascade = max(stats.cascade, self.cascade)
+				
+	def write(self, prop, inst, value):
+		self.push("%s.%s =" %(type(inst).__name__, prop.name))
+		try:
+			self.saved[2](prop, inst, value)
+		finally:
+			self.pop()
+			
+	def resolveNames(self):
+		"""Find the owners of the recorded signals among all live objects"""
+		missing = set(self.stats) - set(self.names)
+		for obj in gc.get_objects():
+			if not missing:
+				break
+			if isinstance(obj, type):
+				continue
+			attributes = getattr(obj, "__dict__", None)
+			if type(attributes) is not dict:
+				continue
+			for name, value in attributes.items():
+				if type(value) is Signal and id(value) in missing:
+					self.names[id(value)] = "%s.%s" %(type(obj).__name__, name)
+					missing.discard(id(value))
+		for key in missing:
+			self.names[key] = "Signal"
+			
+	def name(self, frame):
+		if type(frame) is int:
+			return self.names.get(frame, "Signal")
+		return frame
+		
+	def byName(self):
+		"""Return a dictionary that maps the names of the signals to the combined :py:class:`SignalStats` of all signals with that name"""
+		result = collections.defaultdict(SignalStats)
+		for key, stats in self.stats.items():
+			result[self.name(key)].merge(stats)
+		return dict(result)
+		
+	def report(self, limit=20):
+		"""Return the lines of a table of the `limit` signal names on which the most time was spent"""
+		stats = sorted(self.byName().items(), key=lambda item: -item[1].time)
+		lines = ["%-32s %8s %10s %7s %6s %10s %10s" %("signal", "emits", "callbacks", "fanout", "depth", "cascade", "time (ms)")]
+		for name, item in stats[:limit]:
+			lines.append("%-32s %8i %10i %7i %6i %10i %10.2f" %(
+				name, item.emits, item.callbacks, item.fanout, item.depth, item.cascade, item.time * 1000
+			))
+		return lines
+		
+	def writeFolded(self, f):
+		"""Write the recorded stacks to the text file `f` as collapsed stacks, one line per stack with the microseconds spent in its last frame"""
+		stacks = collections.Counter()
+		for stack, duration in self.folded.items():
+			stacks[";".join(self.name(frame).replace(";", ":") for frame in stack)] += duration
+		for stack, duration in sorted(stacks.items()):
+			f.write("%s %i\n" %(stack, round(duration * 1e6)))
+			
+			
+def callbackName(func):
+	"""Return the qualified name of the function `func` for a :py:class:`SignalProfiler`"""
+	owner = getattr(func, "__self__", None)
+	if owner is not None and not isinstance(owner, type):
+		return "%s.%s" %(type(owner).__name__, getattr(func, "__name__", "?"))
+	return getattr(func, "__qualname__", None) or type(func).__name__
+	
+	
+@contextlib.contextmanager
+def profileSignals():
+	"""Record the emitted signals with a :py:class:`SignalProfiler` for the duration of a `with` block, and yield it"""
+	profiler = SignalProfiler()
+	profiler.start()
+	try:
+		yield profiler
+	finally:
+		profiler.stop()
@@ -7,7 +7,14 @@ class Config:
 	"""Manages basic configuration of the graphical interface as a list of key-value pairs"""
 	types = {
 		"ui.max_label_size": int,
-		"ui.keyboard_scroll_speed": float
+		"ui.keyboard_scroll_speed": float,
+		"ui.max_animations": int,
+		"ui.virtual_scene_threshold": int,
+		"ui.scene_cache_size": int,
+		"ui.scene_cache_items": int,
+		"autosave.interval": float,
+		"debug.startup_timing": int,
+		"debug.signal_profile": str
 	}
 	
 	def __init__(self, filename):
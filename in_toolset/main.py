@@ -1,15 +1,23 @@
 
+import time
 import sys
 
 def main():
-	"""Start the graphical editor with a new, blank, industry net."""
+	"""Start the graphical editor with a new, blank, industry net,
+	or run a command of the :py:mod:`~in_toolset.cli` if one is given on the command line."""
 	version = sys.version_info
 	if version < (3, 6):
 		version = "%i.%i.%i" %(version.major, version.minor, version.micro)
 		msg = "Your Python version is old (%s). Please upgrade to 3.6 or higher." %version
 		raise RuntimeError(msg)
 
+	from .commands import isCommand
+	if isCommand(sys.argv[1:]):
+		from .cli import run
+		sys.exit(run(sys.argv[1:]))
+
+	start = time.perf_counter()
 	from .ui.app import Application
 
 	app = Application()
-	app.start()
+	app.start(start)
@@ -0,0 +1,208 @@
+"""Measuring how much memory the model layer uses, with :py:mod:`tracemalloc`.
+
+:py:func:`unitCosts` reports the bytes of one object of each model type, :py:func:`projectFootprint` the bytes of a
+loaded project, overall and per enterprise, and :py:func:`signalCensus` counts the live signals, their callbacks and the
+deleted objects that object lists keep for undo. :py:func:`checkGrowth` repeats an action, such as switching between the
+scenes of a project, and reports whether those counts keep growing, which points to connections that are never undone.
+
+Like :py:mod:`~in_toolset.benchmark`, this module only depends on the model layer. :py:func:`visitScenes` attaches the
+same model indices to the industry and the enterprises as :py:meth:`~in_toolset.ui.app.Application.switchToScene` does,
+and :py:func:`checkGrowth` takes any callable, so the editor itself can be checked with a cycle that calls
+:py:meth:`~in_toolset.ui.app.Application.switchToScene`."""
+
+from .common import Signal
+from .model.base import Place, ObjectList
+from .model.ui import UIPetriNet, UINode, UITransition, UIInternalArrow, UILooseArrow, UIChannelArrow
+from .model.index import LabelIndex, MessageIndex, ArcIndex
+from .model.spatial import GraphIndex
+import tracemalloc
+import gc
+
+
+COUNTS = ("signals", "callbacks", "lists", "entries", "tombstones") #: The counts of :py:func:`signalCensus`
+
+
+def tracedBytes():
+	"""Return the number of bytes currently allocated according to :py:mod:`tracemalloc`, after a full collection"""
+	gc.collect()
+	return tracemalloc.get_traced_memory()[0]
+
+
+def measureBytes(func):
+	"""Call `func` and return the number of bytes that are still allocated afterwards, and its result.
+	Starts tracing if it was not running."""
+	tracing = tracemalloc.is_tracing()
+	if not tracing:
+		tracemalloc.start()
+	try:
+		before = tracedBytes()
+		result = func()
+		return tracedBytes() - before, result
+	finally:
+		if not tracing:
+			tracemalloc.stop()
+
+
+def newLooseArrow(obj=None):
+	return UILooseArrow(UINode(obj or Place()), UITransition())
+
+
+SAMPLES = (
+	("Place", lambda: None, lambda arg: Place()),
+	("UITransition", lambda: None, lambda arg: UITransition()),
+	("UINode", Place, UINode),
+	("UIInternalArrow", lambda: (UINode(Place()), UINode(UITransition())), lambda arg: UIInternalArrow(*arg)),
+	("UILooseArrow", lambda: (UINode(UIPetriNet()), UITransition()), lambda arg: UILooseArrow(*arg)),
+	("UIChannelArrow", lambda: (newLooseArrow(), newLooseArrow(), Place()), lambda arg: UIChannelArrow(*arg)),
+	("enterprise", lambda: None, lambda arg: UINode(UIPetriNet())),
+) #: The name of every measured type, a function that creates what its constructor needs, and a function that constructs it
+
+
+def unitCosts(count=1000):
+	"""Return a dictionary that maps the model types in :py:data:`SAMPLES` to the average number of bytes of one object,
+	measured over `count` objects. Objects that are passed to the constructor are not included,
+	so the cost of a :py:class:`~in_toolset.model.ui.UINode` is that of the node and its label, and an ``enterprise``
+	is the node and the empty :py:class:`~in_toolset.model.ui.UIPetriNet` of an enterprise."""
+	costs = {}
+	for name, prepare, build in SAMPLES:
+		args = [prepare() for i in range(count)]
+		size, objects = measureBytes(lambda: [build(arg) for arg in args])
+		costs[name] = size / count
+		del args, objects
+	return costs
+
+
+def enterpriseCounts(node):
+	"""Return a dictionary that maps the names in :py:data:`SAMPLES` to the number of objects of that type in the enterprise `node`,
+	including the deleted objects that are kept for undo"""
+	net = node.obj
+	return {
+		"Place": len(net.net.places.objects),
+		"UITransition": len(net.net.transitions.objects),
+		"UINode": len(net.graph.nodes.objects),
+		"UIInternalArrow": len(net.graph.arrows.objects),
+		"UILooseArrow": len(net.graph.looseArrows.objects),
+		"enterprise": 1,
+	}
+
+
+class Footprint:
+	"""The result of :py:func:`projectFootprint`"""
+	def __init__(self):
+		self.total = 0 #: The bytes that remain allocated after loading the project
+		self.peak = 0 #: The most bytes that were allocated at once while loading it
+		self.enterprises = [] #: Pairs of the label of every enterprise and its estimated number of bytes, largest first
+		self.channels = 0 #: The estimated number of bytes of the channels between the enterprises
+
+	def perEnterprise(self):
+		"""Return the measured total divided by the number of enterprises"""
+		return self.total / max(1, len(self.enterprises))
+
+	def summary(self, top=5):
+		"""Return a description of the footprint, with the `top` largest enterprises"""
+		lines = [
+			"project: %s allocated, %s peak while loading" %(formatBytes(self.total), formatBytes(self.peak)),
+			"per enterprise: %s measured, %s estimated" %(
+				formatBytes(self.perEnterprise()), formatBytes(sum(size for label, size in self.enterprises) / max(1, len(self.enterprises)))
+			),
+			"channels: %s estimated" %formatBytes(self.channels),
+		]
+		for label, size in self.enterprises[:top]:
+			lines.append("  %-20s %12s" %(label, formatBytes(size)))
+		return lines
+
+
+def projectFootprint(load, costs=None):
+	"""Call `load`, which returns an industry, and return its :py:class:`Footprint` and the industry.
+	The bytes of every enterprise are estimated from the number of its objects and the `costs` of :py:func:`unitCosts`."""
+	if costs is None:
+		costs = unitCosts()
+
+	tracing = tracemalloc.is_tracing()
+	if not tracing:
+		tracemalloc.start()
+	try:
+		if hasattr(tracemalloc, "reset_peak"): # Python 3.9 and newer
+			tracemalloc.reset_peak()
+		before = tracedBytes()
+		industry = load()
+		footprint = Footprint()
+		footprint.total = tracedBytes() - before
+		footprint.peak = max(footprint.total, tracemalloc.get_traced_memory()[1] - before)
+	finally:
+		if not tracing:
+			tracemalloc.stop()
+
+	for node in industry.graph.nodes.objects:
+		counts = enterpriseCounts(node)
+		footprint.enterprises.append((node.label.text, sum(costs[name] * count for name, count in counts.items())))
+	footprint.enterprises.sort(key=lambda item: -item[1])
+	footprint.channels = costs["UIChannelArrow"] * len(industry.graph.arrows.objects)
+	return footprint, industry
+
+
+def signalCensus():
+	"""Count every live :py:class:`~in_toolset.common.Signal` and :py:class:`~in_toolset.model.base.ObjectList`, and return a
+	dictionary with the number of signals, their connected callbacks, the object lists, their entries, and the entries
+	that are deleted but kept for undo"""
+	census = dict.fromkeys(COUNTS, 0)
+	gc.collect()
+	for obj in gc.get_objects():
+		if isinstance(obj, Signal):
+			census["signals"] += 1
+			census["callbacks"] += len(obj.callbacks)
+		elif isinstance(obj, ObjectList):
+			census["lists"] += 1
+			census["entries"] += len(obj.objects)
+			census["tombstones"] += sum(not entry.active for entry in obj.objects)
+	return census
+
+
+def visitScenes(industry):
+	"""Attach and detach the indices that the scenes of the editor keep for the industry and for every enterprise,
+	as switching to each of them and away again does"""
+	for graph in [industry.graph] + [node.obj.graph for node in industry.graph.nodes]:
+		indices = [GraphIndex(graph)]
+		if graph is industry.graph:
+			indices += [LabelIndex(graph), MessageIndex(graph)]
+		else:
+			indices.append(ArcIndex(graph))
+		for index in indices:
+			index.disconnect()
+
+
+def checkGrowth(cycle, cycles=5):
+	"""Call `cycle` `cycles` times and return a list with the :py:func:`signalCensus` after each call,
+	with the number of allocated bytes added as ``bytes``. The first call is a warm-up, caches may fill during it."""
+	tracing = tracemalloc.is_tracing()
+	if not tracing:
+		tracemalloc.start()
+	try:
+		samples = []
+		for i in range(cycles):
+			cycle()
+			sample = signalCensus()
+			sample["bytes"] = tracedBytes()
+			samples.append(sample)
+		return samples
+	finally:
+		if not tracing:
+			tracemalloc.stop()
+
+
+def growth(samples):
+	"""Return the counts of :py:data:`COUNTS` that increased between the first and the last sample of :py:func:`checkGrowth`,
+	mapped to the increase per cycle. An empty dictionary means that the cycle does not leak connections or objects."""
+	if len(samples) < 2:
+		return {}
+	first, last = samples[0], samples[-1]
+	cycles = len(samples) - 1
+	return {name: (last[name] - first[name]) / cycles for name in COUNTS if last[name] > first[name]}
+
+
+def formatBytes(size):
+	for unit in ("B", "KiB", "MiB"):
+		if abs(size) < 1024:
+			return "%.1f %s" %(size, unit)
+		size /= 1024
+	return "%.1f GiB" %size
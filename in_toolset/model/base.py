@@ -181,17 +181,36 @@ class PetriNet(Object):
 		self.transitions.added.connect(self.registerTransition)
 		self.transitions.removed.connect(self.unregisterTransition)
 
+		# Keeping count of the enabled transitions makes checking for deadlock O(1)
+		self.enabledCount = 0
+
 	def registerTransition(self, trans):
 		trans.triggered.connect(self.triggered)
+		trans.enabledChanged.connect(self.updateEnabledCount, trans)
+		if trans.enabled:
+			self.enabledCount += 1
+		# transitions.changed is emitted before added, so it saw the old count
+		self.checkDeadlock()
 
 	def unregisterTransition(self, trans):
 		trans.triggered.disconnect(self.triggered)
+		trans.enabledChanged.disconnect(self.updateEnabledCount, trans)
+		if trans.enabled:
+			self.enabledCount -= 1
+		self.checkDeadlock()
+
+	def updateEnabledCount(self, trans):
+		if trans.enabled:
+			self.enabledCount += 1
+		else:
+			self.enabledCount -= 1
+		self.checkDeadlock()
 
 	def enabledTransitions(self):
 		return [t for t in self.transitions if t.enabled]
 
 	def checkDeadlock(self):
-		self.deadlock = len(self.enabledTransitions()) == 0
+		self.deadlock = self.enabledCount == 0
 
 	def triggerRandom(self):
 		"""Trigger a random transition, if possible"""
@@ -0,0 +1,479 @@
+"""A compact binary project file format, storing the same information as the json-based ``.flow`` format.
+
+A binary project file starts with a header and a section table, followed by the sections themselves.
+Every section is a single fixed-width array (of the type given by its typecode, see :py:mod:`array`),
+which allows the file to be memory-mapped and the arrays to be read without any parsing.
+
+Graphs are stored in the same order as in ``.flow`` files: first the graph of every enterprise, then the industry graph.
+All per-graph arrays (nodes, loose arrows and arrows) are concatenated, with a separate offsets section recording where each graph starts."""
+
+from .base import *
+from .ui import *
+from .compiled import CompiledNet
+from array import array
+import mmap
+import struct
+import sys
+
+
+MAGIC = b"INTB"
+VERSION = 1
+
+HEADER = struct.Struct("<4sHBB") # magic, version, byte order, section count
+SECTION = struct.Struct("<4s2xcxQQ") # tag, typecode, offset, length in bytes
+
+NODE_PLACE = 0
+NODE_TRANSITION = 1
+NODE_ENTERPRISE = 2
+
+NO_CHANNEL = -1
+
+
+def isBinaryProject(filename):
+	"""Return whether `filename` is a binary project file"""
+	with open(filename, "rb") as f:
+		return f.read(len(MAGIC)) == MAGIC
+
+
+class StringTable:
+	"""Deduplicates strings so they can be referred to by index"""
+	def __init__(self):
+		self.strings = []
+		self.indices = {}
+
+	def add(self, string):
+		index = self.indices.get(string)
+		if index is None:
+			index = len(self.strings)
+			self.indices[string] = index
+			self.strings.append(string)
+		return index
+
+	def encode(self):
+		offsets = array("Q", [0])
+		blob = bytearray()
+		for string in self.strings:
+			blob += string.encode("utf-8")
+			offsets.append(len(blob))
+		return offsets, bytes(blob)
+
+
+class BinaryProjectWriter:
+	"""Writes a project to a binary project file."""
+	def save(self, industry, file):
+		"""Write `industry` to the binary file object `file`"""
+		self.sections = {}
+		self.strings = StringTable()
+
+		self.savePlaces(industry)
+		self.saveTransitions(industry)
+		self.saveEnterprises(industry)
+		self.saveGraphs(industry)
+		self.saveArcs(industry)
+
+		offsets, blob = self.strings.encode()
+		self.sections[b"SOFS"] = offsets
+		self.sections[b"STRS"] = array("B", blob)
+
+		self.writeSections(file)
+
+	def savePlaces(self, industry):
+		tokens = array("q")
+		for place in industry.net.places:
+			place.id = len(tokens)
+			tokens.append(place.tokens)
+		self.sections[b"PLAC"] = tokens
+
+	def saveTransitions(self, industry):
+		types = array("B")
+		messages = array("I")
+		delays = array("I")
+		for trans in industry.net.transitions:
+			trans.id = len(types)
+			types.append(trans.type)
+			messages.append(self.strings.add(trans.message))
+			delays.append(self.strings.add(trans.delay))
+		self.sections[b"TTYP"] = types
+		self.sections[b"TMSG"] = messages
+		self.sections[b"TDLY"] = delays
+
+	def saveEnterprises(self, industry):
+		placeOffsets = array("Q", [0])
+		places = array("I")
+		transOffsets = array("Q", [0])
+		transitions = array("I")
+		for index, node in enumerate(industry.graph.nodes):
+			node.obj.id = index
+			places.extend(place.id for place in node.obj.net.places)
+			placeOffsets.append(len(places))
+			transitions.extend(trans.id for trans in node.obj.net.transitions)
+			transOffsets.append(len(transitions))
+		self.sections[b"EPLO"] = placeOffsets
+		self.sections[b"EPLC"] = places
+		self.sections[b"ETRO"] = transOffsets
+		self.sections[b"ETRN"] = transitions
+
+	def saveGraphs(self, industry):
+		self.nodeOffsets = array("Q", [0])
+		self.nodeTypes = array("B")
+		self.nodeObjects = array("I")
+		self.nodePositions = array("d")
+		self.nodeLabels = array("I")
+		self.nodeLabelGeometry = array("d")
+
+		self.looseOffsets = array("Q", [0])
+		self.looseNodes = array("I")
+		self.looseTransitions = array("I")
+		self.looseAngles = array("d")
+		self.looseLabels = array("I")
+		self.looseLabelGeometry = array("d")
+
+		self.arrowOffsets = array("Q", [0])
+		self.arrowSources = array("I")
+		self.arrowTargets = array("I")
+		self.arrowCurves = array("d")
+		self.arrowChannels = array("i")
+
+		for node in industry.graph.nodes:
+			self.saveGraph(node.obj.graph)
+		self.saveGraph(industry.graph)
+
+		self.sections.update({
+			b"NOFS": self.nodeOffsets, b"NTYP": self.nodeTypes, b"NOBJ": self.nodeObjects,
+			b"NPOS": self.nodePositions, b"NLBL": self.nodeLabels, b"NLBG": self.nodeLabelGeometry,
+			b"LOFS": self.looseOffsets, b"LNOD": self.looseNodes, b"LTRN": self.looseTransitions,
+			b"LANG": self.looseAngles, b"LLBL": self.looseLabels, b"LLBG": self.looseLabelGeometry,
+			b"AOFS": self.arrowOffsets, b"ASRC": self.arrowSources, b"ATGT": self.arrowTargets,
+			b"ACRV": self.arrowCurves, b"ACHN": self.arrowChannels
+		})
+
+	def saveGraph(self, graph):
+		count = 0
+		for node in graph.nodes:
+			node.id = count
+			count += 1
+			self.nodeTypes.append(self.getNodeType(node.obj))
+			self.nodeObjects.append(node.obj.id)
+			self.nodePositions.extend((node.x, node.y))
+			self.saveLabel(node.label, self.nodeLabels, self.nodeLabelGeometry)
+		self.nodeOffsets.append(len(self.nodeTypes))
+
+		count = 0
+		for arrow in graph.looseArrows.objects:
+			if arrow.transition.active:
+				arrow.id = count
+				count += 1
+				self.looseNodes.append(arrow.node.id)
+				self.looseTransitions.append(arrow.transition.id)
+				self.looseAngles.append(arrow.angle)
+				self.saveLabel(arrow.label, self.looseLabels, self.looseLabelGeometry)
+		self.looseOffsets.append(len(self.looseNodes))
+
+		for arrow in graph.arrows:
+			self.arrowSources.append(arrow.source.id)
+			self.arrowTargets.append(arrow.target.id)
+			self.arrowCurves.append(arrow.curve)
+			if isinstance(arrow, UIChannelArrow):
+				self.arrowChannels.append(arrow.channel.id)
+			else:
+				self.arrowChannels.append(NO_CHANNEL)
+		self.arrowOffsets.append(len(self.arrowSources))
+
+	def saveLabel(self, label, texts, geometry):
+		texts.append(self.strings.add(label.text))
+		geometry.extend((label.angle, label.distance))
+
+	def saveArcs(self, industry):
+		# The arcs are redundant with the graphs, but allow loading a compiled net without building the model
+		inputs = array("I")
+		outputs = array("I")
+		for trans in industry.net.transitions:
+			for place in trans.preset:
+				inputs.extend((place.id, trans.id))
+			for place in trans.postset:
+				outputs.extend((trans.id, place.id))
+		self.sections[b"ARCI"] = inputs
+		self.sections[b"ARCO"] = outputs
+
+	def getNodeType(self, obj):
+		if isinstance(obj, Place): return NODE_PLACE
+		if isinstance(obj, Transition): return NODE_TRANSITION
+		if isinstance(obj, UIPetriNet): return NODE_ENTERPRISE
+		raise ValueError("This should never happen")
+
+	def writeSections(self, file):
+		order = sys.byteorder == "little"
+		tableSize = HEADER.size + SECTION.size * len(self.sections)
+
+		table = []
+		offset = tableSize
+		for tag, data in self.sections.items():
+			offset = (offset + 7) & ~7
+			length = len(data) * data.itemsize
+			table.append((tag, data, offset, length))
+			offset += length
+
+		file.write(HEADER.pack(MAGIC, VERSION, order, len(table)))
+		for tag, data, offset, length in table:
+			file.write(SECTION.pack(tag, data.typecode.encode("ascii"), offset, length))
+
+		position = tableSize
+		for tag, data, offset, length in table:
+			file.write(b"\0" * (offset - position))
+			file.write(data.tobytes())
+			position = offset + length
+
+
+class BinaryProjectReader:
+	"""Loads a binary project file, either into model objects or directly into a :py:class:`~in_toolset.model.compiled.CompiledNet`."""
+	def open(self, filename):
+		with open(filename, "rb") as f:
+			try:
+				self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			except ValueError: # Empty files can not be mapped
+				self.buffer = b""
+		self.view = memoryview(self.buffer)
+		self.sections = {}
+		self.parseHeader()
+
+	def close(self):
+		for data in self.sections.values():
+			if isinstance(data, memoryview):
+				data.release()
+		self.sections = None
+		self.view.release()
+		self.view = None
+		if isinstance(self.buffer, mmap.mmap):
+			self.buffer.close()
+		self.buffer = None
+
+	def parseHeader(self):
+		if len(self.buffer) < HEADER.size:
+			raise ValueError("Not a binary project file")
+		magic, version, order, count = HEADER.unpack_from(self.buffer, 0)
+		if magic != MAGIC:
+			raise ValueError("Not a binary project file")
+		if version > VERSION:
+			raise ValueError("Unsupported binary project version: %i" %version)
+
+		self.swap = bool(order) != (sys.byteorder == "little")
+		self.table = {}
+		for index in range(count):
+			tag, typecode, offset, length = SECTION.unpack_from(self.buffer, HEADER.size + index * SECTION.size)
+			if offset + length > len(self.buffer):
+				raise ValueError("Truncated section: %s" %tag.decode("ascii", "replace"))
+			self.table[tag] = (typecode.decode("ascii"), offset, length)
+
+	def section(self, tag):
+		"""Return the array stored in section `tag`, as a memoryview into the mapped file if possible"""
+		if tag not in self.sections:
+			if tag not in self.table:
+				raise ValueError("Missing section: %s" %tag.decode("ascii"))
+			typecode, offset, length = self.table[tag]
+			data = self.view[offset:offset + length]
+			if self.swap:
+				values = array(typecode)
+				values.frombytes(data)
+				values.byteswap()
+				data.release()
+				data = values
+			else:
+				data = data.cast(typecode)
+			self.sections[tag] = data
+		return self.sections[tag]
+
+	def string(self, index):
+		offsets = self.section(b"SOFS")
+		with self.section(b"STRS")[offsets[index]:offsets[index + 1]] as data:
+			return str(data, "utf-8")
+
+	def load(self, filename):
+		"""Load the file `filename` and return the corresponding :py:class:`~in_toolset.model.ui.UIPetriNet`"""
+		self.open(filename)
+		try:
+			return self.loadIndustry()
+		finally:
+			self.close()
+
+	def loadCompiled(self, filename):
+		"""Load the net stored in `filename` directly into a :py:class:`~in_toolset.model.compiled.CompiledNet`, without creating any model objects"""
+		self.open(filename)
+		try:
+			return self.loadCompiledNet()
+		finally:
+			self.close()
+
+	def loadNames(self, filename):
+		"""Return the names of the places, the transitions and the enterprises stored in `filename` for reports,
+		like :py:func:`~in_toolset.model.statistics.compiledNames` does for a loaded industry, without creating any model objects"""
+		self.open(filename)
+		try:
+			return self.loadCompiledNames()
+		finally:
+			self.close()
+
+	def loadIndustry(self):
+		self.loadPlaces()
+		self.loadTransitions()
+		self.loadEnterprises()
+
+		industry = UIPetriNet()
+		for place in self.places:
+			industry.net.places.add(place)
+		for trans in self.transitions:
+			industry.net.transitions.add(trans)
+		self.loadGraph(industry.graph, len(self.enterprises), True)
+		return industry
+
+	def loadPlaces(self):
+		self.places = []
+		for tokens in self.section(b"PLAC"):
+			place = Place()
+			place.tokens = tokens
+			self.places.append(place)
+
+	def loadTransitions(self):
+		self.transitions = []
+		for type, message, delay in zip(self.section(b"TTYP"), self.section(b"TMSG"), self.delays()):
+			transition = UITransition()
+			transition.type = type
+			transition.message = self.string(message)
+			transition.delay = delay
+			self.transitions.append(transition)
+
+	def delays(self):
+		"""Return the delay of every transition. Files written before delays existed have no ``TDLY`` section."""
+		if b"TDLY" not in self.table:
+			return [""] * len(self.section(b"TTYP"))
+		return [self.string(delay) for delay in self.section(b"TDLY")]
+
+	def loadEnterprises(self):
+		placeOffsets = self.section(b"EPLO")
+		places = self.section(b"EPLC")
+		transOffsets = self.section(b"ETRO")
+		transitions = self.section(b"ETRN")
+
+		self.enterprises = []
+		for index in range(len(placeOffsets) - 1):
+			enterprise = UIPetriNet()
+			for place in places[placeOffsets[index]:placeOffsets[index + 1]]:
+				enterprise.net.places.add(self.places[place])
+			for trans in transitions[transOffsets[index]:transOffsets[index + 1]]:
+				enterprise.net.transitions.add(self.transitions[trans])
+			self.enterprises.append(enterprise)
+
+		for index, enterprise in enumerate(self.enterprises):
+			self.loadGraph(enterprise.graph, index, False)
+
+	def loadGraph(self, graph, index, industry):
+		offsets = self.section(b"NOFS")
+		types = self.section(b"NTYP")
+		objects = self.section(b"NOBJ")
+		positions = self.section(b"NPOS")
+		labels = self.section(b"NLBL")
+		geometry = self.section(b"NLBG")
+		for i in range(offsets[index], offsets[index + 1]):
+			node = UINode(self.parseObjectRef(types[i], objects[i]))
+			node.move(positions[2 * i], positions[2 * i + 1])
+			self.loadLabel(node.label, labels[i], geometry, i)
+			graph.nodes.add(node)
+
+		offsets = self.section(b"LOFS")
+		nodes = self.section(b"LNOD")
+		transitions = self.section(b"LTRN")
+		angles = self.section(b"LANG")
+		labels = self.section(b"LLBL")
+		geometry = self.section(b"LLBG")
+		for i in range(offsets[index], offsets[index + 1]):
+			arrow = UILooseArrow(graph.nodes[nodes[i]], self.transitions[transitions[i]])
+			arrow.angle = angles[i]
+			self.loadLabel(arrow.label, labels[i], geometry, i)
+			graph.looseArrows.add(arrow)
+
+		offsets = self.section(b"AOFS")
+		sources = self.section(b"ASRC")
+		targets = self.section(b"ATGT")
+		curves = self.section(b"ACRV")
+		channels = self.section(b"ACHN")
+		for i in range(offsets[index], offsets[index + 1]):
+			if industry:
+				source = graph.looseArrows[sources[i]]
+				target = graph.looseArrows[targets[i]]
+				arrow = UIChannelArrow(source, target, self.places[channels[i]])
+			else:
+				arrow = UIInternalArrow(graph.nodes[sources[i]], graph.nodes[targets[i]])
+			arrow.curve = curves[i]
+			graph.arrows.add(arrow)
+
+	def loadLabel(self, label, text, geometry, index):
+		label.text = self.string(text)
+		label.angle = geometry[2 * index]
+		label.distance = geometry[2 * index + 1]
+
+	def parseObjectRef(self, type, id):
+		if type == NODE_PLACE: return self.places[id]
+		if type == NODE_TRANSITION: return self.transitions[id]
+		if type == NODE_ENTERPRISE: return self.enterprises[id]
+		raise ValueError("Invalid object type: %i" %type)
+
+	def loadCompiledNames(self):
+		nodeOffsets = self.section(b"NOFS")
+		types = self.section(b"NTYP")
+		objects = self.section(b"NOBJ")
+		labels = self.section(b"NLBL")
+		messages = self.section(b"TMSG")
+
+		# The graphs of the enterprises are followed by the industry graph
+		count = len(nodeOffsets) - 2
+		labelTexts = [""] * count
+		for i in range(nodeOffsets[count], nodeOffsets[count + 1]):
+			if types[i] == NODE_ENTERPRISE:
+				labelTexts[objects[i]] = self.string(labels[i])
+
+		placeNames = {}
+		transitionNames = {}
+		for enterprise in range(count):
+			for number, i in enumerate(range(nodeOffsets[enterprise], nodeOffsets[enterprise + 1])):
+				text = self.string(labels[i])
+				if not text and types[i] == NODE_TRANSITION:
+					text = self.string(messages[objects[i]])
+				names = placeNames if types[i] == NODE_PLACE else transitionNames
+				names[objects[i]] = "%s/%s" %(labelTexts[enterprise], text or "#%i" %(number + 1))
+
+		looseOffsets = self.section(b"LOFS")
+		looseTransitions = self.section(b"LTRN")
+		arrowOffsets = self.section(b"AOFS")
+		sources = self.section(b"ASRC")
+		channels = self.section(b"ACHN")
+		for i in range(arrowOffsets[count], arrowOffsets[count + 1]):
+			if channels[i] != NO_CHANNEL:
+				transition = looseTransitions[looseOffsets[count] + sources[i]]
+				placeNames[channels[i]] = "channel %s" %self.string(messages[transition])
+
+		enterprises = [text or "enterprise %i" %(i + 1) for i, text in enumerate(labelTexts)]
+		return placeNames, transitionNames, enterprises
+
+	def loadCompiledNet(self):
+		net = CompiledNet()
+		for tokens in self.section(b"PLAC"):
+			net.addPlace(tokens)
+
+		count = len(self.section(b"TTYP"))
+		presets = [[] for i in range(count)]
+		postsets = [[] for i in range(count)]
+		inputs = self.section(b"ARCI")
+		for i in range(0, len(inputs), 2):
+			presets[inputs[i + 1]].append(inputs[i])
+		outputs = self.section(b"ARCO")
+		for i in range(0, len(outputs), 2):
+			postsets[outputs[i]].append(outputs[i + 1])
+		for preset, postset, delay in zip(presets, postsets, self.delays()):
+			net.addTransition(preset, postset, delay=delay)
+
+		for tag, offsetTag, target in ((b"EPLC", b"EPLO", net.placeEnterprise), (b"ETRN", b"ETRO", net.transitionEnterprise)):
+			offsets = self.section(offsetTag)
+			members = self.section(tag)
+			for enterprise in range(len(offsets) - 1):
+				for member in members[offsets[enterprise]:offsets[enterprise + 1]]:
+					target[member] = enterprise
+		return net
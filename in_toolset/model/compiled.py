@@ -0,0 +1,171 @@
+"""A compact, array-backed representation of an (industry) petri net.
+
+A :py:class:`~in_toolset.model.compiled.CompiledNet` only stores the marking and the arcs of a net as plain integer arrays,
+without any of the signals or graphical information of the model objects in :py:mod:`in_toolset.model.base`.
+This makes it suitable for fast simulation and analysis of large nets."""
+
+from array import array
+from collections import deque
+import random
+
+
+class StateSpace:
+	"""The result of exploring the reachable markings of a :py:class:`~in_toolset.model.compiled.CompiledNet`"""
+	def __init__(self):
+		self.states = 0 #: The number of distinct markings visited
+		self.edges = 0 #: The number of transition firings between visited markings
+		self.deadlocks = 0 #: The number of visited markings in which no transition is enabled
+		self.bound = 0 #: The largest number of tokens in a single place in any visited marking
+		self.complete = True #: Whether all reachable markings were visited, i.e. the limit was not reached
+		self.deadlockExample = None #: One of the deadlocked markings, if any
+
+
+class CompiledNet:
+	"""A petri net in which places and transitions are numbered from 0, and arcs are stored as tuples of place indices."""
+	def __init__(self):
+		self.marking = array("q")
+		self.placeEnterprise = array("l")
+		self.transitionEnterprise = array("l")
+
+		self.presets = []
+		self.postsets = []
+		self.delays = [] #: The delay of every transition for timed simulation, see :py:mod:`~in_toolset.model.timed`
+
+		self.places = [] #: The :py:class:`~in_toolset.model.base.Place` objects corresponding to the places, if compiled from a model
+		self.transitions = [] #: The :py:class:`~in_toolset.model.base.Transition` objects corresponding to the transitions, if compiled from a model
+
+	def placeCount(self): return len(self.marking)
+	def transitionCount(self): return len(self.presets)
+
+	def addPlace(self, tokens=0, enterprise=-1):
+		"""Add a place containing `tokens` tokens and return its index"""
+		self.marking.append(tokens)
+		self.placeEnterprise.append(enterprise)
+		return len(self.marking) - 1
+
+	def addTransition(self, preset=(), postset=(), enterprise=-1, delay=""):
+		"""Add a transition consuming from the places in `preset` and producing in the places in `postset` and return its index"""
+		self.presets.append(tuple(preset))
+		self.postsets.append(tuple(postset))
+		self.delays.append(delay)
+		self.transitionEnterprise.append(enterprise)
+		return len(self.presets) - 1
+
+	def isEnabled(self, transition, marking=None):
+		if marking is None:
+			marking = self.marking
+		for place in self.presets[transition]:
+			if marking[place] == 0:
+				return False
+		return True
+
+	def enabledTransitions(self, marking=None):
+		return [t for t in range(len(self.presets)) if self.isEnabled(t, marking)]
+
+	def fire(self, transition, marking=None):
+		"""Fire `transition`, updating the tokens in all connected places"""
+		if marking is None:
+			marking = self.marking
+		for place in self.presets[transition]:
+			marking[place] -= 1
+		for place in self.postsets[transition]:
+			marking[place] += 1
+
+	def fireRandom(self, rng=random):
+		"""Fire a random enabled transition and return its index, or return -1 if the net is in deadlock"""
+		enabled = self.enabledTransitions()
+		if not enabled:
+			return -1
+		transition = rng.choice(enabled)
+		self.fire(transition)
+		return transition
+
+	def run(self, steps, rng=random, statistics=None):
+		"""Fire up to `steps` random transitions, stopping early on deadlock. Return the number of transitions fired.
+		Every firing is recorded in the :py:class:`~in_toolset.model.statistics.FiringStatistics` `statistics` if it is given."""
+		if statistics is None:
+			for step in range(steps):
+				if self.fireRandom(rng) < 0:
+					return step
+			return steps
+
+		for step in range(steps):
+			transition = self.fireRandom(rng)
+			if transition < 0:
+				return step
+			statistics.recordFiring(transition, self.presets[transition], self.postsets[transition], self.marking)
+		return steps
+
+	def explore(self, limit=100000):
+		"""Explore the markings reachable from the current marking breadth-first, visiting at most `limit` markings,
+		and return a :py:class:`~in_toolset.model.compiled.StateSpace` describing them"""
+		result = StateSpace()
+		transitions = list(zip(self.presets, self.postsets))
+
+		initial = tuple(self.marking)
+		seen = {initial}
+		queue = deque([initial])
+		while queue:
+			marking = queue.popleft()
+			result.states += 1
+			result.bound = max(result.bound, max(marking, default=0))
+
+			enabled = False
+			for preset, postset in transitions:
+				if all(marking[place] for place in preset):
+					enabled = True
+					result.edges += 1
+					successor = list(marking)
+					for place in preset:
+						successor[place] -= 1
+					for place in postset:
+						successor[place] += 1
+					successor = tuple(successor)
+					if successor not in seen:
+						if len(seen) >= limit:
+							result.complete = False
+							continue
+						seen.add(successor)
+						queue.append(successor)
+
+			if not enabled:
+				result.deadlocks += 1
+				if result.deadlockExample is None:
+					result.deadlockExample = marking
+		return result
+
+	def writeBack(self):
+		"""Copy the current marking back into the :py:class:`~in_toolset.model.base.Place` objects this net was compiled from"""
+		for place, tokens in zip(self.places, self.marking):
+			place.tokens = tokens
+
+
+def compileIndustry(industry):
+	"""Compile the net of `industry`, an :py:class:`~in_toolset.model.ui.UIPetriNet`, into a :py:class:`~in_toolset.model.compiled.CompiledNet`.
+	Places and transitions are numbered in the same order as they are stored in project files."""
+	net = CompiledNet()
+
+	placeIndex = {}
+	for place in industry.net.places:
+		placeIndex[place] = net.addPlace(place.tokens)
+		net.places.append(place)
+
+	transitions = list(industry.net.transitions)
+	for trans in transitions:
+		net.addTransition(
+			[placeIndex[p] for p in trans.preset if p in placeIndex],
+			[placeIndex[p] for p in trans.postset if p in placeIndex],
+			delay=getattr(trans, "delay", "")
+		)
+		net.transitions.append(trans)
+
+	transitionIndex = {trans: index for index, trans in enumerate(transitions)}
+	for enterprise, node in enumerate(industry.graph.nodes):
+		for place in node.obj.net.places:
+			if place in placeIndex:
+				net.placeEnterprise[placeIndex[place]] = enterprise
+		for trans in node.obj.net.transitions:
+			if trans in transitionIndex:
+				net.transitionEnterprise[transitionIndex[trans]] = enterprise
+
+	return net
@@ -0,0 +1,146 @@
+"""Generation of synthetic industries of any size, for benchmarks and for testing the toolset on large models.
+
+Every enterprise gets a workflow net that leads from a start place to an end place through a number of steps,
+each step being a single transition, a choice between transitions or a parallel split and join.
+Some of the transitions then send messages, and a share of those messages are received by a transition of another enterprise,
+connected with a channel as if they had been connected in the editor."""
+
+from .base import Place
+from .ui import UIPetriNet, UINode, UITransition, UIInternalArrow, UILooseArrow, TransitionType
+from .layout import layoutEnterprise, ENTERPRISE_DISTANCE
+from .wiring import createChannel
+from ..common import gcPaused
+import random
+import math
+
+
+SHAPES = ("sequence", "choice", "parallel", "mixed") #: The shapes of workflow nets that :py:func:`generateIndustry` can generate
+
+
+class EnterpriseBuilder:
+	"""Adds places, transitions and arcs to an enterprise in the same way as the editor does"""
+	def __init__(self, industry, node):
+		self.industry = industry
+		self.node = node
+		self.enterprise = node.obj
+		self.places = 0
+		self.transitions = []
+
+	def addPlace(self):
+		place = Place()
+		self.enterprise.net.places.add(place)
+		self.industry.net.places.add(place)
+		self.places += 1
+		return self.addNode(place, "p%i" %self.places)
+
+	def addTransition(self):
+		transition = UITransition()
+		self.enterprise.net.transitions.add(transition)
+		self.industry.net.transitions.add(transition)
+		node = self.addNode(transition, "t%i" %(len(self.transitions) + 1))
+
+		# The arrows are only shown once the transition becomes an input or output transition
+		self.enterprise.graph.looseArrows.add(UILooseArrow(node, transition))
+		arrow = UILooseArrow(self.node, transition)
+		self.industry.graph.looseArrows.add(arrow)
+		self.transitions.append(arrow)
+		return node
+
+	def addNode(self, obj, name):
+		node = UINode(obj)
+		node.label.setText(name)
+		self.enterprise.graph.nodes.add(node)
+		return node
+
+	def connect(self, source, target):
+		self.enterprise.graph.arrows.add(UIInternalArrow(source, target))
+
+	def addStep(self, current, shape, branches, rng):
+		"""Add a step of `shape` after the place `current` and return the place it ends in"""
+		if shape == "mixed":
+			shape = rng.choice(SHAPES[:-1])
+
+		end = self.addPlace()
+		if shape == "sequence":
+			transition = self.addTransition()
+			self.connect(current, transition)
+			self.connect(transition, end)
+		elif shape == "choice":
+			for i in range(branches):
+				transition = self.addTransition()
+				self.connect(current, transition)
+				self.connect(transition, end)
+		else:
+			split = self.addTransition()
+			join = self.addTransition()
+			self.connect(current, split)
+			self.connect(join, end)
+			for i in range(branches):
+				before = self.addPlace()
+				after = self.addPlace()
+				transition = self.addTransition()
+				self.connect(split, before)
+				self.connect(before, transition)
+				self.connect(transition, after)
+				self.connect(after, join)
+		return end
+
+
+def generateIndustry(enterprises=10, steps=10, shape="mixed", branches=2, fanout=2, density=.8, seed=0, layout=True):
+	"""Generate an industry with `enterprises` enterprises and return it as a :py:class:`~in_toolset.model.ui.UIPetriNet`.
+
+	The workflow net of every enterprise has `steps` steps of the given `shape`, one of :py:data:`SHAPES`,
+	where choices and parallel steps have `branches` branches. Every enterprise sends `fanout` message types,
+	each from a different transition, and each message type is received by another enterprise with the probability `density`.
+	The start places hold a token. The same `seed` generates the same industry.
+	If `layout` is set, the workflow nets are laid out with :py:func:`~in_toolset.model.layout.layeredLayout`
+	and the enterprises are placed on a square grid."""
+	if shape not in SHAPES:
+		raise ValueError("Unknown shape %r, expected one of %s" %(shape, ", ".join(SHAPES)))
+
+	with gcPaused():
+		rng = random.Random(seed)
+		industry = UIPetriNet()
+		columns = max(1, math.ceil(math.sqrt(enterprises)))
+
+		builders = []
+		for i in range(enterprises):
+			node = UINode(UIPetriNet())
+			node.label.setText("e%i" %(i + 1))
+			node.move(i % columns * ENTERPRISE_DISTANCE * 2, i // columns * ENTERPRISE_DISTANCE * 2)
+			industry.graph.nodes.add(node)
+
+			builder = EnterpriseBuilder(industry, node)
+			current = builder.addPlace()
+			for step in range(steps):
+				current = builder.addStep(current, shape, branches, rng)
+			builders.append(builder)
+
+		# Every transition sends or receives at most one message type
+		free = [builder.transitions[:] for builder in builders]
+		for transitions in free:
+			rng.shuffle(transitions)
+
+		for i, builder in enumerate(builders):
+			for k in range(fanout):
+				if not free[i]:
+					break
+				source = free[i].pop()
+				source.transition.setMessage("m%i_%i" %(i + 1, k + 1))
+				source.transition.setType(TransitionType.OUTPUT)
+
+				if enterprises > 1 and rng.random() < density:
+					j = rng.randrange(enterprises - 1)
+					j += j >= i
+					if free[j]:
+						target = free[j].pop()
+						target.transition.setMessage(source.transition.message)
+						target.transition.setType(TransitionType.INPUT)
+						createChannel(industry, source, target)
+
+		if layout:
+			for builder in builders:
+				layoutEnterprise(builder.enterprise)
+
+		industry.net.setInitialMarking()
+		return industry
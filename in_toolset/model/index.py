@@ -0,0 +1,392 @@
+"""Indices over the model that are kept up to date from its change signals, so that editing and validating large industries
+does not have to scan every object.
+
+:py:class:`LabelIndex` maps the labels of the nodes of a graph to the nodes and allocates unused names,
+:py:class:`MessageIndex` maps message types to the input and output transitions of the enterprises,
+:py:class:`ArcIndex` keeps the arcs of a workflow net in a set,
+and :py:class:`SearchIndex` finds the labels and message types of a whole project by parts of their text."""
+
+from ..common import SignalListener, gcPaused
+from .base import Place
+from .ui import UIInternalArrow, UIPetriNet, UITransition
+import collections
+import bisect
+import heapq
+import re
+
+
+NUMBERED_LABEL = re.compile(r"(.*?)([0-9]+)") #: Splits labels like ``e12`` into a prefix and a number
+
+
+class LabelIndex:
+	"""Maps the label texts of the active nodes of a :py:class:`~in_toolset.model.ui.UIGraph` to the nodes with that label.
+
+	Labels that consist of a prefix and a number, like ``e12``, are also counted per prefix,
+	and the largest number of every prefix is kept in a heap, so that :py:meth:`uniqueName` does not scan the graph."""
+	def __init__(self, graph):
+		self.nodes = collections.defaultdict(set)
+		self.texts = {}
+		self.numbers = collections.defaultdict(collections.Counter)
+		self.heaps = collections.defaultdict(list) # Negated numbers, removed lazily once their count drops to 0
+
+		self.signals = SignalListener()
+		self.signals.connect(graph.nodes.added, self.addNode)
+		self.signals.connect(graph.nodes.removed, self.removeNode)
+
+		for node in graph.nodes:
+			self.addNode(node)
+
+	def __contains__(self, text): return bool(self.nodes.get(text))
+
+	def disconnect(self):
+		"""Stop following the changes of the graph and empty the index"""
+		self.signals.disconnect()
+		for node in list(self.texts):
+			self.removeNode(node)
+
+	def find(self, text):
+		"""Return the set of nodes labelled `text`"""
+		return set(self.nodes.get(text, ()))
+
+	def uniqueName(self, prefix):
+		"""Return `prefix` followed by the number after the largest number that follows `prefix` in a label"""
+		counts = self.numbers[prefix]
+		heap = self.heaps[prefix]
+		while heap and counts[-heap[0]] == 0:
+			heapq.heappop(heap)
+		return prefix + str(-heap[0] + 1 if heap else 1)
+
+	def addNode(self, node):
+		if node not in self.texts:
+			node.label.textChanged.connect(self.updateNode, node)
+			self.insert(node, node.label.text)
+
+	def removeNode(self, node):
+		if node in self.texts:
+			node.label.textChanged.disconnect(self.updateNode, node)
+			self.remove(node)
+
+	def updateNode(self, node):
+		self.remove(node)
+		self.insert(node, node.label.text)
+
+	def insert(self, node, text):
+		self.texts[node] = text
+		self.nodes[text].add(node)
+
+		match = NUMBERED_LABEL.fullmatch(text)
+		if match:
+			prefix, number = match.group(1), int(match.group(2))
+			counts = self.numbers[prefix]
+			counts[number] += 1
+			if counts[number] == 1:
+				heapq.heappush(self.heaps[prefix], -number)
+
+	def remove(self, node):
+		text = self.texts.pop(node)
+		nodes = self.nodes[text]
+		nodes.discard(node)
+		if not nodes:
+			del self.nodes[text]
+
+		match = NUMBERED_LABEL.fullmatch(text)
+		if match:
+			self.numbers[match.group(1)][int(match.group(2))] -= 1
+
+
+class MessageIndex:
+	"""Maps the message types of the active loose arrows of the industry graph to the arrows, by the type of their transition,
+	both over the whole industry and per enterprise node.
+
+	The loose arrows of the industry belong to the input and output transitions of the enterprises,
+	see :py:class:`~in_toolset.model.ui.UILooseArrow`."""
+	def __init__(self, graph):
+		self.arrows = collections.defaultdict(set)
+		self.enterpriseArrows = collections.defaultdict(set)
+		self.keys = {}
+
+		self.signals = SignalListener()
+		self.signals.connect(graph.looseArrows.added, self.addArrow)
+		self.signals.connect(graph.looseArrows.removed, self.removeArrow)
+
+		for arrow in graph.looseArrows:
+			self.addArrow(arrow)
+
+	def __len__(self): return len(self.keys)
+
+	def disconnect(self):
+		"""Stop following the changes of the graph and empty the index"""
+		self.signals.disconnect()
+		for arrow in list(self.keys):
+			self.removeArrow(arrow)
+
+	def messages(self):
+		"""Return the set of message types used by a transition of the industry"""
+		return {message for message, type in self.arrows}
+
+	def find(self, message, type, node=None):
+		"""Return the set of loose arrows whose transitions send (`type` is :py:attr:`~in_toolset.model.ui.TransitionType.OUTPUT`)
+		or receive (:py:attr:`~in_toolset.model.ui.TransitionType.INPUT`) `message`, only those of the enterprise `node` if it is given"""
+		if node is None:
+			return set(self.arrows.get((message, type), ()))
+		return set(self.enterpriseArrows.get((node, message, type), ()))
+
+	def addArrow(self, arrow):
+		if arrow not in self.keys:
+			arrow.transition.messageChanged.connect(self.updateArrow, arrow)
+			arrow.transition.typeChanged.connect(self.updateArrow, arrow)
+			self.insert(arrow)
+
+	def removeArrow(self, arrow):
+		if arrow in self.keys:
+			arrow.transition.messageChanged.disconnect(self.updateArrow, arrow)
+			arrow.transition.typeChanged.disconnect(self.updateArrow, arrow)
+			self.remove(arrow)
+
+	def updateArrow(self, arrow):
+		# Changing the type to internal removes the arrow before this is called
+		if arrow in self.keys:
+			self.remove(arrow)
+			self.insert(arrow)
+
+	def insert(self, arrow):
+		key = (arrow.transition.message, arrow.transition.type)
+		self.keys[arrow] = key
+		self.arrows[key].add(arrow)
+		self.enterpriseArrows[(arrow.node,) + key].add(arrow)
+
+	def remove(self, arrow):
+		key = self.keys.pop(arrow)
+		self.discard(self.arrows, key, arrow)
+		self.discard(self.enterpriseArrows, (arrow.node,) + key, arrow)
+
+	def discard(self, index, key, arrow):
+		arrows = index[key]
+		arrows.discard(arrow)
+		if not arrows:
+			del index[key]
+
+
+class ArcIndex:
+	"""Keeps the arcs drawn between the nodes of a workflow net, as pairs of the connected places and transitions, in a set"""
+	def __init__(self, graph):
+		self.arcs = collections.Counter()
+		self.arrows = set()
+
+		self.signals = SignalListener()
+		self.signals.connect(graph.arrows.added, self.addArrow)
+		self.signals.connect(graph.arrows.removed, self.removeArrow)
+
+		for arrow in graph.arrows:
+			self.addArrow(arrow)
+
+	def __len__(self): return len(self.arcs)
+
+	def disconnect(self):
+		"""Stop following the changes of the graph and empty the index"""
+		self.signals.disconnect()
+		self.arcs.clear()
+		self.arrows.clear()
+
+	def connected(self, source, target):
+		"""Return whether there is an arc from the place or transition `source` to `target`"""
+		return self.arcs[source, target] > 0
+
+	def addArrow(self, arrow):
+		if isinstance(arrow, UIInternalArrow) and arrow not in self.arrows:
+			self.arrows.add(arrow)
+			self.arcs[arrow.source.obj, arrow.target.obj] += 1
+
+	def removeArrow(self, arrow):
+		if arrow in self.arrows:
+			self.arrows.remove(arrow)
+			key = (arrow.source.obj, arrow.target.obj)
+			self.arcs[key] -= 1
+			if self.arcs[key] == 0:
+				del self.arcs[key]
+
+
+class SearchResult:
+	"""A label or message type found by :py:class:`SearchIndex`"""
+	__slots__ = ("kind", "text", "folded", "node", "enterprise")
+
+	def __init__(self, kind, node, enterprise):
+		self.kind = kind #: ``"enterprise"``, ``"place"``, ``"transition"`` or ``"message"``
+		self.text = ""
+		self.folded = ""
+		self.node = node #: The :py:class:`~in_toolset.model.ui.UINode` that has the label or the transition with the message type
+		self.enterprise = enterprise #: The enterprise node whose workflow net contains :py:attr:`node`, None for enterprises
+
+
+def trigrams(text):
+	"""Return the set of substrings of `text` that are three characters long"""
+	return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+	"""Finds the enterprises, places and transitions of an industry by their labels, and transitions by their message types.
+
+	The texts are kept in a sorted list, which finds the texts that start with a query by bisection,
+	and every text is also split into its substrings of three characters, each of which maps to the set of texts that contain it.
+	A query then only intersects the sets of its own substrings instead of scanning every text.
+	The index follows the changes of the labels, message types and graphs of the industry."""
+	def __init__(self, industry):
+		self.results = {} # Results by id, the ids are kept in the other structures so that they compare cheaply
+		self.ids = {}
+		self.nextId = 0
+		self.texts = collections.defaultdict(set)
+		self.sorted = []
+		self.grams = collections.defaultdict(set)
+		self.enterprises = set()
+
+		self.signals = SignalListener()
+		self.signals.connect(industry.graph.nodes.added, self.addEnterprise)
+		self.signals.connect(industry.graph.nodes.removed, self.removeEnterprise)
+
+		# The texts that are there from the start are sorted once, instead of being inserted one by one
+		self.loading = True
+		with gcPaused():
+			for node in industry.graph.nodes:
+				self.addEnterprise(node)
+		self.sorted.sort()
+		self.loading = False
+
+	def __len__(self): return len(self.results)
+
+	def disconnect(self):
+		"""Stop following the changes of the industry and empty the index"""
+		self.signals.disconnect()
+		for node in list(self.enterprises):
+			self.removeEnterprise(node)
+
+	def search(self, query, limit=50):
+		"""Return at most `limit` results for `query`, ignoring case, best matches first: texts equal to `query`,
+		then texts that start with it in alphabetical order, and then other texts that contain it, shorter texts first.
+		If no text contains `query`, the texts that share at least half of its substrings of three characters are returned, which tolerates typos.
+		Queries shorter than three characters only find texts that start with them."""
+		query = query.strip().casefold()
+		if not query:
+			return []
+
+		found = list(self.texts.get(query, ()))
+		seen = set(found)
+
+		start = bisect.bisect_right(self.sorted, (query, self.nextId))
+		for text, id in self.sorted[start:start + limit - len(found)]:
+			if not text.startswith(query):
+				break
+			found.append(id)
+			seen.add(id)
+
+		if len(found) < limit and len(query) >= 3:
+			grams = [query[i:i + 3] for i in range(len(query) - 2)]
+			sets = sorted((self.grams.get(gram, set()) for gram in grams), key=len)
+			ids = set.intersection(*sets) - seen
+			contained = [id for id in ids if query in self.results[id].folded]
+			found += heapq.nsmallest(limit - len(found), contained, key=lambda id: (len(self.results[id].folded), id))
+			seen.update(contained)
+
+			if not found and len(grams) > 1:
+				# A text that shares half of the substrings is in one of the sets that are left after removing the larger half
+				required = (len(grams) + 1) // 2
+				candidates = set().union(*sets[:len(grams) - required + 1]) - seen
+				counts = collections.Counter()
+				for ids in sets:
+					counts.update(ids & candidates)
+				similar = [
+					(-count, len(self.results[id].folded), id)
+					for id, count in counts.items() if count >= required
+				]
+				found += [id for count, length, id in heapq.nsmallest(limit - len(found), similar)]
+
+		return [self.results[id] for id in found[:limit]]
+
+	def addEnterprise(self, node):
+		if node in self.enterprises:
+			return
+		self.enterprises.add(node)
+		self.insert((node, "label"), SearchResult("enterprise", node, None), node.label.text)
+		node.label.textChanged.connect(self.updateLabel, node)
+
+		if isinstance(node.obj, UIPetriNet):
+			graph = node.obj.graph
+			graph.nodes.added.connect(self.addNode, node)
+			graph.nodes.removed.connect(self.removeNode, node)
+			for child in graph.nodes:
+				self.addNode(child, node)
+
+	def removeEnterprise(self, node):
+		if node not in self.enterprises:
+			return
+		self.enterprises.remove(node)
+		self.remove((node, "label"))
+		node.label.textChanged.disconnect(self.updateLabel, node)
+
+		if isinstance(node.obj, UIPetriNet):
+			graph = node.obj.graph
+			graph.nodes.added.disconnect(self.addNode, node)
+			graph.nodes.removed.disconnect(self.removeNode, node)
+			for child in graph.nodes:
+				self.removeNode(child, node)
+
+	def addNode(self, node, enterprise):
+		if (node, "label") in self.ids:
+			return
+		kind = "place" if isinstance(node.obj, Place) else "transition"
+		self.insert((node, "label"), SearchResult(kind, node, enterprise), node.label.text)
+		node.label.textChanged.connect(self.updateLabel, node)
+
+		if isinstance(node.obj, UITransition):
+			self.insert((node, "message"), SearchResult("message", node, enterprise), node.obj.message)
+			node.obj.messageChanged.connect(self.updateMessage, node)
+
+	def removeNode(self, node, enterprise):
+		if (node, "label") not in self.ids:
+			return
+		self.remove((node, "label"))
+		node.label.textChanged.disconnect(self.updateLabel, node)
+
+		if (node, "message") in self.ids:
+			self.remove((node, "message"))
+			node.obj.messageChanged.disconnect(self.updateMessage, node)
+
+	def updateLabel(self, node):
+		key = (node, "label")
+		self.insert(key, self.remove(key), node.label.text)
+
+	def updateMessage(self, node):
+		key = (node, "message")
+		self.insert(key, self.remove(key), node.obj.message)
+
+	def insert(self, key, result, text):
+		id = self.nextId
+		self.nextId += 1
+		self.ids[key] = id
+		self.results[id] = result
+
+		result.text = text
+		result.folded = text.casefold()
+		if result.folded:
+			self.texts[result.folded].add(id)
+			if self.loading:
+				self.sorted.append((result.folded, id))
+			else:
+				bisect.insort(self.sorted, (result.folded, id))
+			for gram in trigrams(result.folded):
+				self.grams[gram].add(id)
+
+	def remove(self, key):
+		id = self.ids.pop(key)
+		result = self.results.pop(id)
+		if result.folded:
+			self.discard(self.texts, result.folded, id)
+			del self.sorted[bisect.bisect_left(self.sorted, (result.folded, id))]
+			for gram in trigrams(result.folded):
+				self.discard(self.grams, gram, id)
+		return result
+
+	def discard(self, index, key, id):
+		ids = index[key]
+		ids.discard(id)
+		if not ids:
+			del index[key]
@@ -0,0 +1,418 @@
+"""Journaled autosaving and crash recovery of projects.
+
+A :py:class:`~in_toolset.model.journal.ProjectJournal` listens to the change signals of the places, transitions and graphs of a project and,
+whenever :py:meth:`~in_toolset.model.journal.ProjectJournal.flush` is called, rebuilds only the parts of the project file that changed.
+These parts are handed to a background thread, which appends them to an append-only journal file,
+periodically compacts the journal into a single snapshot, and writes full project files when saving.
+
+The journal is a text file with one json record per line.
+A ``snapshot`` record contains all sections of a project file, an ``update`` record contains only the sections that changed.
+A project file is split into the sections ``places``, ``transitions``, ``industry``, ``enterprises`` (the number of enterprises)
+and ``enterprise/<index>`` for every enterprise."""
+
+from ..common import Signal, gcPaused
+from .project import ProjectReader, ProjectWriter, atomicOpen
+from .ui import UINode, UIArrow
+import tempfile
+import threading
+import queue
+import json
+import os
+
+
+COMPACT_RECORDS = 100 #: The number of update records after which the journal is compacted into a single snapshot
+UNTITLED_PREFIX = "in-toolset-untitled-" #: The start of the names of the journals of untitled projects, followed by the process id
+
+
+def journalPath(filename):
+	"""Return the path of the journal of the project file `filename`, or of the untitled project of this process if `filename` is None"""
+	if filename:
+		return filename + ".journal"
+	return os.path.join(tempfile.gettempdir(), "%s%i.journal" %(UNTITLED_PREFIX, os.getpid()))
+
+
+def isRunning(pid):
+	"""Return whether the process with the id `pid` is running"""
+	if os.name == "nt":
+		import ctypes
+		kernel32 = ctypes.windll.kernel32
+		handle = kernel32.OpenProcess(0x00100000, False, pid) # SYNCHRONIZE
+		if not handle:
+			return False
+		try:
+			return kernel32.WaitForSingleObject(handle, 0) == 0x102 # WAIT_TIMEOUT
+		finally:
+			kernel32.CloseHandle(handle)
+	try:
+		os.kill(pid, 0)
+	except ProcessLookupError:
+		return False
+	except PermissionError:
+		pass # The process belongs to another user
+	return True
+
+
+def leftoverJournals():
+	"""Return the paths of the journals of untitled projects whose process is no longer running, the most recently changed first"""
+	directory = tempfile.gettempdir()
+	journals = []
+	for name in os.listdir(directory):
+		if not name.startswith(UNTITLED_PREFIX) or not name.endswith(".journal"):
+			continue
+		try:
+			pid = int(name[len(UNTITLED_PREFIX):-len(".journal")])
+		except ValueError:
+			continue
+		path = os.path.join(directory, name)
+		if pid != os.getpid() and not isRunning(pid):
+			try:
+				journals.append((os.path.getmtime(path), path))
+			except OSError:
+				pass # Removed in the meantime
+	journals.sort(reverse=True)
+	return [path for mtime, path in journals]
+
+
+def isLast(objects, obj):
+	"""Return whether no active object follows `obj` in the :py:class:`~in_toolset.model.base.ObjectList` `objects`,
+	so that adding or removing it does not change the ids the other objects get when saving"""
+	for other in reversed(objects.objects):
+		if other is obj:
+			return True
+		if other.active:
+			return False
+	return True
+
+
+def splitSections(data):
+	sections = {
+		"places": data["places"],
+		"transitions": data["transitions"],
+		"industry": data["industry"],
+		"enterprises": len(data["enterprises"])
+	}
+	for index, enterprise in enumerate(data["enterprises"]):
+		sections["enterprise/%i" %index] = enterprise
+	return sections
+
+
+def joinSections(sections):
+	return {
+		"places": sections["places"],
+		"transitions": sections["transitions"],
+		"enterprises": [sections["enterprise/%i" %i] for i in range(sections["enterprises"])],
+		"industry": sections["industry"]
+	}
+
+
+def readJournal(path):
+	"""Replay the journal at `path` and return the project data it contains, or None if there is nothing to recover"""
+	sections = None
+	with open(path) as f:
+		for line in f:
+			try:
+				record = json.loads(line)
+			except ValueError:
+				break # The last record may be incomplete if the program crashed while writing it
+			if "snapshot" in record:
+				sections = record["snapshot"]
+			elif sections is not None:
+				sections.update(record["update"])
+	if sections is None:
+		return None
+	return joinSections(sections)
+
+
+def recoverProject(project, filename=None, path=None):
+	"""Load the changes journaled for the project file `filename` into `project`, if there are any.
+	The journal is read from `path` if it is given, e.g. one of the :py:func:`leftoverJournals`.
+	Return whether anything was recovered."""
+	if path is None:
+		path = journalPath(filename)
+	if not os.path.exists(path):
+		return False
+	data = readJournal(path)
+	if data is None:
+		return False
+
+	with gcPaused():
+		project.industry = ProjectReader().load(data)
+	project.industry.changed.connect(project.setUnsaved)
+	project.setFilename(filename)
+	project.setUnsaved(True)
+	return True
+
+
+class JournalWriter(threading.Thread):
+	"""The background thread that writes journal records and project files.
+	All methods other than :py:meth:`~in_toolset.model.journal.JournalWriter.submit` are only called from the thread itself."""
+	def __init__(self, path):
+		super().__init__(daemon=True)
+		self.path = path
+		self.tasks = queue.Queue()
+		self.results = queue.Queue()
+
+		self.sections = {}
+		self.records = 0
+		self.file = None
+
+	def submit(self, func, *args):
+		"""Schedule `func` to be called with `args` on the writer thread"""
+		self.tasks.put((func, args))
+
+	def run(self):
+		while True:
+			task = self.tasks.get()
+			if task is None:
+				break
+			func, args = task
+			try:
+				func(*args)
+			except Exception as e:
+				self.results.put(("error", func.__name__, e))
+		self.closeFile()
+
+	def closeFile(self):
+		if self.file:
+			self.file.close()
+			self.file = None
+
+	def setPath(self, path):
+		self.discard()
+		self.path = path
+
+	def update(self, sections, full):
+		changed = {}
+		for key, value in sections.items():
+			if self.sections.get(key) != value:
+				changed[key] = value
+		if full:
+			count = sections["enterprises"]
+			self.sections = {
+				key: value for key, value in self.sections.items()
+				if not key.startswith("enterprise/") or int(key[11:]) < count
+			}
+		self.sections.update(changed)
+
+		if self.file is None or self.records >= COMPACT_RECORDS:
+			self.compact()
+		elif changed:
+			self.append({"update": changed})
+			self.records += 1
+
+	def append(self, record):
+		self.file.write(json.dumps(record) + "\n")
+		self.file.flush()
+		os.fsync(self.file.fileno())
+
+	def compact(self):
+		self.closeFile()
+		with atomicOpen(self.path) as f:
+			f.write(json.dumps({"snapshot": self.sections}) + "\n")
+		self.file = open(self.path, "a")
+		self.records = 0
+
+	def save(self, filename):
+		try:
+			with atomicOpen(filename) as f:
+				json.dump(joinSections(self.sections), f)
+		except Exception as e:
+			self.results.put(("saveFailed", filename, e))
+		else:
+			self.results.put(("saved", filename, None))
+
+	def discard(self):
+		self.closeFile()
+		if os.path.exists(self.path):
+			os.remove(self.path)
+
+
+class ProjectJournal:
+	"""Journals the changes made to a :py:class:`~in_toolset.model.project.Project`, and saves it in the background.
+	:py:meth:`~in_toolset.model.journal.ProjectJournal.flush` and :py:meth:`~in_toolset.model.journal.ProjectJournal.poll`
+	should be called regularly from the thread that owns the project, e.g. by a timer."""
+	def __init__(self, project):
+		self.saved = Signal() #: Emitted with the filename when a background save has finished
+		self.saveFailed = Signal() #: Emitted with the filename and the exception when a background save has failed
+
+		self.project = project
+		self.industry = project.industry
+		self.writer = ProjectWriter()
+
+		self.thread = JournalWriter(journalPath(project.filename))
+		self.thread.start()
+
+		self.dirtyAll = True
+		self.dirtySections = set() # Changed sections other than the enterprises
+		self.dirtyEnterprises = set()
+
+		# The change signals of the industry and the enterprises also report changes of the tokens and of the enabled transitions,
+		# so the journal listens to the signals of the individual objects instead, connecting to every object only once
+		self.watched = set()
+		self.watchedGraph = set() # Separately, since the enterprise nodes are both objects and part of the industry graph
+		net = self.industry.net
+		for objects, section in ((net.places, "places"), (net.transitions, "transitions"), (self.industry.graph.nodes, "enterprises")):
+			objects.added.connect(self.addObject, objects, section)
+			objects.removed.connect(self.setStructureChanged, objects, section)
+			for obj in objects.objects:
+				self.watchObject(obj)
+		self.watchGraph(self.industry.graph, None)
+
+	def watchObject(self, obj):
+		if obj in self.watched:
+			return
+		self.watched.add(obj)
+		if isinstance(obj, UINode):
+			self.watchGraph(obj.obj.graph, obj)
+			for objects in (obj.obj.net.places, obj.obj.net.transitions):
+				objects.added.connect(self.setMembersChanged, obj)
+				objects.removed.connect(self.setMembersChanged, obj)
+			obj.obj.net.transitions.added.connect(self.watchMessage, obj)
+			for transition in obj.obj.net.transitions.objects:
+				self.watchMessage(transition, obj)
+		elif hasattr(obj, "tokensChanged"):
+			obj.tokensChanged.connect(self.setSectionChanged, "places")
+		else:
+			for signal in (obj.typeChanged, obj.messageChanged, obj.delayChanged):
+				signal.connect(self.setSectionChanged, "transitions")
+			obj.messageChanged.connect(self.setGraphChanged, None)
+
+	def watchMessage(self, transition, node):
+		# The message is also the label of the loose arrows of the transition, which are saved even while they are inactive,
+		# and inactive loose arrows are added without any signal, so their graphs are marked through the transition instead
+		if (transition, node) in self.watched:
+			return
+		self.watched.add((transition, node))
+		transition.messageChanged.connect(self.setGraphChanged, node)
+
+	def watchGraph(self, graph, node):
+		"""Listen to the changes of `graph`, the industry graph if `node` is None and otherwise the graph of the enterprise `node`"""
+		for objects in (graph.nodes, graph.arrows, graph.looseArrows):
+			objects.added.connect(self.addGraphObject, node)
+			objects.removed.connect(self.setMembersChanged, node)
+			for obj in objects.objects:
+				self.watchGraphObject(obj, node)
+
+	def watchGraphObject(self, obj, node):
+		if obj in self.watchedGraph:
+			return
+		self.watchedGraph.add(obj)
+		if isinstance(obj, UIArrow):
+			obj.curveChanged.connect(self.setGraphChanged, node)
+			return
+		if isinstance(obj, UINode):
+			obj.positionChanged.connect(self.setGraphChanged, node)
+		else:
+			obj.angleChanged.connect(self.setGraphChanged, node)
+		obj.label.changed.connect(self.setGraphChanged, node)
+
+	def addObject(self, obj, objects, section):
+		self.watchObject(obj)
+		self.setStructureChanged(obj, objects, section)
+
+	def setStructureChanged(self, obj, objects, section):
+		# The ids of the other objects only change if there are active objects after this one
+		if not isLast(objects, obj):
+			self.dirtyAll = True
+		else:
+			self.dirtySections.add(section)
+			if section == "enterprises" and obj.active:
+				self.dirtyEnterprises.add(obj)
+			elif section == "transitions":
+				# Transitions come with a loose arrow in the industry graph, which is saved even though it is added while inactive,
+				# without any signal
+				self.dirtySections.add("industry")
+
+	def addGraphObject(self, obj, node):
+		self.watchGraphObject(obj, node)
+		self.setGraphChanged(node)
+
+	def setMembersChanged(self, obj, node): self.setGraphChanged(node)
+	def setSectionChanged(self, section): self.dirtySections.add(section)
+
+	def setGraphChanged(self, node):
+		if node is None:
+			self.dirtySections.add("industry")
+		else:
+			self.dirtyEnterprises.add(node)
+
+	def isDirty(self):
+		return self.dirtyAll or bool(self.dirtySections) or bool(self.dirtyEnterprises)
+
+	def flush(self, force=False):
+		"""Hand the parts of the project that changed since the last flush to the writer thread.
+		Unless `force` is set, nothing is journaled as long as the project has no unsaved changes."""
+		if not force and not (self.isDirty() and self.project.unsaved):
+			return
+
+		if self.dirtyAll:
+			sections = splitSections(self.writer.save(self.industry))
+		else:
+			# Places, transitions and enterprises were at most added or removed at the end, so the ids of the others are still valid.
+			# The ids are assigned before the sections that refer to them are built.
+			sections = {}
+			if "places" in self.dirtySections:
+				sections["places"] = self.writer.savePlaces(self.industry)
+			if "transitions" in self.dirtySections:
+				sections["transitions"] = self.writer.saveTransitions(self.industry)
+			if "enterprises" in self.dirtySections:
+				for index, node in enumerate(self.industry.graph.nodes):
+					node.obj.id = index
+				sections["enterprises"] = len(self.industry.graph.nodes)
+			for node in self.dirtyEnterprises:
+				if node.active:
+					sections["enterprise/%i" %node.obj.id] = self.writer.saveEnterprise(node.obj)
+			if "industry" in self.dirtySections:
+				sections["industry"] = self.writer.saveGraph(self.industry.graph)
+
+		self.thread.submit(self.thread.update, sections, self.dirtyAll)
+
+		self.dirtyAll = False
+		self.dirtySections = set()
+		self.dirtyEnterprises = set()
+
+	def save(self, filename):
+		"""Save the project to `filename` on the writer thread.
+		:py:attr:`saved` or :py:attr:`saveFailed` is emitted from :py:meth:`poll` once this has finished."""
+		if filename != self.project.filename:
+			self.thread.submit(self.thread.setPath, journalPath(filename))
+		self.flush(True)
+		self.thread.submit(self.thread.save, filename)
+		self.thread.submit(self.thread.discard)
+
+	def markSaved(self, filename):
+		"""Drop the journaled changes after the project was saved to `filename` without :py:meth:`save`, e.g. in the binary format,
+		and journal to the journal of `filename` from then on"""
+		self.thread.submit(self.thread.setPath, journalPath(filename))
+		self.thread.submit(self.thread.discard)
+
+	def takeOver(self, path):
+		"""Journal the whole project and remove the journal at `path` afterwards, e.g. the leftover journal it was recovered from"""
+		self.flush(True)
+		self.thread.submit(os.remove, path)
+
+	def poll(self):
+		"""Emit the signals for all results the writer thread has reported since the last call"""
+		while True:
+			try:
+				kind, name, error = self.thread.results.get_nowait()
+			except queue.Empty:
+				return
+			if kind == "saved":
+				self.saved.emit(name)
+			elif kind == "saveFailed":
+				self.saveFailed.emit(name, error)
+			else:
+				import traceback
+				traceback.print_exception(type(error), error, error.__traceback__)
+
+	def close(self, discard=True):
+		"""Finish all pending work and stop the writer thread.
+		If `discard` is set, the journal is removed, otherwise it is kept for recovery."""
+		if discard:
+			self.thread.submit(self.thread.discard)
+		else:
+			self.flush()
+		self.thread.tasks.put(None)
+		self.thread.join()
+		self.poll()
@@ -0,0 +1,381 @@
+"""Automatic layout of the graphs of enterprises and of the industry.
+
+Workflow nets are laid out in layers from left to right, and the industry graph with a force-directed layout,
+whose repulsive forces are approximated with a Barnes-Hut quadtree so that it scales to large graphs.
+
+The layouts work on plain lists of positions and edges, so that they can run in a worker thread without touching the model,
+see :py:class:`~in_toolset.model.layout.LayoutJob`. Their results are aligned to :py:data:`~in_toolset.model.ui.GRID_SIZE`,
+and no two nodes are placed closer to each other than a minimum distance, so that they do not overlap."""
+
+from ..common import Signal
+from .ui import GRID_SIZE, UIChannelArrow
+from .spatial import SpatialHash
+import itertools
+import threading
+import random
+import math
+
+
+NODE_DISTANCE = 3 * GRID_SIZE #: The minimum distance between nodes of a workflow net, places and transitions are 36 pixels wide
+ENTERPRISE_DISTANCE = 6 * GRID_SIZE #: The minimum distance between enterprises, which leaves room for the message arrows around them
+
+
+def graphData(graph):
+	"""Return the active nodes of the :py:class:`~in_toolset.model.ui.UIGraph` `graph`, their positions,
+	and the arrows between them as pairs of indices into the list of nodes"""
+	nodes = list(graph.nodes)
+	indices = {node: i for i, node in enumerate(nodes)}
+	edges = []
+	for arrow in graph.arrows:
+		source = arrow.source
+		target = arrow.target
+		if isinstance(arrow, UIChannelArrow):
+			# Channels connect the message arrows around enterprises
+			source = source.node
+			target = target.node
+		if source in indices and target in indices:
+			edges.append((indices[source], indices[target]))
+	positions = [(node.x, node.y) for node in nodes]
+	return nodes, positions, edges
+
+
+def applyLayout(nodes, positions):
+	"""Move the nodes to the positions computed for them, unless they were deleted in the meantime"""
+	for node, (x, y) in zip(nodes, positions):
+		if node.active:
+			node.move(x, y)
+
+
+def alignToGrid(value):
+	return math.floor(value / GRID_SIZE + .5) * GRID_SIZE
+
+
+def gridSpiral(step=GRID_SIZE, radius=0):
+	"""Yield the offsets of the points of a grid with the spacing `step` around the origin, in rings of increasing distance,
+	starting with the ring `radius` steps away"""
+	if radius == 0:
+		yield 0, 0
+		radius = 1
+	while True:
+		ring = [(dx, dy) for dx in range(-radius, radius + 1) for dy in (-radius, radius)]
+		ring += [(dx, dy) for dx in (-radius, radius) for dy in range(-radius + 1, radius)]
+		ring.sort(key=lambda offset: offset[0] * offset[0] + offset[1] * offset[1])
+		for dx, dy in ring:
+			yield dx * step, dy * step
+		radius += 1
+
+
+def placeOnGrid(positions, distance):
+	"""Align the positions to the grid. A node that would be closer than `distance` to a node placed before it
+	is moved to the nearest grid point where it is not. Beyond `distance`, only grid points `distance` apart are tried,
+	so that nodes in a crowded region do not have to try every grid point on their way out of it."""
+	placed = SpatialHash(distance)
+	result = []
+	fine = max(1, distance // GRID_SIZE)
+	for i, (x, y) in enumerate(positions):
+		x = alignToGrid(x)
+		y = alignToGrid(y)
+		offsets = itertools.chain(
+			itertools.islice(gridSpiral(), (2 * fine + 1) ** 2),
+			gridSpiral(fine * GRID_SIZE, 2),
+		)
+		for dx, dy in offsets:
+			px = x + dx
+			py = y + dy
+			near = placed.query(px - distance, py - distance, px + distance, py + distance)
+			if not any(math.hypot(px - result[j][0], py - result[j][1]) < distance for j in near):
+				break
+		placed.insert(i, px, py, px, py)
+		result.append((px, py))
+	return result
+
+
+def acyclicEdges(count, edges):
+	"""Return `edges` without loops, and with the edges that close cycles reversed, found by a depth-first search"""
+	successors = [[] for i in range(count)]
+	for source, target in edges:
+		if source != target:
+			successors[source].append(target)
+
+	result = []
+	state = [0] * count # 0: not visited, 1: on the stack, 2: finished
+	for start in range(count):
+		if state[start]:
+			continue
+		state[start] = 1
+		stack = [(start, iter(successors[start]))]
+		while stack:
+			node, children = stack[-1]
+			for child in children:
+				if state[child] == 1:
+					result.append((child, node))
+				else:
+					result.append((node, child))
+					if state[child] == 0:
+						state[child] = 1
+						stack.append((child, iter(successors[child])))
+						break
+			else:
+				state[node] = 2
+				stack.pop()
+	return result
+
+
+def layeredLayout(positions, edges, distance=4 * GRID_SIZE, layerDistance=6 * GRID_SIZE, sweeps=8):
+	"""Return positions for the nodes at `positions`, connected by the directed `edges`, in layers from left to right.
+
+	Cycles are broken by reversing edges, and every node is put into the layer after the longest path leading to it.
+	Edges that span several layers get dummy nodes in the layers in between. The order of the nodes in the layers starts
+	from their current vertical order and is improved by sorting them by the mean position of their neighbours,
+	sweeping down and up through the layers. Nodes in a layer are `distance` apart, and layers `layerDistance`."""
+	count = len(positions)
+	if count == 0:
+		return []
+
+	edges = acyclicEdges(count, edges)
+	successors = [[] for i in range(count)]
+	incoming = [0] * count
+	for source, target in edges:
+		successors[source].append(target)
+		incoming[target] += 1
+
+	# Longest path layering, in topological order
+	layer = [0] * count
+	queue = [node for node in range(count) if incoming[node] == 0]
+	for node in queue:
+		for target in successors[node]:
+			layer[target] = max(layer[target], layer[node] + 1)
+			incoming[target] -= 1
+			if incoming[target] == 0:
+				queue.append(target)
+
+	# Dummy nodes split edges that span several layers, they are numbered after the real nodes
+	up = [[] for i in range(count)]
+	down = [[] for i in range(count)]
+	nodeLayer = layer[:]
+	for source, target in edges:
+		previous = source
+		for l in range(layer[source] + 1, layer[target]):
+			dummy = len(nodeLayer)
+			nodeLayer.append(l)
+			up.append([previous])
+			down.append([])
+			down[previous].append(dummy)
+			previous = dummy
+		down[previous].append(target)
+		up[target].append(previous)
+
+	layers = [[] for i in range(max(nodeLayer) + 1)]
+	for node in sorted(range(len(nodeLayer)), key=lambda node: positions[node][1] if node < count else 0):
+		layers[nodeLayer[node]].append(node)
+
+	order = [0] * len(nodeLayer)
+	def updateOrder(nodes):
+		for index, node in enumerate(nodes):
+			order[node] = index
+	for nodes in layers:
+		updateOrder(nodes)
+
+	def barycenter(node, neighbours):
+		if neighbours[node]:
+			return sum(order[n] for n in neighbours[node]) / len(neighbours[node])
+		return order[node]
+
+	for sweep in range(sweeps):
+		if sweep % 2 == 0:
+			indices, neighbours = range(1, len(layers)), up
+		else:
+			indices, neighbours = range(len(layers) - 2, -1, -1), down
+		for l in indices:
+			layers[l].sort(key=lambda node: barycenter(node, neighbours))
+			updateOrder(layers[l])
+
+	result = [None] * count
+	for l, nodes in enumerate(layers):
+		offset = (len(nodes) - 1) / 2
+		for index, node in enumerate(nodes):
+			if node < count:
+				result[node] = (l * layerDistance, (index - offset) * distance)
+	return placeOnGrid(result, NODE_DISTANCE)
+
+
+class QuadTree:
+	"""A Barnes-Hut quadtree over points, where every cell knows the number of points in it and their center of mass"""
+	__slots__ = ("size", "mass", "cx", "cy", "points", "children")
+	minSize = 1e-3 #: Cells smaller than this are not split, so that coinciding points do not recurse forever
+
+	def __init__(self, xs, ys, points, x, y, size):
+		self.size = size
+		self.mass = len(points)
+		self.cx = sum(xs[p] for p in points) / self.mass
+		self.cy = sum(ys[p] for p in points) / self.mass
+		self.points = None
+		self.children = None
+
+		if self.mass == 1 or size < self.minSize:
+			self.points = points
+			return
+
+		half = size / 2
+		midx = x + half
+		midy = y + half
+		quadrants = ([], [], [], [])
+		for p in points:
+			quadrants[(xs[p] >= midx) + 2 * (ys[p] >= midy)].append(p)
+		self.children = [
+			QuadTree(xs, ys, quadrant, x + half * (i & 1), y + half * (i >> 1), half)
+			for i, quadrant in enumerate(quadrants) if quadrant
+		]
+
+	@classmethod
+	def build(cls, xs, ys):
+		x = min(xs)
+		y = min(ys)
+		size = max(max(xs) - x, max(ys) - y) + 1
+		return cls(xs, ys, list(range(len(xs))), x, y, size)
+
+	def repulsion(self, xs, ys, point, strength, theta):
+		"""Return the force that pushes `point` away from the other points, which is `strength` divided by the distance for every point.
+		Cells that look smaller than `theta` from the point act as a single point at their center of mass."""
+		x = xs[point]
+		y = ys[point]
+		theta2 = theta * theta
+		fx = fy = 0
+		stack = [self]
+		pop = stack.pop
+		extend = stack.extend
+		while stack:
+			cell = pop()
+			points = cell.points
+			if points is not None:
+				for other in points:
+					if other != point:
+						dx = x - xs[other]
+						dy = y - ys[other]
+						f = strength / max(dx * dx + dy * dy, 1e-2)
+						fx += dx * f
+						fy += dy * f
+				continue
+			dx = x - cell.cx
+			dy = y - cell.cy
+			d2 = dx * dx + dy * dy
+			if cell.size * cell.size < theta2 * d2:
+				f = strength * cell.mass / d2
+				fx += dx * f
+				fy += dy * f
+			else:
+				extend(cell.children)
+		return fx, fy
+
+
+def spread(xs, ys, distance):
+	"""Scale the positions around their center if their bounding box is too small to hold them `distance` apart,
+	so that :py:func:`placeOnGrid` does not have to move many nodes far away"""
+	width = max(xs) - min(xs)
+	height = max(ys) - min(ys)
+	needed = len(xs) * (2 * distance) ** 2
+	area = max(width, distance) * max(height, distance)
+	if area < needed:
+		scale = math.sqrt(needed / area)
+		cx = (max(xs) + min(xs)) / 2
+		cy = (max(ys) + min(ys)) / 2
+		xs[:] = [cx + (x - cx) * scale for x in xs]
+		ys[:] = [cy + (y - cy) * scale for y in ys]
+
+
+def forceLayout(positions, edges, distance=8 * GRID_SIZE, iterations=50, theta=1, seed=0):
+	"""Return positions for the nodes at `positions` connected by `edges`, computed by the force-directed algorithm of Fruchterman and Reingold.
+	Connected nodes attract each other, all nodes repel each other, and the movement is limited by a temperature that decreases with every iteration.
+	`distance` is the ideal length of an edge. The repulsion is approximated with a :py:class:`QuadTree`, with the accuracy parameter `theta`."""
+	count = len(positions)
+	if count == 0:
+		return []
+
+	# A little noise separates nodes at the same position, the seed makes the result reproducible
+	rng = random.Random(seed)
+	xs = [x + rng.uniform(-1, 1) for x, y in positions]
+	ys = [y + rng.uniform(-1, 1) for x, y in positions]
+
+	# Nodes that all start at nearly the same place are spread over a square first
+	extent = math.sqrt(count) * distance
+	if max(xs) - min(xs) < distance and max(ys) - min(ys) < distance:
+		xs = [rng.uniform(0, extent) for i in range(count)]
+		ys = [rng.uniform(0, extent) for i in range(count)]
+
+	strength = distance * distance
+	temperature = extent / 10
+	for iteration in range(iterations):
+		tree = QuadTree.build(xs, ys)
+		forces = [tree.repulsion(xs, ys, point, strength, theta) for point in range(count)]
+		fxs = [f[0] for f in forces]
+		fys = [f[1] for f in forces]
+
+		for source, target in edges:
+			dx = xs[source] - xs[target]
+			dy = ys[source] - ys[target]
+			d = math.sqrt(dx * dx + dy * dy)
+			fxs[source] -= dx * d / distance
+			fys[source] -= dy * d / distance
+			fxs[target] += dx * d / distance
+			fys[target] += dy * d / distance
+
+		step = temperature * (1 - iteration / iterations)
+		for point in range(count):
+			length = math.sqrt(fxs[point] ** 2 + fys[point] ** 2)
+			if length > 0:
+				scale = min(length, step) / length
+				xs[point] += fxs[point] * scale
+				ys[point] += fys[point] * scale
+
+	spread(xs, ys, ENTERPRISE_DISTANCE)
+	return placeOnGrid(list(zip(xs, ys)), ENTERPRISE_DISTANCE)
+
+
+def layoutEnterprise(enterprise):
+	"""Lay out the workflow net of the enterprise `enterprise` (a :py:class:`~in_toolset.model.ui.UIPetriNet`) in layers"""
+	nodes, positions, edges = graphData(enterprise.graph)
+	applyLayout(nodes, layeredLayout(positions, edges))
+
+
+def layoutIndustry(industry):
+	"""Lay out the enterprises in the industry graph with the force-directed layout"""
+	nodes, positions, edges = graphData(industry.graph)
+	applyLayout(nodes, forceLayout(positions, edges))
+
+
+class LayoutJob:
+	"""Computes the layout of a graph in a worker thread.
+	The graph is read when the job is created, and the result is applied to the nodes by :py:meth:`poll`,
+	which must be called from the thread that changes the model, e.g. from a timer of the editor.
+	`layout` is :py:func:`layeredLayout`, :py:func:`forceLayout` or another function with the same arguments."""
+	def __init__(self, graph, layout):
+		self.nodes, positions, edges = graphData(graph)
+		self.result = None
+		self.error = None
+
+		self.finished = Signal() #: Emitted by :py:meth:`poll` after the layout was applied
+
+		self.thread = threading.Thread(target=self.run, args=(layout, positions, edges), daemon=True)
+		self.thread.start()
+
+	def run(self, layout, positions, edges):
+		try:
+			self.result = layout(positions, edges)
+		except Exception as e:
+			self.error = e
+
+	def isRunning(self):
+		return self.thread.is_alive()
+
+	def poll(self):
+		"""Apply the layout if it is finished and return whether the job is done.
+		If the computation failed, the exception is raised here."""
+		if self.thread.is_alive():
+			return False
+		if self.error is not None:
+			raise self.error
+		if self.result is not None:
+			applyLayout(self.nodes, self.result)
+			self.result = None
+			self.finished.emit()
+		return True
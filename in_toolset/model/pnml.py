@@ -1,6 +1,23 @@
-from PyQt5.QtCore import QXmlStreamWriter
-from .base import Place, Transition
-from .ui import UIInternalArrow, UIChannelArrow
+"""Import and export of petri nets in PNML format.
+
+Both directions are implemented in pure python and stream their data, so that large nets can be converted without PyQt5 and in bounded memory."""
+
+from ..common import gcPaused
+from .base import Place, Transition, PetriNet
+from .ui import UIPetriNet, UITransition, UINode, UIInternalArrow, UILooseArrow
+
+NET_TYPE = "http://www.pnml.org/version-2009/grammar/pnmlcoremodel"
+
+# Not using xml.sax.saxutils.escape, as importing it pulls in urllib and slows down the startup of the editor
+ATTRIBUTE_ENTITIES = (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;"), ('"', "&quot;"), ("\n", "&#10;"), ("\r", "&#13;"), ("\t", "&#9;"))
+
+
+def escape(text):
+	"""Escape `text` for use in a double-quoted attribute value"""
+	for char, entity in ATTRIBUTE_ENTITIES:
+		text = text.replace(char, entity)
+	return text
+
 
 class PNMLWriter:
 	"""Allows exporting a petrinet and a graph in PNML format"""
@@ -9,66 +26,206 @@ class PNMLWriter:
 		self.net = net
 		self.graph = graph
 
+	def writeElement(self, tag, **attributes):
+		text = "".join(' %s="%s"' %(name, escape(str(value))) for name, value in attributes.items())
+		self.file.write("            <%s%s/>\n" %(tag, text))
+
 	def save(self, file):
-		"""Write petrinet corresponding to `self.net` and `self.graph` to `file` in PNML format"""
+		"""Write petrinet corresponding to `self.net` and `self.graph` to the text file object `file` in PNML format"""
+		self.file = file
 		dictionary = {}
 		id = 0
-		stream = QXmlStreamWriter(file)
-		stream.setAutoFormatting(True)
-		stream.writeStartDocument()
-		stream.writeStartElement("pnml")
-		stream.writeStartElement("net")
-		stream.writeAttribute("id", str(id))
+		file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+		file.write("<pnml>\n")
+		file.write('    <net id="%i" type="%s">\n' %(id, NET_TYPE))
 		id += 1
-		stream.writeAttribute("type", "http://www.pnml.org/version-2009/grammar/pnmlcoremodel")
-		stream.writeStartElement("page")
-		stream.writeAttribute("id", str(id))
+		file.write('        <page id="%i">\n' %id)
 		id += 1
 		for enterprise in self.graph.nodes:
 			graph = enterprise.obj.graph
 
 			for node in graph.nodes:
+				dictionary[node.obj] = id
 				if isinstance(node.obj, Place):
-					stream.writeStartElement("place")
+					self.writeElement("place", id=id, name=node.label.text, initialMarking=node.obj.tokens)
 				else:
-					stream.writeStartElement("transition")
-				stream.writeAttribute("id", str(id))
-				dictionary[node.obj] = id
+					self.writeElement("transition", id=id, name=node.label.text)
 				id += 1
-				stream.writeAttribute("name", str(node.label.text))
-				if isinstance(node.obj, Place):
-					stream.writeAttribute("initialMarking", str(node.obj.tokens))
-				stream.writeEndElement()
 			for arrow in graph.arrows:
-				stream.writeStartElement("arc")
-				stream.writeAttribute("id", str(id))
+				self.writeElement("arc", id=id, source=dictionary[arrow.source.obj], target=dictionary[arrow.target.obj])
 				id += 1
-				stream.writeAttribute("source", str(dictionary[arrow.source.obj]))
-				stream.writeAttribute("target", str(dictionary[arrow.target.obj]))
-				stream.writeEndElement()
 		for arrow in self.graph.arrows:
-			stream.writeStartElement("place")
-			channel = str(id)
-			stream.writeAttribute("id", channel)
-			id += 1
-			stream.writeAttribute("name", str(arrow.source.transition.message))
-			stream.writeEndElement()
-
-			stream.writeStartElement("arc")
-			stream.writeAttribute("id", str(id))
-			id += 1
-			stream.writeAttribute("source", str(dictionary[arrow.source.transition]))
-			stream.writeAttribute("target", channel)
-			stream.writeEndElement()
-
-			stream.writeStartElement("arc")
-			stream.writeAttribute("id", str(id))
-			id += 1
-			stream.writeAttribute("source", channel)
-			stream.writeAttribute("target", str(dictionary[arrow.target.transition]))
-			stream.writeEndElement()
-		stream.writeEndElement()
-		stream.writeEndElement()
-		stream.writeEndElement()
-		stream.writeEndDocument()
-		file.close()
+			channel = id
+			self.writeElement("place", id=channel, name=arrow.source.transition.message)
+			self.writeElement("arc", id=id + 1, source=dictionary[arrow.source.transition], target=channel)
+			self.writeElement("arc", id=id + 2, source=channel, target=dictionary[arrow.target.transition])
+			id += 3
+		file.write("        </page>\n")
+		file.write("    </net>\n")
+		file.write("</pnml>\n")
+
+
+def localName(tag):
+	"""Strip the namespace from an element tag"""
+	return tag.rsplit("}", 1)[-1]
+
+
+class PNMLReader:
+	"""Reads PNML files incrementally, removing every node and arc element from the document once it has been processed.
+
+	Both the attribute-based format written by :py:class:`~in_toolset.model.pnml.PNMLWriter`
+	and the standard format with ``<name>`` and ``<initialMarking>`` child elements are supported.
+	Arc inscriptions are ignored, as all arcs in our nets have weight 1."""
+
+	spacing = 80 #: The distance between generated node positions
+	columns = 50 #: The number of nodes in a row of generated node positions
+
+	def __init__(self):
+		self.nodes = None
+
+	def load(self, file):
+		"""Read `file` (a filename or binary file object) into a single :py:class:`~in_toolset.model.base.PetriNet`"""
+		self.industry = None
+		self.net = PetriNet()
+		self.parse(file)
+		return self.net
+
+	def loadIndustry(self, file):
+		"""Read `file` into an industry (a :py:class:`~in_toolset.model.ui.UIPetriNet`) containing one enterprise for each net in the file.
+		The nodes are positioned on a grid, as PNML files do not necessarily contain positions."""
+		self.industry = UIPetriNet()
+		self.parse(file)
+		return self.industry
+
+	def parse(self, file):
+		with gcPaused():
+			self.parseElements(file)
+
+	def parseElements(self, file):
+		import xml.etree.ElementTree as ElementTree # Only needed when importing, see escape
+
+		stack = []
+		for event, element in ElementTree.iterparse(file, ("start", "end")):
+			tag = localName(element.tag)
+			if event == "start":
+				if tag == "net":
+					self.startNet()
+				stack.append(element)
+				continue
+
+			stack.pop()
+			if self.nodes is None and tag in ("place", "transition", "arc"):
+				self.startNet() # Be lenient towards nodes outside of a net
+			if tag == "place":
+				self.addPlace(element.get("id"), self.getName(element), self.getMarking(element))
+			elif tag == "transition":
+				self.addTransition(element.get("id"), self.getName(element))
+			elif tag == "arc":
+				self.addArc(element.get("id"), element.get("source"), element.get("target"))
+			else:
+				continue
+
+			if stack:
+				stack[-1].remove(element)
+		self.finishNet()
+
+	def getName(self, element):
+		name = element.get("name")
+		if name is None:
+			name = self.getText(element, "name")
+		return name or ""
+
+	def getMarking(self, element):
+		marking = element.get("initialMarking")
+		if marking is None:
+			marking = self.getText(element, "initialMarking")
+		try:
+			return int(marking)
+		except (TypeError, ValueError):
+			return 0
+
+	def getText(self, element, name):
+		for child in element:
+			if localName(child.tag) == name:
+				for text in child:
+					if localName(text.tag) == "text":
+						return (text.text or "").strip()
+		return None
+
+	def startNet(self):
+		self.finishNet()
+
+		self.nodes = {}
+		self.uinodes = {}
+		self.arcs = []
+		self.transitions = []
+		if self.industry is not None:
+			self.enterprise = UIPetriNet()
+			self.net = self.enterprise.net
+
+	def finishNet(self):
+		if self.nodes is None:
+			return
+
+		# Arcs may refer to nodes defined after them
+		for id, source, target in self.arcs:
+			self.connect(id, source, target)
+
+		if self.industry is not None:
+			index = len(self.industry.graph.nodes)
+			node = UINode(self.enterprise)
+			node.label.setText("e%i" %(index + 1))
+			node.move(index * self.spacing, 0)
+			self.industry.graph.nodes.add(node)
+
+			# The arrows are only shown once the transition becomes an input or output transition
+			for transition in self.transitions:
+				self.industry.graph.looseArrows.add(UILooseArrow(node, transition))
+		self.nodes = None
+
+	def addNode(self, id, obj, name):
+		if self.industry is not None:
+			index = len(self.nodes)
+			node = UINode(obj)
+			node.move(index % self.columns * self.spacing, index // self.columns * self.spacing)
+			node.label.setText(name)
+			self.enterprise.graph.nodes.add(node)
+			self.uinodes[id] = node
+		self.nodes[id] = obj
+
+	def addPlace(self, id, name, tokens):
+		place = Place()
+		place.tokens = tokens
+		self.net.places.add(place)
+		if self.industry is not None:
+			self.industry.net.places.add(place)
+		self.addNode(id, place, name)
+
+	def addTransition(self, id, name):
+		if self.industry is not None:
+			transition = UITransition()
+			self.industry.net.transitions.add(transition)
+		else:
+			transition = Transition()
+		self.net.transitions.add(transition)
+		self.addNode(id, transition, name)
+		if self.industry is not None:
+			self.enterprise.graph.looseArrows.add(UILooseArrow(self.uinodes[id], transition))
+			self.transitions.append(transition)
+
+	def addArc(self, id, source, target):
+		if source in self.nodes and target in self.nodes:
+			self.connect(id, source, target)
+		else:
+			self.arcs.append((id, source, target))
+
+	def connect(self, id, source, target):
+		if source not in self.nodes or target not in self.nodes:
+			raise ValueError("Arc %s refers to an unknown node" %id)
+		if isinstance(self.nodes[source], Place) == isinstance(self.nodes[target], Place):
+			raise ValueError("Arc %s connects two nodes of the same type" %id)
+		if self.industry is not None:
+			arrow = UIInternalArrow(self.uinodes[source], self.uinodes[target])
+			self.enterprise.graph.arrows.add(arrow)
+		else:
+			self.nodes[source].connect(self.nodes[target])
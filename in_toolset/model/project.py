@@ -1,11 +1,12 @@
 
-from ..common import Signal, Property
+from ..common import Signal, Property, gcPaused
 from .base import *
 from .ui import *
-from .pnml import *
-from PyQt5.QtCore import QFile
-from PyQt5.QtCore import QIODevice
+from .pnml import PNMLWriter, PNMLReader
+from .binary import BinaryProjectReader, BinaryProjectWriter, isBinaryProject
+import contextlib
 import json
+import os
 
 
 class ProjectReader:
@@ -36,6 +37,7 @@ class ProjectReader:
 			transition = UITransition()
 			transition.type = info["type"]
 			transition.message = info["message"]
+			transition.delay = info.get("delay", "")
 			self.transitions.append(transition)
 
 	def loadEnterprises(self, data):
@@ -88,8 +90,7 @@ class ProjectReader:
 			graph.arrows.add(arrow)
 
 	def loadPosition(self, obj, data):
-		obj.x = data[0]
-		obj.y = data[1]
+		obj.move(data[0], data[1])
 
 	def loadLabel(self, label, data):
 		label.text = data["text"]
@@ -126,23 +127,28 @@ class ProjectWriter:
 		transitions = []
 		for trans in industry.net.transitions:
 			trans.id = len(transitions)
-			transitions.append({
+			info = {
 				"type": trans.type,
 				"message": trans.message
-			})
+			}
+			if trans.delay:
+				info["delay"] = trans.delay
+			transitions.append(info)
 		return transitions
 
 	def saveEnterprises(self, industry):
 		enterprises = []
 		for node in industry.graph.nodes:
 			node.obj.id = len(enterprises)
-			enterprise = {
-				"net": self.savePetriNet(node.obj.net),
-				"graph": self.saveGraph(node.obj.graph)
-			}
-			enterprises.append(enterprise)
+			enterprises.append(self.saveEnterprise(node.obj))
 		return enterprises
 
+	def saveEnterprise(self, enterprise):
+		return {
+			"net": self.savePetriNet(enterprise.net),
+			"graph": self.saveGraph(enterprise.graph)
+		}
+
 	def savePetriNet(self, net):
 		places = []
 		for place in net.places:
@@ -215,6 +221,52 @@ class ProjectWriter:
 		raise ValueError("This should never happen")
 
 
+BINARY_EXTENSION = ".flowb" #: Projects saved with this extension are written in the binary format of :py:mod:`in_toolset.model.binary`
+
+
+@contextlib.contextmanager
+def atomicOpen(filename, mode="w", **options):
+	"""Open a temporary file for writing, that replaces `filename` once the `with` block finishes successfully.
+	This way, a crash during saving never leaves a half-written file behind."""
+	temporary = filename + ".tmp"
+	try:
+		with open(temporary, mode, **options) as f:
+			yield f
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(temporary, filename)
+	finally:
+		if os.path.exists(temporary):
+			os.remove(temporary)
+
+
+def loadIndustry(filename):
+	"""Load the industry stored in `filename`, in either the json-based or the binary project format"""
+	with gcPaused():
+		if isBinaryProject(filename):
+			return BinaryProjectReader().load(filename)
+		with open(filename) as f:
+			data = json.load(f)
+		return ProjectReader().load(data)
+
+
+def saveIndustry(industry, filename):
+	"""Save `industry` to `filename`, using the binary project format if `filename` ends with :py:data:`BINARY_EXTENSION`"""
+	with gcPaused():
+		if filename.endswith(BINARY_EXTENSION):
+			with atomicOpen(filename, "wb") as f:
+				BinaryProjectWriter().save(industry, f)
+		else:
+			data = ProjectWriter().save(industry)
+			with atomicOpen(filename) as f:
+				json.dump(data, f)
+
+
+def convertProject(source, target):
+	"""Convert the project file `source` to `target`, the formats being chosen as in :py:func:`loadIndustry` and :py:func:`saveIndustry`"""
+	saveIndustry(loadIndustry(source), target)
+
+
 class Project:
 	filename = Property("filenameChanged")
 	unsaved = Property("unsavedChanged", False)
@@ -236,25 +288,27 @@ class Project:
 	def setUnsaved(self, unsaved=True): self.unsaved = unsaved
 
 	def load(self, filename):
-		with open(filename) as f:
-			data = json.load(f)
-
-		self.industry = self.reader.load(data)
+		self.industry = loadIndustry(filename)
 		self.industry.changed.connect(self.setUnsaved)
 
 		self.setFilename(filename)
 		self.setUnsaved(False)
 
 	def save(self, filename):
-		data = self.writer.save(self.industry)
-		with open(filename, "w") as f:
-			json.dump(data, f)
+		saveIndustry(self.industry, filename)
 
 		self.setFilename(filename)
 		self.setUnsaved(False)
 
 	def export(self, exportname):
 		writer = PNMLWriter(self.industry.net, self.industry.graph)
-		file = QFile(exportname)
-		if file.open(QIODevice.WriteOnly):
-			stream = writer.save(file)
+		with atomicOpen(exportname, encoding="utf-8") as f:
+			writer.save(f)
+
+	def importNet(self, filename):
+		"""Replace the industry by the nets in the PNML file `filename`, each net becoming an enterprise"""
+		self.industry = PNMLReader().loadIndustry(filename)
+		self.industry.changed.connect(self.setUnsaved)
+
+		self.setFilename(None)
+		self.setUnsaved(True)
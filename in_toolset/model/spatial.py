@@ -0,0 +1,286 @@
+"""A spatial index for finding objects near a point or inside a rectangle, without looking at every object,
+and the geometry of arrows for hit-testing them without building paths."""
+
+from ..common import Signal, SignalListener
+import math
+
+
+def segmentDistance(x, y, x1, y1, x2, y2):
+	"""Return the distance of the point (`x`, `y`) to the line segment from (`x1`, `y1`) to (`x2`, `y2`)"""
+	dx = x2 - x1
+	dy = y2 - y1
+	lengthSq = dx * dx + dy * dy
+	if lengthSq == 0:
+		return math.hypot(x - x1, y - y1)
+	t = min(max(((x - x1) * dx + (y - y1) * dy) / lengthSq, 0), 1)
+	return math.hypot(x - x1 - t * dx, y - y1 - t * dy)
+
+
+class SpatialHash:
+	"""Stores axis-aligned bounding rectangles of objects in a grid of square cells.
+
+	Inserting, moving and removing an object takes time proportional to the number of cells it covers,
+	and a query only looks at the objects in the cells covered by the query.
+	The objects must be hashable; the rectangles are given as ``(x1, y1, x2, y2)`` with ``x1 <= x2`` and ``y1 <= y2``."""
+	def __init__(self, cellSize=100):
+		self.cellSize = cellSize
+		self.cells = {}
+		self.rects = {}
+		self.ranges = {}
+
+	def __len__(self): return len(self.rects)
+	def __contains__(self, obj): return obj in self.rects
+
+	def cellRange(self, x1, y1, x2, y2):
+		size = self.cellSize
+		return int(x1 // size), int(y1 // size), int(x2 // size), int(y2 // size)
+
+	def insert(self, obj, x1, y1, x2, y2):
+		"""Add `obj` with the given bounding rectangle, or move it if it is already in the index"""
+		cells = self.cellRange(x1, y1, x2, y2)
+		self.rects[obj] = (x1, y1, x2, y2)
+
+		previous = self.ranges.get(obj)
+		if previous == cells:
+			return
+		if previous is not None:
+			self.removeFromCells(obj, previous)
+
+		self.ranges[obj] = cells
+		cx1, cy1, cx2, cy2 = cells
+		for cx in range(cx1, cx2 + 1):
+			for cy in range(cy1, cy2 + 1):
+				cell = self.cells.get((cx, cy))
+				if cell is None:
+					self.cells[cx, cy] = {obj}
+				else:
+					cell.add(obj)
+
+	def remove(self, obj):
+		"""Remove `obj` from the index, if it is in it"""
+		cells = self.ranges.pop(obj, None)
+		if cells is not None:
+			del self.rects[obj]
+			self.removeFromCells(obj, cells)
+
+	def removeFromCells(self, obj, cells):
+		cx1, cy1, cx2, cy2 = cells
+		for cx in range(cx1, cx2 + 1):
+			for cy in range(cy1, cy2 + 1):
+				cell = self.cells[cx, cy]
+				cell.discard(obj)
+				if not cell:
+					del self.cells[cx, cy]
+
+	def clear(self):
+		self.cells = {}
+		self.rects = {}
+		self.ranges = {}
+
+	def rect(self, obj):
+		"""Return the bounding rectangle `obj` was inserted with"""
+		return self.rects[obj]
+
+	def query(self, x1, y1, x2, y2):
+		"""Return the set of objects whose rectangles intersect the given rectangle"""
+		cx1, cy1, cx2, cy2 = self.cellRange(x1, y1, x2, y2)
+		if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > len(self.cells):
+			candidates = self.rects.keys() # Visiting every cell would be slower than checking every object
+		else:
+			candidates = set()
+			for cx in range(cx1, cx2 + 1):
+				for cy in range(cy1, cy2 + 1):
+					cell = self.cells.get((cx, cy))
+					if cell:
+						candidates.update(cell)
+
+		result = set()
+		rects = self.rects
+		for obj in candidates:
+			ox1, oy1, ox2, oy2 = rects[obj]
+			if ox1 <= x2 and x1 <= ox2 and oy1 <= y2 and y1 <= oy2:
+				result.add(obj)
+		return result
+
+	def queryPoint(self, x, y):
+		"""Return the set of objects whose rectangles contain the point (`x`, `y`)"""
+		size = self.cellSize
+		cell = self.cells.get((int(x // size), int(y // size)))
+		if not cell:
+			return set()
+
+		rects = self.rects
+		result = set()
+		for obj in cell:
+			x1, y1, x2, y2 = rects[obj]
+			if x1 <= x <= x2 and y1 <= y <= y2:
+				result.add(obj)
+		return result
+
+
+class GraphIndex:
+	"""Keeps the active nodes, arrows and loose arrows of a :py:class:`~in_toolset.model.ui.UIGraph` in a :py:class:`SpatialHash`,
+	and updates it when they are added, removed or moved.
+
+	Nodes and loose arrows are stored as squares of `radius` around their position,
+	arrows as the rectangle around their end points, widened by their curve and `radius`."""
+	def __init__(self, graph, radius=40, cellSize=200):
+		self.graph = graph
+		self.radius = radius
+		self.index = SpatialHash(cellSize)
+		self.nodes = set()
+		self.arrows = set()
+
+		self.changed = Signal() #: Emitted whenever an object is inserted, moved or removed
+
+		self.signals = SignalListener()
+		self.signals.connect(graph.nodes.added, self.addNode)
+		self.signals.connect(graph.nodes.removed, self.removePoint)
+		self.signals.connect(graph.arrows.added, self.addArrow)
+		self.signals.connect(graph.arrows.removed, self.removeArrow)
+		self.signals.connect(graph.looseArrows.added, self.addPoint)
+		self.signals.connect(graph.looseArrows.removed, self.removePoint)
+
+		for node in graph.nodes:
+			self.addNode(node)
+		for arrow in graph.arrows:
+			self.addArrow(arrow)
+		for arrow in graph.looseArrows:
+			self.addPoint(arrow)
+
+	def __len__(self): return len(self.index)
+	def __contains__(self, obj): return obj in self.index
+
+	def disconnect(self):
+		"""Stop following the changes of the graph and empty the index"""
+		self.signals.disconnect()
+		for obj in list(self.index.rects):
+			if obj in self.arrows:
+				self.removeArrow(obj)
+			else:
+				self.removePoint(obj)
+
+	def addNode(self, node):
+		self.nodes.add(node)
+		self.addPoint(node)
+
+	def addPoint(self, obj):
+		if obj not in self.index:
+			obj.positionChanged.connect(self.updatePoint, obj)
+		self.updatePoint(obj)
+
+	def removePoint(self, obj):
+		if obj in self.index:
+			obj.positionChanged.disconnect(self.updatePoint, obj)
+			self.index.remove(obj)
+			self.nodes.discard(obj)
+			self.changed.emit()
+
+	def updatePoint(self, obj):
+		r = self.radius
+		self.index.insert(obj, obj.x - r, obj.y - r, obj.x + r, obj.y + r)
+		self.changed.emit()
+
+	def addArrow(self, arrow):
+		if arrow not in self.index:
+			arrow.source.positionChanged.connect(self.updateArrow, arrow)
+			arrow.target.positionChanged.connect(self.updateArrow, arrow)
+			arrow.curveChanged.connect(self.updateArrow, arrow)
+			self.arrows.add(arrow)
+		self.updateArrow(arrow)
+
+	def removeArrow(self, arrow):
+		if arrow in self.index:
+			arrow.source.positionChanged.disconnect(self.updateArrow, arrow)
+			arrow.target.positionChanged.disconnect(self.updateArrow, arrow)
+			arrow.curveChanged.disconnect(self.updateArrow, arrow)
+			self.index.remove(arrow)
+			self.arrows.discard(arrow)
+			self.changed.emit()
+
+	def updateArrow(self, arrow):
+		source = arrow.source
+		target = arrow.target
+		# The curve of an arrow bends it by at most half of its value away from the straight line
+		extent = abs(arrow.curve) / 2 + self.radius
+		self.index.insert(
+			arrow,
+			min(source.x, target.x) - extent, min(source.y, target.y) - extent,
+			max(source.x, target.x) + extent, max(source.y, target.y) + extent
+		)
+		self.changed.emit()
+
+	def query(self, x1, y1, x2, y2):
+		"""Return the set of nodes, arrows and loose arrows whose rectangles intersect the given rectangle"""
+		return self.index.query(x1, y1, x2, y2)
+
+	def queryNodes(self, x1, y1, x2, y2):
+		"""Return the set of nodes whose rectangles intersect the given rectangle"""
+		return self.index.query(x1, y1, x2, y2) & self.nodes
+
+
+class ArrowGeometry:
+	"""The geometry of an arrow from (`x1`, `y1`) to (`x2`, `y2`), drawn as a quadratic curve whose control point is
+	`curve` away from the middle of the arrow, with two head lines of length `head` at its end.
+
+	The bounds are computed from the extremes of the curve, and the distance of a point to the arrow
+	from a polyline that approximates the curve, which is only built when it is needed.
+	Objects are compared by :py:attr:`key`, so that callers can skip updates that do not change the geometry."""
+	segments = 16 #: The number of line segments that approximate the curve
+
+	def __init__(self, x1, y1, x2, y2, curve=0, head=0):
+		self.key = (x1, y1, x2, y2, curve, head)
+		self.x1, self.y1 = x1, y1
+		self.x2, self.y2 = x2, y2
+		self.curve = curve
+		self.head = head
+
+		dx = x2 - x1
+		dy = y2 - y1
+		angle = math.atan2(dy, dx)
+		self.cx = (x1 + x2) / 2 + math.cos(angle + math.pi / 2) * curve
+		self.cy = (y1 + y2) / 2 + math.sin(angle + math.pi / 2) * curve
+
+		self.heads = []
+		if head:
+			headAngle = angle - math.atan2(curve, math.sqrt(dx * dx + dy * dy) / 2)
+			for offset in (math.pi * .75, -math.pi * .75):
+				self.heads.append((x2 + head * math.cos(headAngle + offset), y2 + head * math.sin(headAngle + offset)))
+
+		self.polyline = None
+
+	def point(self, t):
+		"""Return the point of the curve at `t`, which goes from 0 to 1"""
+		u = 1 - t
+		return (
+			u * u * self.x1 + 2 * u * t * self.cx + t * t * self.x2,
+			u * u * self.y1 + 2 * u * t * self.cy + t * t * self.y2
+		)
+
+	def bounds(self):
+		"""Return the bounding rectangle of the curve and the head as ``(x1, y1, x2, y2)``"""
+		points = [(self.x1, self.y1), (self.x2, self.y2)] + self.heads
+		for p0, p1, p2 in ((self.x1, self.cx, self.x2), (self.y1, self.cy, self.y2)):
+			# The curve has an extreme where its derivative along the axis is zero
+			denominator = p0 - 2 * p1 + p2
+			if denominator != 0:
+				t = (p0 - p1) / denominator
+				if 0 < t < 1:
+					points.append(self.point(t))
+		xs = [p[0] for p in points]
+		ys = [p[1] for p in points]
+		return min(xs), min(ys), max(xs), max(ys)
+
+	def distance(self, x, y):
+		"""Return the distance of the point (`x`, `y`) to the curve or the head"""
+		if self.polyline is None:
+			self.polyline = [self.point(i / self.segments) for i in range(self.segments + 1)]
+
+		points = self.polyline
+		distance = min(
+			segmentDistance(x, y, points[i][0], points[i][1], points[i + 1][0], points[i + 1][1])
+			for i in range(self.segments)
+		)
+		for hx, hy in self.heads:
+			distance = min(distance, segmentDistance(x, y, self.x2, self.y2, hx, hy))
+		return distance
@@ -0,0 +1,280 @@
+"""Statistics of simulations: how often every transition fired and how many tokens every place held over time.
+
+:py:class:`FiringStatistics` keeps the counters in arrays indexed like the places and transitions of a
+:py:class:`~in_toolset.model.compiled.CompiledNet`, so :py:meth:`~in_toolset.model.compiled.CompiledNet.run` can update them
+with a few array operations per firing. :py:class:`FiringRecorder` collects the same statistics from the model,
+for transitions triggered in the editor with :py:meth:`~in_toolset.model.base.Transition.trigger` or
+:py:meth:`~in_toolset.model.base.PetriNet.triggerRandom`.
+
+Time is counted in firings, unless the caller passes the duration of every firing. The token-time integral of a place
+is the sum of its number of tokens over time, divided by the elapsed time it is the average number of tokens."""
+
+from ..common import Signal, SignalListener
+from array import array
+
+
+class FiringStatistics:
+	"""Fire counts of transitions and token-time integrals of places, numbered from 0"""
+	def __init__(self, marking=(), transitions=0):
+		self.fired = array("q", bytes(8 * transitions)) #: The number of times every transition fired
+		self.tokenTime = array("d", bytes(8 * len(marking))) #: The token-time integral of every place up to its last change
+		self.tokens = array("q", marking) #: The number of tokens of every place since its last change
+		self.since = array("d", bytes(8 * len(marking))) #: The time of the last change of every place
+		self.time = 0.0 #: The time since the statistics were started
+
+	@classmethod
+	def forNet(cls, net):
+		"""Return empty statistics for the :py:class:`~in_toolset.model.compiled.CompiledNet` `net`, starting at its current marking"""
+		return cls(net.marking, net.transitionCount())
+
+	def placeCount(self): return len(self.tokens)
+	def transitionCount(self): return len(self.fired)
+
+	def addPlace(self, tokens=0):
+		"""Add a place containing `tokens` tokens and return its index"""
+		self.tokenTime.append(0)
+		self.tokens.append(tokens)
+		self.since.append(self.time)
+		return len(self.tokens) - 1
+
+	def addTransition(self):
+		"""Add a transition and return its index"""
+		self.fired.append(0)
+		return len(self.fired) - 1
+
+	def setTokens(self, place, tokens):
+		"""Record that the number of tokens of `place` changed to `tokens` at the current time"""
+		self.tokenTime[place] += self.tokens[place] * (self.time - self.since[place])
+		self.tokens[place] = tokens
+		self.since[place] = self.time
+
+	def recordFiring(self, transition, preset, postset, marking, duration=1):
+		"""Record that `transition` fired and changed the places in `preset` and `postset` to their tokens in `marking`,
+		then advance the time by `duration`"""
+		tokenTime, tokens, since, now = self.tokenTime, self.tokens, self.since, self.time
+		for place in preset:
+			tokenTime[place] += tokens[place] * (now - since[place])
+			tokens[place] = marking[place]
+			since[place] = now
+		for place in postset:
+			tokenTime[place] += tokens[place] * (now - since[place])
+			tokens[place] = marking[place]
+			since[place] = now
+		self.fired[transition] += 1
+		self.time = now + duration
+
+	def tokenTimes(self):
+		"""Return the token-time integral of every place up to the current time"""
+		return array("d", (
+			total + tokens * (self.time - since) for total, tokens, since in zip(self.tokenTime, self.tokens, self.since)
+		))
+
+	def averageTokens(self):
+		"""Return the average number of tokens of every place, or the current number if no time has passed"""
+		if self.time <= 0:
+			return array("d", self.tokens)
+		return array("d", (total / self.time for total in self.tokenTimes()))
+
+	def totalFired(self):
+		return sum(self.fired)
+
+	def reset(self, marking=None):
+		"""Clear the statistics and start again at time 0, with the tokens in `marking` if it is given"""
+		places = len(self.tokens)
+		self.fired = array("q", bytes(8 * len(self.fired)))
+		self.tokenTime = array("d", bytes(8 * places))
+		self.since = array("d", bytes(8 * places))
+		if marking is not None:
+			self.tokens = array("q", marking)
+		self.time = 0.0
+
+
+class FiringRecorder:
+	"""Collects :py:class:`FiringStatistics` for the places and transitions of the net of an industry while it is simulated in the model,
+	numbering them in the order in which they are added to the net. Places and transitions added later are included,
+	deleted ones keep their numbers, so that they can be restored."""
+	def __init__(self, industry):
+		self.industry = industry
+		self.statistics = FiringStatistics()
+		self.places = {} #: Maps the places to their numbers
+		self.transitions = {} #: Maps the transitions to their numbers
+		self.changed = Signal() #: Emitted when the statistics changed, after a firing or a reset
+
+		self.signals = SignalListener()
+		self.signals.connect(industry.net.places.added, self.addPlace)
+		self.signals.connect(industry.net.transitions.added, self.addTransition)
+
+		for place in industry.net.places:
+			self.addPlace(place)
+		for transition in industry.net.transitions:
+			self.addTransition(transition)
+
+	def disconnect(self):
+		"""Stop following the net"""
+		self.signals.disconnect()
+		for place in self.places:
+			place.tokensChanged.disconnect(self.updatePlace, place)
+		for transition in self.transitions:
+			transition.triggered.disconnect(self.recordFiring, transition)
+		self.places = {}
+		self.transitions = {}
+
+	def addPlace(self, place):
+		if place not in self.places:
+			self.places[place] = self.statistics.addPlace(place.tokens)
+			place.tokensChanged.connect(self.updatePlace, place)
+
+	def addTransition(self, transition):
+		if transition not in self.transitions:
+			self.transitions[transition] = self.statistics.addTransition()
+			transition.triggered.connect(self.recordFiring, transition)
+
+	def updatePlace(self, place):
+		self.statistics.setTokens(self.places[place], place.tokens)
+
+	def recordFiring(self, transition):
+		# The tokens were already moved, and recorded by updatePlace
+		self.statistics.fired[self.transitions[transition]] += 1
+		self.statistics.time += 1
+		self.changed.emit()
+
+	def reset(self):
+		"""Clear the statistics, starting again from the current marking"""
+		self.statistics.reset([place.tokens for place in self.places])
+		self.changed.emit()
+
+	def merge(self, statistics, net):
+		"""Add the fire counts and the token-time integrals of `statistics`, collected by running the
+		:py:class:`~in_toolset.model.compiled.CompiledNet` `net` that was compiled from the industry, and advance the time by its time"""
+		own = self.statistics
+		for index in range(own.placeCount()):
+			own.setTokens(index, own.tokens[index])
+
+		for place, total in zip(net.places, statistics.tokenTimes()):
+			index = self.places.get(place)
+			if index is not None:
+				own.tokenTime[index] += total
+		for transition, count in zip(net.transitions, statistics.fired):
+			index = self.transitions.get(transition)
+			if index is not None:
+				own.fired[index] += count
+
+		# The tokens of the model did not count during the merged time
+		own.time += statistics.time
+		for index in range(own.placeCount()):
+			own.since[index] = own.time
+		self.changed.emit()
+
+	def fired(self, transition):
+		"""Return how often `transition` fired"""
+		index = self.transitions.get(transition)
+		return 0 if index is None else self.statistics.fired[index]
+
+	def averageTokens(self, place):
+		"""Return the average number of tokens in `place`"""
+		index = self.places.get(place)
+		if index is None:
+			return 0
+		statistics = self.statistics
+		if statistics.time <= 0:
+			return statistics.tokens[index]
+		total = statistics.tokenTime[index] + statistics.tokens[index] * (statistics.time - statistics.since[index])
+		return total / statistics.time
+
+
+class HeatMap:
+	"""Scales the statistics of a :py:class:`FiringRecorder` to values from 0 to 1, relative to the largest value in the industry,
+	for colouring the nodes and channels of the editor. The largest values are only computed again after the statistics changed."""
+	def __init__(self, industry):
+		self.industry = industry
+		self.recorder = FiringRecorder(industry)
+		self.recorder.changed.connect(self.invalidate)
+		self.changed = self.recorder.changed #: Emitted when the statistics changed
+		self.scales = None
+
+	def disconnect(self):
+		self.recorder.disconnect()
+
+	def reset(self):
+		self.recorder.reset()
+
+	def invalidate(self):
+		self.scales = None
+
+	def getScales(self):
+		if self.scales is None:
+			statistics = self.recorder.statistics
+			enterprises = {
+				node: sum(self.recorder.fired(transition) for transition in node.obj.net.transitions)
+				for node in self.industry.graph.nodes
+			}
+			self.scales = (
+				max(statistics.fired, default=0), max(statistics.averageTokens(), default=0),
+				enterprises, max(enterprises.values(), default=0)
+			)
+		return self.scales
+
+	def transitionHeat(self, transition):
+		"""Return how often `transition` fired, relative to the transition that fired most often"""
+		fired, tokens, enterprises, enterpriseFired = self.getScales()
+		return self.recorder.fired(transition) / fired if fired else 0
+
+	def placeHeat(self, place):
+		"""Return the average number of tokens of `place`, relative to the place with the most tokens on average"""
+		fired, tokens, enterprises, enterpriseFired = self.getScales()
+		return self.recorder.averageTokens(place) / tokens if tokens else 0
+
+	def enterpriseHeat(self, node):
+		"""Return how often the transitions of the enterprise `node` fired, relative to the enterprise whose transitions fired most often"""
+		fired, tokens, enterprises, enterpriseFired = self.getScales()
+		return enterprises.get(node, 0) / enterpriseFired if enterpriseFired else 0
+
+
+def objectNames(industry):
+	"""Return a dictionary that maps the places and transitions of `industry` to names for reports:
+	the label of the enterprise and of the node, or the message type of a channel"""
+	names = {}
+	for enterprise in industry.graph.nodes:
+		for i, node in enumerate(enterprise.obj.graph.nodes):
+			text = node.label.text or getattr(node.obj, "message", "") or "#%i" %(i + 1)
+			names[node.obj] = "%s/%s" %(enterprise.label.text, text)
+	for arrow in industry.graph.arrows:
+		names[arrow.channel] = "channel %s" %arrow.source.transition.message
+	return names
+
+
+def numberedNames(objects, names):
+	"""Return a dictionary that maps the number of every object in `objects` to its name in `names`,
+	e.g. the places of a compiled net to the names of :py:func:`objectNames`"""
+	return {index: names[obj] for index, obj in enumerate(objects) if obj in names}
+
+
+def compiledNames(industry, net):
+	"""Return the names of :py:func:`objectNames` for the places and for the transitions of the
+	:py:class:`~in_toolset.model.compiled.CompiledNet` `net` compiled from `industry`, mapped by their numbers,
+	and a list with the names of the enterprises"""
+	names = objectNames(industry)
+	enterprises = [node.label.text or "enterprise %i" %(i + 1) for i, node in enumerate(industry.graph.nodes)]
+	return numberedNames(net.places, names), numberedNames(net.transitions, names), enterprises
+
+
+def summary(statistics, net, names, top=10):
+	"""Return lines that describe the `top` transitions that fired most often and the `top` places with the most tokens on average,
+	for `statistics` collected by running the :py:class:`~in_toolset.model.compiled.CompiledNet` `net`"""
+	def name(objects, index, kind):
+		if index < len(objects) and objects[index] in names:
+			return names[objects[index]]
+		return "%s %i" %(kind, index)
+
+	lines = ["time: %g" %statistics.time, "most fired transitions:"]
+	fired = sorted(range(statistics.transitionCount()), key=lambda index: -statistics.fired[index])
+	for index in fired[:top]:
+		if statistics.fired[index]:
+			lines.append("  %-40s %10i" %(name(net.transitions, index, "transition"), statistics.fired[index]))
+
+	lines.append("most tokens on average:")
+	average = statistics.averageTokens()
+	for index in sorted(range(statistics.placeCount()), key=lambda index: -average[index])[:top]:
+		if average[index]:
+			lines.append("  %-40s %10.3f" %(name(net.places, index, "place"), average[index]))
+	return lines
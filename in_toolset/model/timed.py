@@ -0,0 +1,336 @@
+"""Timed simulation of a :py:class:`~in_toolset.model.compiled.CompiledNet` with discrete events, for capacity planning.
+
+Every transition has a delay, the distribution of the time it takes to fire, written as text such as ``exp 2``
+(see :py:func:`parseDelay`) and stored in :py:attr:`~in_toolset.model.ui.UITransition.delay`.
+An enabled transition starts firing by taking the tokens of its preset and puts the tokens into its postset once its delay
+has passed. Every transition is a resource that fires once at a time, so tokens wait in its preset while it is busy.
+Conflicting transitions that are enabled at the same time are chosen at random. The ends of the firings are kept in a heap.
+
+The simulation runs cases one after another: every case starts from the initial marking and ends when no transition is
+enabled or firing any more, its latency is the time this took. Transitions without a delay take one time unit,
+like a firing of the untimed simulation in :py:mod:`~in_toolset.model.statistics`. The same seed gives the same results."""
+
+from .statistics import FiringStatistics
+from array import array
+import functools
+import heapq
+import random
+import time
+import csv
+
+
+DISTRIBUTIONS = {
+	"const": 1,
+	"exp": 1,
+	"uniform": 2,
+	"normal": 2,
+	"triangular": 3,
+} #: The names of the delay distributions, mapped to their number of parameters
+
+DEFAULT_DELAY = "1" #: The delay of transitions without one
+
+
+def parseDelay(text):
+	"""Return the name of the distribution of the delay `text` and its parameters, or raise a :py:class:`ValueError`.
+
+	A delay is the name of a distribution followed by its parameters, separated by spaces: ``const D`` always takes D,
+	which can also be written as just ``D``, ``exp MEAN`` is exponential, ``uniform LOW HIGH`` uniform,
+	``normal MEAN DEVIATION`` normal without the negative values, and ``triangular LOW MODE HIGH`` triangular."""
+	words = text.split()
+	if not words:
+		raise ValueError("Empty delay")
+	if words[0] not in DISTRIBUTIONS:
+		words.insert(0, "const")
+	name = words[0]
+	if len(words) - 1 != DISTRIBUTIONS[name]:
+		raise ValueError("Invalid delay %r: %s takes %i parameters" %(text, name, DISTRIBUTIONS[name]))
+	try:
+		params = tuple(float(word) for word in words[1:])
+	except ValueError:
+		raise ValueError("Invalid delay %r: the parameters must be numbers" %text) from None
+	if min(params) < 0:
+		raise ValueError("Invalid delay %r: the parameters must not be negative" %text)
+	if list(params) != sorted(params) and name in ("uniform", "triangular"):
+		raise ValueError("Invalid delay %r: the parameters must be in increasing order" %text)
+	return name, params
+
+
+def delaySampler(text, rng):
+	"""Return a function without arguments that draws delays from the distribution `text` with the random number generator `rng`"""
+	name, params = parseDelay(text)
+	if name == "const" or params[0] == 0 and name == "exp":
+		value = params[0]
+		return lambda: value
+	if name == "exp":
+		return functools.partial(rng.expovariate, 1 / params[0])
+	if name == "uniform":
+		return functools.partial(rng.uniform, *params)
+	if name == "normal":
+		mean, deviation = params
+		normal = rng.normalvariate
+		return lambda: max(0.0, normal(mean, deviation))
+	low, mode, high = params
+	return functools.partial(rng.triangular, low, high, mode)
+
+
+class TimedResult:
+	"""The result of :py:func:`simulateTimed`. Places, transitions and enterprises are numbered like in the simulated net."""
+	def __init__(self, net):
+		enterprises = max(max(net.placeEnterprise, default=-1), max(net.transitionEnterprise, default=-1)) + 1
+		self.statistics = FiringStatistics.forNet(net) #: The fire counts and token-time integrals, over the simulated time
+		self.events = 0 #: The number of firings that ended
+		self.latencies = array("d") #: The latency of every case that ended
+		self.finished = True #: Whether the last case ended, instead of being cut off by a limit
+		self.transitionBusy = array("d", bytes(8 * net.transitionCount())) #: The time every transition spent firing
+		self.enterpriseBusy = array("d", bytes(8 * enterprises)) #: The time in which any transition of every enterprise was firing
+		self.enterpriseFired = array("q", bytes(8 * enterprises)) #: The number of firings of the transitions of every enterprise
+		self.arrivals = array("q", bytes(8 * net.placeCount())) #: The number of tokens put into every place, including the initial ones
+		self.channels = [place for place, enterprise in enumerate(net.placeEnterprise) if enterprise < 0] #: The places between enterprises
+		self.duration = 0.0 #: The seconds the simulation took
+
+	@property
+	def time(self):
+		"""The simulated time"""
+		return self.statistics.time
+
+	def rate(self, count):
+		return count / self.time if self.time > 0 else 0.0
+
+	def throughput(self):
+		"""Return the number of cases that ended per time unit"""
+		return self.rate(len(self.latencies))
+
+	def enterpriseThroughput(self, enterprise):
+		"""Return the number of firings of the transitions of `enterprise` per time unit"""
+		return self.rate(self.enterpriseFired[enterprise])
+
+	def enterpriseUtilisation(self, enterprise):
+		"""Return the share of the time in which any transition of `enterprise` was firing"""
+		return self.rate(self.enterpriseBusy[enterprise])
+
+	def transitionUtilisation(self, transition):
+		"""Return the share of the time in which `transition` was firing"""
+		return self.rate(self.transitionBusy[transition])
+
+	def waitingTime(self, place):
+		"""Return the average time a token stayed in `place`, by Little's law the token-time integral divided by the arrivals"""
+		arrivals = self.arrivals[place]
+		if not arrivals:
+			return 0.0
+		statistics = self.statistics
+		return (statistics.tokenTime[place] + statistics.tokens[place] * (statistics.time - statistics.since[place])) / arrivals
+
+	def latency(self, quantile):
+		"""Return the latency that the share `quantile` of the cases did not exceed, e.g. 0.5 for the median"""
+		if not self.latencies:
+			return 0.0
+		latencies = sorted(self.latencies)
+		return latencies[min(len(latencies) - 1, int(quantile * len(latencies)))]
+
+	def meanLatency(self):
+		return sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+
+	def summary(self, names, enterprises, top=10):
+		"""Return lines that describe the result, with the `top` busiest enterprises and the `top` channels with the longest waiting times.
+		`names` maps the numbers of the places to names and `enterprises` lists the names of the enterprises,
+		see :py:func:`~in_toolset.model.statistics.compiledNames`."""
+		lines = [
+			"time: %g" %self.time,
+			"events: %i (%.0f per second)" %(self.events, self.events / self.duration if self.duration > 0 else 0),
+			"cases: %i%s, %g per time unit" %(len(self.latencies), "" if self.finished else " and 1 unfinished", self.throughput()),
+			"latency: mean %g, median %g, 95%% %g, max %g" %(self.meanLatency(), self.latency(.5), self.latency(.95), self.latency(1)),
+			"busiest enterprises:            throughput  utilisation",
+		]
+		order = sorted(range(len(self.enterpriseBusy)), key=lambda enterprise: -self.enterpriseBusy[enterprise])
+		for enterprise in order[:top]:
+			lines.append("  %-28s %12.4g %11.1f%%" %(
+				enterprises[enterprise], self.enterpriseThroughput(enterprise), 100 * self.enterpriseUtilisation(enterprise)
+			))
+
+		lines.append("longest waiting in channels:      messages  mean wait")
+		waiting = {place: self.waitingTime(place) for place in self.channels}
+		for place in sorted(self.channels, key=lambda place: -waiting[place])[:top]:
+			if self.arrivals[place]:
+				lines.append("  %-28s %12i %10.4g" %(names.get(place, "place %i" %place), self.arrivals[place], waiting[place]))
+		return lines
+
+	def rows(self, placeNames, transitionNames, enterprises):
+		"""Yield the results as rows of the kind of object, its name, a metric and its value. `placeNames` and `transitionNames`
+		map the numbers of places and transitions to names, `enterprises` lists the names of the enterprises."""
+		yield ("run", "", "time", self.time)
+		yield ("run", "", "events", self.events)
+		yield ("run", "", "cases", len(self.latencies))
+		yield ("run", "", "throughput", self.throughput())
+		yield ("run", "", "mean latency", self.meanLatency())
+		yield ("run", "", "median latency", self.latency(.5))
+		yield ("run", "", "95% latency", self.latency(.95))
+		yield ("run", "", "max latency", self.latency(1))
+
+		for enterprise, name in enumerate(enterprises):
+			yield ("enterprise", name, "firings", self.enterpriseFired[enterprise])
+			yield ("enterprise", name, "throughput", self.enterpriseThroughput(enterprise))
+			yield ("enterprise", name, "utilisation", self.enterpriseUtilisation(enterprise))
+
+		average = self.statistics.averageTokens()
+		for place in self.channels:
+			name = placeNames.get(place, "place %i" %place)
+			yield ("channel", name, "messages", self.arrivals[place])
+			yield ("channel", name, "mean waiting time", self.waitingTime(place))
+			yield ("channel", name, "mean queue length", average[place])
+
+		for transition, fired in enumerate(self.statistics.fired):
+			name = transitionNames.get(transition, "transition %i" %transition)
+			yield ("transition", name, "firings", fired)
+			yield ("transition", name, "utilisation", self.transitionUtilisation(transition))
+
+		for case, latency in enumerate(self.latencies):
+			yield ("case", "%i" %(case + 1), "latency", latency)
+
+
+def writeCSV(rows, f):
+	"""Write the `rows` of :py:meth:`TimedResult.rows` to the text file `f` as CSV, with a header"""
+	writer = csv.writer(f)
+	writer.writerow(("kind", "name", "metric", "value"))
+	writer.writerows(rows)
+
+
+def simulateTimed(net, events=100000, cases=0, until=0, rng=random, default=DEFAULT_DELAY):
+	"""Simulate the :py:class:`~in_toolset.model.compiled.CompiledNet` `net` with the delays of its transitions and return a
+	:py:class:`TimedResult`. Transitions without a delay take the delay `default`. The simulation stops after `events` firings,
+	after `cases` cases if it is not 0, at the time `until` if it is not 0, or when a case ends without any firing.
+	The marking of `net` is not changed."""
+	started = time.perf_counter()
+	count = net.transitionCount()
+	presets, postsets = net.presets, net.postsets
+	samplers = [delaySampler(delay or default, rng) for delay in net.delays]
+
+	# After a transition ended, only it and the transitions that take from its postset can have become enabled
+	consumers = [[] for place in range(net.placeCount())]
+	for transition, preset in enumerate(presets):
+		for place in sorted(set(preset)):
+			consumers[place].append(transition)
+	dependents = [
+		tuple(dict.fromkeys([transition] + [other for place in postsets[transition] for other in consumers[place]]))
+		for transition in range(count)
+	]
+
+	result = TimedResult(net)
+	statistics = result.statistics
+	transitionEnterprise = list(net.transitionEnterprise)
+	initial = list(net.marking)
+	marking = list(initial)
+	tokenTime = [0.0] * len(marking)
+	since = [0.0] * len(marking)
+	arrivals = [0] * len(marking)
+	fired = [0] * count
+	busy = bytearray(count)
+	startTimes = [0.0] * count
+	transitionBusy = [0.0] * count
+	active = [0] * len(result.enterpriseBusy)
+	activeSince = [0.0] * len(active)
+	enterpriseBusy = [0.0] * len(active)
+	heap = []
+	sequence = 0
+	ended = 0
+	now = 0.0
+	choice, heappush, heappop = rng.choice, heapq.heappush, heapq.heappop
+
+	running = True
+	while running:
+		caseStart = now
+		caseEnded = ended
+		for place, tokens in enumerate(initial):
+			if marking[place] != tokens:
+				tokenTime[place] += marking[place] * (now - since[place])
+				marking[place] = tokens
+				since[place] = now
+			arrivals[place] += tokens
+
+		candidates = range(count)
+		while True:
+			enabled = []
+			for transition in candidates:
+				if not busy[transition]:
+					for place in presets[transition]:
+						if not marking[place]:
+							break
+					else:
+						enabled.append(transition)
+
+			while enabled:
+				transition = choice(enabled) if len(enabled) > 1 else enabled[0]
+				for place in presets[transition]:
+					tokenTime[place] += marking[place] * (now - since[place])
+					marking[place] -= 1
+					since[place] = now
+				busy[transition] = 1
+				startTimes[transition] = now
+				enterprise = transitionEnterprise[transition]
+				if enterprise >= 0:
+					if not active[enterprise]:
+						activeSince[enterprise] = now
+					active[enterprise] += 1
+				sequence += 1
+				heappush(heap, (now + samplers[transition](), sequence, transition))
+
+				enabled.remove(transition)
+				if enabled:
+					enabled = [other for other in enabled if all(marking[place] for place in presets[other])]
+
+			if not heap:
+				result.latencies.append(now - caseStart)
+				break
+			if ended >= events or until and heap[0][0] > until:
+				result.finished = False
+				running = False
+				break
+
+			now, _, transition = heappop(heap)
+			busy[transition] = 0
+			transitionBusy[transition] += now - startTimes[transition]
+			enterprise = transitionEnterprise[transition]
+			if enterprise >= 0:
+				active[enterprise] -= 1
+				if not active[enterprise]:
+					enterpriseBusy[enterprise] += now - activeSince[enterprise]
+			for place in postsets[transition]:
+				tokenTime[place] += marking[place] * (now - since[place])
+				marking[place] += 1
+				since[place] = now
+				arrivals[place] += 1
+			fired[transition] += 1
+			ended += 1
+			candidates = dependents[transition]
+
+		if ended == caseEnded:
+			# Nothing can fire in the initial marking
+			if result.finished:
+				result.latencies.pop()
+			running = False
+		elif cases and len(result.latencies) >= cases:
+			running = False
+
+	# Firings that were cut off count as busy until the end
+	if until and not result.finished:
+		now = until
+	for transition in range(count):
+		if busy[transition]:
+			transitionBusy[transition] += now - startTimes[transition]
+	for enterprise, firing in enumerate(active):
+		if firing:
+			enterpriseBusy[enterprise] += now - activeSince[enterprise]
+
+	for transition, enterprise in enumerate(transitionEnterprise):
+		if enterprise >= 0:
+			result.enterpriseFired[enterprise] += fired[transition]
+	statistics.fired = array("q", fired)
+	statistics.tokens = array("q", marking)
+	statistics.tokenTime = array("d", tokenTime)
+	statistics.since = array("d", since)
+	statistics.time = now
+	result.arrivals = array("q", arrivals)
+	result.transitionBusy = array("d", transitionBusy)
+	result.enterpriseBusy = array("d", enterpriseBusy)
+	result.events = ended
+	result.duration = time.perf_counter() - started
+	return result
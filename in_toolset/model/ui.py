@@ -5,6 +5,9 @@ from ..common import Signal, Property
 import math
 
 
+GRID_SIZE = 20 #: The distance between the points of the grid to which nodes are aligned
+
+
 class TransitionType:
 	"""An enum for the different possible transition types"""
 	INTERNAL = 0 #: An internal transition "stays" within a single enterprise net and is not connected to other nets
@@ -15,6 +18,7 @@ class UITransition(Transition):
 	type = Property("typeChanged", TransitionType.INTERNAL)
 	message = Property("messageChanged", "")
 	channel = Property("channelChanged", None)
+	delay = Property("delayChanged", "") #: The distribution of the firing duration for timed simulation, see :py:func:`~in_toolset.model.timed.parseDelay`
 
 	def __init__(self):
 		super().__init__()
@@ -24,10 +28,13 @@ class UITransition(Transition):
 		self.messageChanged.connect(self.changed)
 		self.channelChanged = Signal()
 		self.channelChanged.connect(self.changed)
+		self.delayChanged = Signal()
+		self.delayChanged.connect(self.changed)
 
 	def setType(self, type): self.type = type
 	def setMessage(self, message): self.message = message
 	def setChannel(self, channel): self.channel = channel
+	def setDelay(self, delay): self.delay = delay
 
 
 # Subclassed by: UILabel, UINode, UILooseArrow
@@ -41,8 +48,11 @@ class UIObject(Object):
 		self.positionChanged.connect(self.changed)
 
 	def move(self, x, y):
-		self.x = x
-		self.y = y
+		"""Set both coordinates, emitting `positionChanged` only once"""
+		changed = UIObject.x.assign(self, x)
+		changed = UIObject.y.assign(self, y) or changed
+		if changed:
+			self.positionChanged.emit()
 
 
 class UILabel(UIObject):
@@ -74,6 +84,9 @@ class UINode(UIObject):
 		self.obj.deleted.connect(self.delete)
 
 		self.label = UILabel()
+		self.label.textChanged.connect(self.changed)
+		self.label.angleChanged.connect(self.changed)
+		self.label.distanceChanged.connect(self.changed)
 		self.deleted.connect(self.label.delete)
 		self.deleted.connect(self.obj.delete)
 
@@ -0,0 +1,103 @@
+"""Connecting the message transitions of the enterprises of an industry with channels.
+
+:py:func:`autoWire` connects all unconnected output transitions to the input transitions with the same message type at once,
+which would otherwise take one drag per channel in the editor. The candidates are looked up in a
+:py:class:`~in_toolset.model.index.MessageIndex`, so the work grows with the number of transitions and not with the number of pairs."""
+
+from .base import Place
+from .ui import TransitionType, UIChannelArrow
+from .index import MessageIndex
+import math
+
+
+def createChannel(industry, source, target):
+	"""Connect the loose arrow `source` of an output transition to the loose arrow `target` of an input transition
+	in the :py:class:`~in_toolset.model.ui.UIPetriNet` `industry`, and turn both arrows towards each other"""
+	dx = target.node.x - source.node.x
+	dy = target.node.y - source.node.y
+	angle = math.atan2(dy, dx)
+
+	source.setAngle(angle)
+	target.setAngle(angle + math.pi)
+
+	channel = Place()
+	industry.net.places.add(channel)
+
+	arrow = UIChannelArrow(source, target, channel)
+	industry.graph.arrows.add(arrow)
+	return arrow
+
+
+class WiringReport:
+	"""The result of :py:func:`autoWire`. The message types map to lists of loose arrows of unconnected transitions."""
+	def __init__(self):
+		self.channels = [] #: The created :py:class:`~in_toolset.model.ui.UIChannelArrow` objects
+		self.ambiguous = {} #: Message types with several outputs or inputs, as pairs of the outputs and inputs that are still unconnected
+		self.unmatched = {} #: Message types that only have unconnected outputs or only unconnected inputs, mapped to those
+
+	def summary(self):
+		"""Return a description of the report, one line per item"""
+		lines = ["channels created: %i" %len(self.channels)]
+		for message, (outputs, inputs) in sorted(self.ambiguous.items()):
+			lines.append("ambiguous message %r: %i outputs, %i inputs" %(message, len(outputs), len(inputs)))
+		for message, arrows in sorted(self.unmatched.items()):
+			lines.append("unmatched message %r: %i transitions" %(message, len(arrows)))
+		return lines
+
+
+def autoWire(industry, index=None, pairAmbiguous=False):
+	"""Connect the unconnected output transitions of the enterprises of `industry` to unconnected input transitions
+	with the same message type, and return a :py:class:`WiringReport`.
+
+	A message type that has exactly one output and one input is always connected. Message types with several
+	outputs or inputs are only connected if `pairAmbiguous` is set, in the order of the transitions in the industry,
+	and are reported either way. Transitions without a message type are ignored, and enterprises are never connected to themselves.
+	`index` is a :py:class:`~in_toolset.model.index.MessageIndex` of the industry graph, one is built if it is not given."""
+	ownIndex = index is None
+	if ownIndex:
+		index = MessageIndex(industry.graph)
+
+	report = WiringReport()
+	order = {arrow: i for i, arrow in enumerate(industry.graph.looseArrows.objects)}
+	candidates = []
+	for message in index.messages():
+		if not message:
+			continue
+		outputs = [arrow for arrow in index.find(message, TransitionType.OUTPUT) if not arrow.transition.channel]
+		inputs = [arrow for arrow in index.find(message, TransitionType.INPUT) if not arrow.transition.channel]
+		outputs.sort(key=order.get)
+		inputs.sort(key=order.get)
+		candidates.append((message, outputs, inputs))
+
+	pairs = []
+	for message, outputs, inputs in candidates:
+		if not outputs or not inputs:
+			if outputs or inputs:
+				report.unmatched[message] = outputs + inputs
+			continue
+
+		ambiguous = len(outputs) > 1 or len(inputs) > 1
+		if ambiguous and not pairAmbiguous:
+			report.ambiguous[message] = (outputs, inputs)
+			continue
+
+		remaining = []
+		for source in outputs:
+			for i, target in enumerate(inputs):
+				if target.node != source.node:
+					pairs.append((source, target))
+					del inputs[i]
+					break
+			else:
+				remaining.append(source)
+		if ambiguous:
+			report.ambiguous[message] = (remaining, inputs)
+		elif remaining or inputs:
+			report.unmatched[message] = remaining + inputs
+
+	for source, target in pairs:
+		report.channels.append(createChannel(industry, source, target))
+
+	if ownIndex:
+		index.disconnect()
+	return report
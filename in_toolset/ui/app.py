@@ -1,50 +1,197 @@
 
 from PyQt5.QtWidgets import *
+from PyQt5.QtCore import QTimer, QObject, QEvent, QFileSystemWatcher
 from ..model.project import Project
+from ..model.journal import ProjectJournal, journalPath, recoverProject, leftoverJournals
 from ..model.ui import UIPetriNet
+from ..model.layout import LayoutJob, layeredLayout, forceLayout
+from ..model import wiring
 from .industry import IndustryScene
-from .enterprise import EnterpriseScene
 from .window import MainWindow
 from .view import Style
+from .performance import monitor
+from ..common import SignalProfiler
+from .. import config as config
+import collections
+import time
 import sys
 import os
 
 
+class StartupTimer(QObject):
+	"""Records how long each step of starting the graphical interface takes, up to the first paint of the editor view"""
+	def __init__(self, start=None):
+		super().__init__()
+		self.start = time.perf_counter() if start is None else start
+		self.last = self.start
+		self.steps = []
+		self.widget = None
+		
+	def mark(self, name):
+		"""Record the time since the previous mark as the duration of step `name`"""
+		now = time.perf_counter()
+		self.steps.append((name, now - self.last))
+		self.last = now
+		
+	def watch(self, widget):
+		"""Finish timing when `widget` is painted for the first time"""
+		self.widget = widget
+		widget.installEventFilter(self)
+		
+	def eventFilter(self, obj, e):
+		if obj == self.widget and e.type() == QEvent.Paint:
+			self.widget.removeEventFilter(self)
+			self.widget = None
+			self.mark("first paint")
+			self.report()
+		return False
+		
+	def report(self):
+		for name, duration in self.steps:
+			print("%-16s %8.1f ms" %(name, duration * 1000), file=sys.stderr)
+		print("%-16s %8.1f ms" %("total", (self.last - self.start) * 1000), file=sys.stderr)
+
+
 class Application:
 	"""The main class, corresponding to one instance of the graphical toolkit.
 	It manages windows and allows for basic managing of projects."""
 
-	def start(self):
-		"""Start the graphical interface and the program itself"""
+	def start(self, startTime=None):
+		"""Start the graphical interface and the program itself.
+		`startTime` is the :py:func:`time.perf_counter` value at which the program was started, it is used to report the startup time."""
+		timer = StartupTimer(startTime)
+		timer.mark("imports")
+		
+		# Records the signals of the whole session, see debug.signal_profile in the configuration
+		profiler = SignalProfiler()
+		if config.get("debug.signal_profile"):
+			profiler.start()
+		
 		self.app = QApplication(sys.argv)
+		timer.mark("application")
 		
+		self.stylePath = os.path.join(os.path.dirname(__file__), "../data/style.json")
 		style = Style()
-		style.load(os.path.join(os.path.dirname(__file__), "../data/style.json"))
+		style.load(self.stylePath)
+		timer.mark("style")
+		
+		self.style = style
+		self.styleWatcher = QFileSystemWatcher([self.stylePath])
+		self.styleWatcher.fileChanged.connect(self.reloadStyle)
 		
 		self.window = MainWindow(style)
 		self.window.newProject.connect(self.createProject)
 		self.window.loadProject.connect(self.createProject)
+		self.window.importProject.connect(self.importProject)
 		self.window.enterpriseSelected.connect(self.switchToScene)
+		self.window.autoLayout.connect(self.autoLayout)
+		self.window.autoWire.connect(self.autoWire)
+		self.window.searchResultSelected.connect(self.showSearchResult)
 		self.window.show()
+		timer.mark("window")
 		
 		self.industryScene = IndustryScene(style, self.window)
 		self.industryScene.enterpriseSelected.connect(self.switchToScene)
 
-		self.enterpriseScene = EnterpriseScene(style, self.window)
+		# The scenes of recently viewed enterprises, least recently viewed first
+		self.enterpriseScenes = collections.OrderedDict()
 		
 		self.currentScene = None
+		self.layoutJob = None
 		
+		self.journal = None
 		self.createProject()
+		timer.mark("project")
+		
+		if config.get("debug.startup_timing"):
+			timer.watch(self.window.view.viewport())
+		
+		self.autosaveTimer = QTimer()
+		self.autosaveTimer.setInterval(int(config.get("autosave.interval") * 1000))
+		self.autosaveTimer.timeout.connect(self.autosave)
+		self.autosaveTimer.start()
+		
+		self.pollTimer = QTimer()
+		self.pollTimer.setInterval(200)
+		self.pollTimer.timeout.connect(self.pollJournal)
+		self.pollTimer.timeout.connect(self.pollLayout)
+		self.pollTimer.start()
 		
 		self.app.exec()
 		
+		self.journal.close()
+		
+		if config.get("debug.signal_profile"):
+			profiler.stop()
+			for line in profiler.report():
+				print(line, file=sys.stderr)
+			with open(config.get("debug.signal_profile"), "w") as f:
+				profiler.writeFolded(f)
+		
+	def reloadStyle(self):
+		"""Reload the style after the style file was changed, which also invalidates the cached pixmaps of its shapes"""
+		if self.stylePath not in self.styleWatcher.files():
+			self.styleWatcher.addPath(self.stylePath) # Editors may replace the file instead of writing to it
+		try:
+			self.style.load(self.stylePath)
+		except (OSError, ValueError, KeyError):
+			return # The file may be incomplete while it is being written
+		for widget in self.window.toolbar.findChildren(QWidget):
+			widget.update()
+		self.window.scene.update()
+		
+	def autosave(self):
+		self.journal.flush()
+		
+	def pollJournal(self):
+		self.journal.poll()
+		
+	def autoLayout(self):
+		"""Compute the layout of the current scene in a worker thread, the industry with the force-directed layout
+		and enterprises in layers. The nodes are moved by :py:meth:`pollLayout` once the layout is finished."""
+		if self.layoutJob or not self.currentScene:
+			return
+		layout = forceLayout if self.currentScene == self.industryScene else layeredLayout
+		self.layoutJob = LayoutJob(self.currentScene.net.graph, layout)
+		
+	def autoWire(self):
+		"""Connect the message transitions of the industry that have a single counterpart, and show which message types could not be connected"""
+		index = self.industryScene.controller.messages if self.industryScene.net else None
+		report = wiring.autoWire(self.industry, index)
+		QMessageBox.information(self.window, "Connect messages", "\n".join(report.summary()))
+		
+	def showSearchResult(self, result):
+		"""Switch to the scene that contains the node of `result`, a :py:class:`~in_toolset.model.index.SearchResult`, and show the node"""
+		if result.enterprise is None:
+			self.switchToScene(self.industry)
+		else:
+			self.switchToScene(result.enterprise)
+		self.currentScene.showNode(result.node)
+		
+	def pollLayout(self):
+		start = time.perf_counter()
+		try:
+			done = self.layoutJob and self.layoutJob.poll()
+		except:
+			import traceback
+			traceback.print_exc()
+			
+			self.layoutJob = None
+			text = "An error occurred while computing the layout."
+			QMessageBox.warning(self.window, "Error", text)
+			return
+		if done:
+			self.layoutJob = None
+			if monitor.enabled:
+				monitor.record("layout", start)
+		
 	def createProject(self, filename=None):
 		"""Create a new project or load an existing one"""
 
-		self.project = Project()
+		project = Project()
 		if filename:
 			try:
-				self.project.load(filename)
+				project.load(filename)
 			except:
 				import traceback
 				traceback.print_exc()
@@ -52,19 +199,114 @@ class Application:
 				text = "An error occurred while loading this file (it may be corrupted)."
 				QMessageBox.warning(self.window, "Error", text)
 				return
+		
+		recovered = self.recoverJournal(project, filename)
+		self.setProject(project)
+		if recovered:
+			self.journal.takeOver(recovered)
+		
+	def importProject(self, filename):
+		"""Create a new project from the nets in the PNML file `filename`"""
+		project = Project()
+		try:
+			project.importNet(filename)
+		except:
+			import traceback
+			traceback.print_exc()
 			
+			text = "An error occurred while importing this file (it may not be a valid PNML file)."
+			QMessageBox.warning(self.window, "Error", text)
+			return
+		
+		self.setProject(project)
+		
+	def setProject(self, project):
+		if self.journal:
+			self.journal.close()
+		
+		if self.currentScene:
+			self.currentScene.cleanup()
+			self.currentScene = None
+		self.layoutJob = None # The result of a running job is for the nodes of the previous project
+		for scene in self.enterpriseScenes.values():
+			scene.release()
+		self.enterpriseScenes.clear()
+		if self.industryScene.net:
+			self.industryScene.release()
+		
+		self.project = project
+		self.journal = ProjectJournal(self.project)
 		self.industry = self.project.industry
 			
-		self.window.setProject(self.project)
+		self.window.setProject(self.project, self.journal)
 		self.switchToScene(self.industry)
 		
+	def recoverJournal(self, project, filename):
+		"""Offer to restore the changes journaled for `filename`, if the program did not exit cleanly.
+		A new project is offered the untitled project of the most recent session that did not exit cleanly,
+		the path of its journal is returned if it was restored."""
+		if filename:
+			paths = [path for path in [journalPath(filename)] if os.path.exists(path)]
+			text = "This model has unsaved changes from a previous session. Do you want to restore them?"
+		else:
+			paths = leftoverJournals()
+			times = [time.strftime("%Y-%m-%d %H:%M", time.localtime(os.path.getmtime(path))) for path in paths]
+			text = "Untitled models from previous sessions have unsaved changes, last changed:\n%s\n\n" %"\n".join(times)
+			text += "Do you want to restore the most recent one? Otherwise, all of them are discarded."
+		if not paths:
+			return None
+		
+		path = paths[0]
+		buttons = QMessageBox.Yes | QMessageBox.No
+		if QMessageBox.question(self.window, "Restore changes?", text, buttons) == QMessageBox.Yes:
+			try:
+				recoverProject(project, filename, path)
+				return None if filename else path
+			except:
+				import traceback
+				traceback.print_exc()
+				
+				text = "An error occurred while restoring the changes (the journal may be corrupted)."
+				QMessageBox.warning(self.window, "Error", text)
+				paths = [path]
+		for path in paths:
+			os.remove(path)
+		return None
+		
 	def switchToScene(self, object):
+		"""Show the scene of `object`, the industry or an enterprise node. Scenes that were shown before are reused."""
 		if self.currentScene:
 			self.currentScene.cleanup()
 		
 		if object == self.industry:
 			self.currentScene = self.industryScene
-			self.currentScene.load(self.industry)
+			if self.currentScene.net:
+				self.currentScene.activate()
+			else:
+				self.currentScene.load(self.industry)
 		else:
-			self.currentScene = self.enterpriseScene
-			self.currentScene.load(self.industry, object)
+			scene = self.enterpriseScenes.pop(object, None)
+			if scene:
+				scene.activate()
+			else:
+				from .enterprise import EnterpriseScene
+				scene = EnterpriseScene(self.style, self.window)
+				scene.load(self.industry, object)
+			self.enterpriseScenes[object] = scene
+			self.currentScene = scene
+			self.evictScenes()
+			
+	def evictScenes(self):
+		"""Release the least recently viewed enterprise scenes while there are more than ``ui.scene_cache_size``,
+		or while the hidden ones hold more than ``ui.scene_cache_items`` items. Scenes of deleted enterprises are always released."""
+		size = config.get("ui.scene_cache_size")
+		budget = config.get("ui.scene_cache_items")
+		
+		hidden = [(node, scene) for node, scene in self.enterpriseScenes.items() if scene != self.currentScene]
+		items = sum(scene.itemCount() for node, scene in hidden)
+		for node, scene in hidden:
+			if node.active and len(self.enterpriseScenes) <= size and items <= budget:
+				continue
+			items -= scene.itemCount()
+			scene.release()
+			del self.enterpriseScenes[node]
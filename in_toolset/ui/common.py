@@ -1,51 +1,105 @@
 
 from ..model.ui import *
+from ..model.spatial import ArrowGeometry
 from .view import *
 import in_toolset.config
+import math
 
 
 class ArrowBase(EditorShape):
+	"""An arrow or, with type ``"line"``, a curve without head.
+	Its bounds and hit-testing are computed by an :py:class:`~in_toolset.model.spatial.ArrowGeometry`,
+	the path is only built when the arrow is painted and the stroke outline only when Qt asks for its shape."""
+	stroke = 20 #: The width of the area around the arrow in which it can be picked
+	stretch = 10 #: The length of the lines of the arrow head
+	
 	def __init__(self, scene):
 		super().__init__(scene)
 		self.setZValue(-1)
 		
 		self.dragMode = DragMode.SPECIAL
-
-		self.element = ShapeElement(
-			"arrow", x1=0, y1=0, x2=0, y2=0, curve=0, stretch=10
-		)
+		
+		self.type = "arrow"
+		self.geometry = ArrowGeometry(0, 0, 0, 0)
+		self.path = None
+		self.outline = None
 
 		self.pen = QPen()
 		self.pen.setCapStyle(Qt.RoundCap)
 		self.pen.setWidth(2)
-
-		part = ShapePart()
-		part.setStroke(20)
-		part.setPen(self.pen)
-		part.addElement(self.element)
-
-		shape = Shape()
-		shape.addPart(part)
-
-		self.setShape(shape)
+		
+		self.updateShape()
 		
 	def setColor(self, color):
 		self.pen.setColor(color)
 		
 	def setCurve(self, curve):
-		self.element.curve = curve
-		self.updateShape()
+		g = self.geometry
+		self.setGeometry(g.x1, g.y1, g.x2, g.y2, curve)
 		
 	def setType(self, type):
-		self.element.type = type
-		self.updateShape()
+		self.type = type
+		g = self.geometry
+		self.setGeometry(g.x1, g.y1, g.x2, g.y2, g.curve)
 
 	def setPoints(self, x1, y1, x2, y2):
-		self.element.x1 = x1
-		self.element.y1 = y1
-		self.element.x2 = x2
-		self.element.y2 = y2
-		self.updateShape()
+		self.setGeometry(x1, y1, x2, y2, self.geometry.curve)
+		
+	def setGeometry(self, x1, y1, x2, y2, curve):
+		"""Set the end points and the curve at once, nothing is updated if they did not change"""
+		head = self.stretch if self.type == "arrow" else 0
+		if (x1, y1, x2, y2, curve, head) != self.geometry.key:
+			self.geometry = ArrowGeometry(x1, y1, x2, y2, curve, head)
+			self.updateShape()
+			
+	def updateShape(self):
+		self.prepareGeometryChange()
+		self.path = None
+		self.outline = None
+		self.updateIndex()
+		self.update()
+		
+	def getPath(self):
+		if self.path is None:
+			g = self.geometry
+			self.path = QPainterPath()
+			self.path.moveTo(g.x1, g.y1)
+			self.path.quadTo(g.cx, g.cy, g.x2, g.y2)
+			for x, y in g.heads:
+				self.path.moveTo(g.x2, g.y2)
+				self.path.lineTo(x, y)
+		return self.path
+		
+	def shape(self):
+		if self.outline is None:
+			stroker = QPainterPathStroker()
+			stroker.setWidth(self.stroke)
+			self.outline = stroker.createStroke(self.getPath())
+		return self.outline
+		
+	def contains(self, pos):
+		return self.geometry.distance(pos.x(), pos.y()) <= self.stroke / 2
+		
+	def boundingRect(self):
+		x1, y1, x2, y2 = self.geometry.bounds()
+		margin = self.stroke / 2 + 2
+		return QRectF(x1, y1, x2 - x1, y2 - y1).adjusted(-margin, -margin, margin, margin)
+		
+	def paint(self, painter, option, widget):
+		pen = QPen(self.pen)
+		self.filter.applyToPen(pen)
+		if levelOfDetail(painter) >= LOD_DETAILS:
+			painter.setRenderHint(QPainter.Antialiasing)
+			painter.setPen(pen)
+			painter.setBrush(Qt.NoBrush)
+			painter.drawPath(self.getPath())
+		else:
+			# Without the curve and the arrow head, which would not be visible anyway
+			pen.setCosmetic(True)
+			pen.setWidth(1)
+			painter.setPen(pen)
+			g = self.geometry
+			painter.drawLine(QLineF(g.x1, g.y1, g.x2, g.y2))
 		
 		
 class ArrowItem(ArrowBase):
@@ -54,9 +108,9 @@ class ArrowItem(ArrowBase):
 		self.arrow = arrow
 		self.connect(self.arrow.restored, self.addToScene)
 		self.connect(self.arrow.deleted, self.removeFromScene)
-		self.connect(self.arrow.curveChanged, self.updateArrow)
-		self.connect(self.arrow.source.positionChanged, self.updateArrow)
-		self.connect(self.arrow.target.positionChanged, self.updateArrow)
+		self.connectUpdate(self.arrow.curveChanged, self.updateArrow)
+		self.connectUpdate(self.arrow.source.positionChanged, self.updateArrow)
+		self.connectUpdate(self.arrow.target.positionChanged, self.updateArrow)
 
 		self.distance = 0
 
@@ -66,6 +120,10 @@ class ArrowItem(ArrowBase):
 		self.distance = distance
 		self.updateArrow()
 		
+	def refresh(self):
+		self.showIf(self.arrow.active)
+		self.updateArrow()
+		
 	def delete(self):
 		self.arrow.delete()
 		
@@ -104,13 +162,12 @@ class ArrowItem(ArrowBase):
 		angle1 = math.atan2(dy, dx) + curveAngle
 		angle2 = math.atan2(dy, dx) - curveAngle
 		
-		self.setCurve(self.arrow.curve)
-		
-		self.setPoints(
+		self.setGeometry(
 			source.x + math.cos(angle1) * self.distance,
 			source.y + math.sin(angle1) * self.distance,
 			target.x - math.cos(angle2) * self.distance,
-			target.y - math.sin(angle2) * self.distance
+			target.y - math.sin(angle2) * self.distance,
+			self.arrow.curve
 		)
 
 
@@ -118,15 +175,13 @@ class LabelBase(EditorItem):
 	def __init__(self, scene):
 		super().__init__(scene)
 		
-		self.font = QFont()
-		self.font.setPixelSize(16)
-		self.fontMetrics = QFontMetrics(self.font)
-		
+		self.fontSize = 16
 		self.color = Qt.black
 		self.text = ""
+		self.layout = textCache.layout(self.text, self.fontSize)
 		
 	def setFontSize(self, size):
-		self.font.setPixelSize(size)
+		self.fontSize = size
 		self.updateLabel()
 		
 	def setColor(self, color):
@@ -134,26 +189,30 @@ class LabelBase(EditorItem):
 		self.update()
 		
 	def setText(self, text):
-		self.text = text
-		self.updateLabel()
+		if text != self.text:
+			self.text = text
+			self.updateLabel()
 		
 	def updateLabel(self):
 		self.prepareGeometryChange()
+		self.layout = textCache.layout(self.text, self.fontSize)
+		self.updateIndex()
 		self.update()
 		
 	def boundingRect(self):
-		rect = self.fontMetrics.boundingRect(self.text)
-		rect.moveCenter(QPoint(0, 0))
-		return QRectF(rect.adjusted(-2, -2, 2, 2))
+		return self.layout.rect
 		
 	def paint(self, painter, option, widget):
+		if levelOfDetail(painter) < LOD_LABELS:
+			return
+		
 		pen = QPen(self.color)
 		if self.isSelected():
 			pen.setColor(Qt.blue)
 		painter.setPen(pen)
 
-		painter.setFont(self.font)
-		painter.drawText(self.boundingRect(), Qt.AlignCenter, self.text)
+		painter.setFont(self.layout.font)
+		painter.drawStaticText(self.layout.offset, self.layout.text)
 
 		
 class LabelItem(LabelBase):
@@ -165,10 +224,10 @@ class LabelItem(LabelBase):
 		self.label = label
 		self.connect(self.label.restored, self.addToScene)
 		self.connect(self.label.deleted, self.removeFromScene)
-		self.connect(self.label.textChanged, self.updateText)
-		self.connect(self.label.angleChanged, self.updatePos)
-		self.connect(self.label.distanceChanged, self.updatePos)
-		self.connect(self.label.positionChanged, self.updatePos)
+		self.connectUpdate(self.label.textChanged, self.updateText)
+		self.connectUpdate(self.label.angleChanged, self.updatePos)
+		self.connectUpdate(self.label.distanceChanged, self.updatePos)
+		self.connectUpdate(self.label.positionChanged, self.updatePos)
 		
 		self.distMin = 0
 		self.distMax = 100
@@ -193,6 +252,11 @@ class LabelItem(LabelBase):
 		self.distMin = min
 		self.distMax = max
 		
+	def refresh(self):
+		self.showIf(self.label.active)
+		self.updateText()
+		self.updatePos()
+		
 	def updateText(self):
 		self.setText(self.label.text)
 		
@@ -217,7 +281,7 @@ class LooseArrowItem(EditorShape):
 		
 		self.connect(self.arrow.restored, self.addToScene)
 		self.connect(self.arrow.deleted, self.removeFromScene)
-		self.connect(self.arrow.positionChanged, self.updateArrow)
+		self.connectUpdate(self.arrow.positionChanged, self.updateArrow)
 		self.connect(self.arrow.angleChanged, self.update)
 		self.connect(self.arrow.transition.typeChanged, self.update)
 		
@@ -227,6 +291,23 @@ class LooseArrowItem(EditorShape):
 		self.setPos(self.arrow.x, self.arrow.y)
 		self.update()
 		
+	def release(self):
+		super().release()
+		self.label.release()
+		
+	def suspend(self):
+		super().suspend()
+		self.label.suspend()
+		
+	def resume(self):
+		super().resume()
+		self.label.resume()
+		
+	def refresh(self):
+		self.showIf(self.arrow.active)
+		self.updateArrow()
+		self.label.refresh()
+		
 	def delete(self):
 		self.arrow.delete()
 		
@@ -239,6 +320,9 @@ class LooseArrowItem(EditorShape):
 		self.arrow.setAngle(math.atan2(dy, dx))
 		
 	def paint(self, painter, option, widget):
+		if levelOfDetail(painter) < LOD_DETAILS:
+			return
+		
 		angle = self.arrow.angle
 		if self.arrow.transition.type == TransitionType.INPUT:
 			angle += math.pi
@@ -250,6 +334,9 @@ class LooseArrowItem(EditorShape):
 
 
 class NodeBase(EditorShape):
+	clustered = True
+	collides = True
+	
 	def __init__(self, scene, shape=None):
 		super().__init__(scene, shape)
 		self.dragMode = DragMode.NORMAL
@@ -257,12 +344,12 @@ class NodeBase(EditorShape):
 	def drag(self, param):
 		self.setPos(alignToGrid(param.pos))
 		
+	def moveTo(self, x, y):
+		"""Move the node to (`x`, `y`), which is already aligned to the grid"""
+		self.setPos(x, y)
+		
 	def checkCollisions(self):
-		items = self.scene.collidingItems(self)
-		if any(isinstance(item, NodeBase) for item in items):
-			self.setInvalid(True)
-		else:
-			self.setInvalid(False)
+		self.scene.checkCollisions([self])
 		
 	def paint(self, painter, option, widget):
 		super().paint(painter, option, widget)
@@ -276,22 +363,61 @@ class NodeBase(EditorShape):
 			painter.restore()
 			
 			
+HEAT_LEVELS = 8 #: The number of colours of the heat map, so that items only need a few cached pixmaps
+
+
+def heatColor(heat):
+	"""Return the colour of the heat map for a value from 0 to 1, from a pale blue to a saturated red"""
+	return QColor.fromHsvF((1 - heat) * 2 / 3, .15 + .75 * heat, 1)
+	
+	
+def heatLevel(scene, heat):
+	"""Return `heat`, a function of the :py:class:`~in_toolset.model.statistics.HeatMap` of `scene`, rounded to one of
+	:py:data:`HEAT_LEVELS`, or None if the scene does not show a heat map"""
+	if scene.heatMap is None:
+		return None
+	# round is the grid alignment of the view in this module, not the builtin
+	return math.floor(heat(scene.heatMap) * HEAT_LEVELS + .5) / HEAT_LEVELS
+	
+	
 class NodeFilter:
 	def __init__(self, item):
 		self.base = ShapeFilter(item)
 		self.flashColor = QColor(128, 128, 255)
 		self.item = item
 		
+	def key(self):
+		return "%s%g%s" %(self.base.key(), self.item.flashValue, self.item.heatValue())
+		
 	def applyToPen(self, pen):
 		self.base.applyToPen(pen)
 		
 	def applyToBrush(self, brush):
+		heat = self.item.heatValue()
+		if heat is not None:
+			brush.setColor(heatColor(heat))
 		color = mergeColors(brush.color(), self.flashColor, self.item.flashValue)
 		brush.setColor(color)
 		
 		self.base.applyToBrush(brush)
 			
 			
+class FlashAnimation(Animation):
+	"""Fades out the highlight of a node after its transition was triggered.
+	The flash value is rounded to quarters, so that the node is only repainted, and only needs a new cached pixmap, a few times."""
+	duration = .2
+	
+	def __init__(self, item):
+		super().__init__()
+		self.item = item
+		
+	def step(self, progress):
+		self.item.setFlashValue(math.ceil((1 - progress) * 4) / 4)
+		
+	def finish(self):
+		self.item.setFlashValue(0)
+			
+			
 class NodeItem(NodeBase):
 	def __init__(self, scene, shape, node):
 		super().__init__(scene, shape)
@@ -304,12 +430,9 @@ class NodeItem(NodeBase):
 		self.node = node
 		self.connect(self.node.restored, self.addToScene)
 		self.connect(self.node.deleted, self.removeFromScene)
-		self.connect(self.node.positionChanged, self.updatePos)
-		
-		self.flashTimer = QTimer()
-		self.flashTimer.setInterval(100)
-		self.flashTimer.timeout.connect(self.updateFlash)
+		self.connectUpdate(self.node.positionChanged, self.updatePos)
 		
+		self.flashAnimation = FlashAnimation(self)
 		self.flashValue = 0
 		
 		self.updatePos()
@@ -317,25 +440,46 @@ class NodeItem(NodeBase):
 	def drag(self, param):
 		pos = alignToGrid(param.pos)
 		self.node.move(pos.x(), pos.y())
+		
+	def moveTo(self, x, y):
+		self.node.move(x, y)
 
 	def delete(self):
-		self.flashTimer.stop()
+		self.scene.animations.stop(self.flashAnimation)
 		self.flashValue = 0
 		
 		self.node.delete()
+		
+	def release(self):
+		self.scene.animations.stop(self.flashAnimation)
+		super().release()
+		self.label.release()
+		
+	def suspend(self):
+		super().suspend()
+		self.label.suspend()
+		
+	def resume(self):
+		super().resume()
+		self.label.resume()
+		
+	def refresh(self):
+		self.showIf(self.node.active)
+		self.updatePos()
+		self.update()
+		self.label.refresh()
 
 	def updatePos(self):
 		self.setPos(self.node.x, self.node.y)
 		
-	def updateFlash(self):
-		self.flashValue -= .5
-		if self.flashValue <= 0:
-			self.flashTimer.stop()
-			self.flashValue = 0
+	def heatValue(self):
+		"""Return the value of the node in the heat map of the scene, see :py:func:`heatLevel`"""
+		return None
 		
-		self.update()
+	def setFlashValue(self, value):
+		if self.flashValue != value:
+			self.flashValue = value
+			self.update()
 		
 	def flash(self):
-		self.flashValue = 1
-		self.flashTimer.start()
-		self.update()
+		self.scene.animations.start(self.flashAnimation)
@@ -3,6 +3,8 @@ from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 from PyQt5.QtCore import *
 from ..model.ui import *
+from ..model.index import ArcIndex
+from ..model.timed import DEFAULT_DELAY, parseDelay
 from .common import *
 from .scene import *
 from .. import config as config
@@ -14,6 +16,9 @@ class TransitionFilter:
 		self.base = NodeFilter(item)
 		self.item = item
 
+	def key(self):
+		return "%s%i" %(self.base.key(), self.item.node.obj.enabled)
+
 	def applyToPen(self, pen):
 		self.base.applyToPen(pen)
 
@@ -26,18 +31,28 @@ class TransitionFilter:
 class PlaceItem(NodeItem):
 	def __init__(self, scene, style, node):
 		super().__init__(scene, style.shapes["place"], node)
-		self.connect(self.node.obj.tokensChanged, self.update)
+		self.connectUpdate(self.node.obj.tokensChanged, self.updateTokens)
+
+		self.tokens = None
+		self.updateTokens()
+
+	def refresh(self):
+		super().refresh()
+		self.updateTokens()
 
-		self.font = QFont()
-		self.font.setPixelSize(16)
+	def updateTokens(self):
+		self.tokens = textCache.layout(str(self.node.obj.tokens) if self.node.obj.tokens else "", 16)
+		self.update()
+
+	def heatValue(self):
+		return heatLevel(self.scene, lambda heatMap: heatMap.placeHeat(self.node.obj))
 
 	def paint(self, painter, option, widget):
 		super().paint(painter, option, widget)
 
-		if self.node.obj.tokens != 0:
-			text = str(self.node.obj.tokens)
-			painter.setFont(self.font)
-			painter.drawText(self.shp.rect, Qt.AlignCenter, text)
+		if self.node.obj.tokens != 0 and levelOfDetail(painter) >= LOD_LABELS:
+			painter.setFont(self.tokens.font)
+			painter.drawStaticText(self.shp.rect.center() + self.tokens.offset, self.tokens.text)
 
 
 class TransitionItem(NodeItem):
@@ -47,6 +62,9 @@ class TransitionItem(NodeItem):
 		self.connect(self.node.obj.triggered, self.flash)
 		self.filter = TransitionFilter(self)
 
+	def heatValue(self):
+		return heatLevel(self.scene, lambda heatMap: heatMap.transitionHeat(self.node.obj))
+
 
 class TemporaryPlace(NodeBase):
 	"""A placeholder place to be displayed on the canvas during placement of a place, to show the place of the place currently being placed."""
@@ -86,6 +104,11 @@ class EnterpriseController:
 		self.enterprise = enode.obj
 		self.enode = enode
 
+		self.arcs = ArcIndex(self.enterprise.graph)
+
+	def disconnect(self):
+		self.arcs.disconnect()
+
 	def startPlacement(self, pos):
 		type = self.toolbar.currentTool("enterprise")
 		if type == "place":
@@ -162,7 +185,7 @@ class EnterpriseController:
 			)
 			return False
 
-		if target.node.obj in source.node.obj.postset:
+		if self.arcs.connected(source.node.obj, target.node.obj):
 			QMessageBox.warning(
 				self.window, "Duplicate arrow",
 				"Only one arrow can be placed from one node to another."
@@ -212,6 +235,9 @@ class PlaceSettings(SettingsWidget):
 		self.tokens.setValue(self.obj.tokens)
 
 
+DELAY_TOOLTIP = "Duration of a firing in timed simulation, e.g. 2, exp 2, uniform 1 3, normal 5 1 or triangular 1 2 4" #: The tooltip of the delay field while its text is valid
+
+
 class TransitionSettings(SettingsWidget):
 	def __init__(self, node):
 		super().__init__()
@@ -225,6 +251,7 @@ class TransitionSettings(SettingsWidget):
 		self.connect(self.obj.typeChanged, self.updateType)
 		self.connect(self.obj.messageChanged, self.updateMessage)
 		self.connect(self.obj.channelChanged, self.updateChannel)
+		self.connect(self.obj.delayChanged, self.updateDelay)
 
 		self.setStyleSheet("font-size: 16px")
 
@@ -251,12 +278,18 @@ class TransitionSettings(SettingsWidget):
 		self.message.textEdited.connect(self.obj.setMessage)
 		self.updateChannel()
 
+		self.delay = QLineEdit(self.obj.delay)
+		self.delay.setPlaceholderText(DEFAULT_DELAY)
+		self.delay.setToolTip(DELAY_TOOLTIP)
+		self.delay.textEdited.connect(self.setDelay)
+
 		self.addField("X:", self.x)
 		self.addField("Y:", self.y)
 		self.addField("Label:", self.label)
 		self.addSeparator()
 		self.addField("Type:", self.type)
 		self.addField("Message Type:", self.message)
+		self.addField("Delay:", self.delay)
 		self.addSeparator()
 		self.addWidget(self.trigger)
 
@@ -279,6 +312,25 @@ class TransitionSettings(SettingsWidget):
 	def updateMessage(self):
 		self.message.setText(self.obj.message)
 
+	def setDelay(self, text):
+		# Invalid delays are marked in the field and only stored once they are fixed
+		try:
+			if text.strip():
+				parseDelay(text)
+		except ValueError as e:
+			self.delay.setStyleSheet("color: red")
+			self.delay.setToolTip(str(e))
+			return
+		self.delay.setStyleSheet("")
+		self.delay.setToolTip(DELAY_TOOLTIP)
+		self.obj.setDelay(text.strip())
+
+	def updateDelay(self):
+		if self.delay.text().strip() != self.obj.delay:
+			self.delay.setText(self.obj.delay)
+			self.delay.setStyleSheet("")
+			self.delay.setToolTip(DELAY_TOOLTIP)
+
 	def updateChannel(self):
 		self.type.setEnabled(not self.obj.channel)
 		self.message.setEnabled(
@@ -301,21 +353,18 @@ class EnterpriseScene(PetriScene):
 	def createController(self):
 		return EnterpriseController(self.style, self.window, self.industry, self.enode)
 
-	def addNode(self, node):
+	def createNodeItem(self, node):
 		if isinstance(node.obj, Place):
-			item = PlaceItem(self.scene, self.style, node)
-		else:
-			item = TransitionItem(self.scene, self.style, node)
-		self.scene.addItem(item)
+			return PlaceItem(self.scene, self.style, node)
+		return TransitionItem(self.scene, self.style, node)
 
-	def addArrow(self, arrow):
+	def createArrowItem(self, arrow):
 		item = ArrowItem(self.scene, arrow)
 		item.setDistance(35)
-		self.scene.addItem(item)
+		return item
 
-	def addLooseArrow(self, arrow):
-		item = LooseArrowItem(self.scene, self.style, arrow)
-		self.scene.addItem(item)
+	def createLooseArrowItem(self, arrow):
+		return LooseArrowItem(self.scene, self.style, arrow)
 
 	def createSettingsWidget(self, items):
 		filtered = [i for i in items if isinstance(i, NodeItem)]
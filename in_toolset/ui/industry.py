@@ -1,5 +1,7 @@
 
 from ..model.ui import *
+from ..model.index import LabelIndex, MessageIndex
+from ..model.wiring import createChannel
 from .common import *
 from .scene import *
 from ..common import *
@@ -12,6 +14,29 @@ class EnterpriseItem(NodeItem):
 		super().__init__(scene, style.shapes["enterprise"], obj)
 		self.connect(self.node.obj.net.triggered, self.flash)
 
+	def heatValue(self):
+		return heatLevel(self.scene, lambda heatMap: heatMap.enterpriseHeat(self.node))
+
+
+class ChannelFilter:
+	"""Colours a channel arrow by the average number of messages in its channel, if the scene shows a heat map"""
+	def __init__(self, item):
+		self.base = ShapeFilter(item)
+		self.item = item
+
+	def key(self):
+		return self.base.key()
+
+	def applyToPen(self, pen):
+		heat = heatLevel(self.item.scene, lambda heatMap: heatMap.placeHeat(self.item.arrow.channel))
+		if heat is not None:
+			pen.setColor(heatColor(heat))
+			pen.setWidthF(pen.widthF() + 4 * heat)
+		self.base.applyToPen(pen)
+
+	def applyToBrush(self, brush):
+		self.base.applyToBrush(brush)
+
 
 class ChannelArrowLabel(LabelBase):
 	def __init__(self, scene, arrow):
@@ -19,16 +44,21 @@ class ChannelArrowLabel(LabelBase):
 
 		self.arrow = arrow
 		self.connect(self.arrow.deleted, self.removeFromScene)
-		self.connect(self.arrow.curveChanged, self.updatePos)
-		self.connect(self.arrow.source.node.positionChanged, self.updatePos)
-		self.connect(self.arrow.target.node.positionChanged, self.updatePos)
-		self.connect(self.arrow.channel.tokensChanged, self.updateText)
+		self.connectUpdate(self.arrow.curveChanged, self.updatePos)
+		self.connectUpdate(self.arrow.source.node.positionChanged, self.updatePos)
+		self.connectUpdate(self.arrow.target.node.positionChanged, self.updatePos)
+		self.connectUpdate(self.arrow.channel.tokensChanged, self.updateText)
 
 		self.setFontSize(18)
 
 		self.updateText()
 		self.updatePos()
 
+	def refresh(self):
+		self.showIf(self.arrow.active)
+		self.updateText()
+		self.updatePos()
+
 	def updateText(self):
 		if self.arrow.channel.tokens:
 			self.setText("%i" %self.arrow.channel.tokens)
@@ -58,40 +88,42 @@ class ChannelArrowLabel(LabelBase):
 		self.setPos(posx, posy)
 
 
-class MessageAnimItem(EditorShape):
-	def __init__(self, scene, style, arrow, isTarget):
-		super().__init__(scene, style.shapes["messageAnim"])
+class MessageAnimItem(EditorShape, Animation):
+	"""A message moving along a channel arrow. Items are reused through a :py:class:`MessageAnimPool` instead of being created for every message."""
+	def __init__(self, scene, style, pool):
+		EditorShape.__init__(self, scene, style.shapes["messageAnim"])
+		Animation.__init__(self)
+
+		self.pool = pool
+		self.arrow = None
+		self.isTarget = False
+		self.progress = 0
+
+	def setArrow(self, arrow, isTarget):
+		self.disconnect()
 
 		self.isTarget = isTarget
 
 		self.arrow = arrow
 		self.connect(self.arrow.deleted, self.kill)
-		self.connect(self.arrow.source.positionChanged, self.updatePos)
-		self.connect(self.arrow.target.positionChanged, self.updatePos)
-		self.connect(self.arrow.curveChanged, self.updatePos)
-
-		self.step = 0
+		self.connectUpdate(self.arrow.source.positionChanged, self.updatePos)
+		self.connectUpdate(self.arrow.target.positionChanged, self.updatePos)
+		self.connectUpdate(self.arrow.curveChanged, self.updatePos)
 
-		self.timer = QTimer()
-		self.timer.setInterval(50)
-		self.timer.timeout.connect(self.updateStep)
-		self.timer.start()
+	def kill(self):
+		self.scene.animations.stop(self)
+		self.finish()
 
+	def step(self, progress):
+		self.progress = progress
 		self.updatePos()
 
-	def kill(self):
-		self.timer.stop()
-		self.removeFromScene()
-
-	def updateStep(self):
-		self.step += .1
-		if self.step >= 1:
-			self.kill()
-		else:
-			self.updatePos()
+	def finish(self):
+		self.disconnect()
+		self.pool.release(self)
 
 	def updatePos(self):
-		step = self.step / 2
+		step = self.progress / 2
 		if self.isTarget:
 			step += .5
 
@@ -128,16 +160,20 @@ class MessageAnimItem(EditorShape):
 
 
 class ChannelArrowItem(ArrowItem):
-	def __init__(self, scene, style, arrow):
+	def __init__(self, scene, pool, arrow):
 		super().__init__(scene, arrow)
 
-		self.style = style
+		self.pool = pool
+
+		self.label = ChannelArrowLabel(scene, arrow)
+		scene.addItem(self.label)
 
 		self.setType("line")
+		self.filter = ChannelFilter(self)
 
-		self.connect(self.arrow.curveChanged, self.updateAngle)
-		self.connect(self.arrow.source.node.positionChanged, self.updateAngle)
-		self.connect(self.arrow.target.node.positionChanged, self.updateAngle)
+		self.connectUpdate(self.arrow.curveChanged, self.updateAngle)
+		self.connectUpdate(self.arrow.source.node.positionChanged, self.updateAngle)
+		self.connectUpdate(self.arrow.target.node.positionChanged, self.updateAngle)
 		self.connect(self.arrow.source.transition.triggered, self.triggerSource)
 		self.connect(self.arrow.target.transition.triggered, self.triggerTarget)
 
@@ -155,13 +191,58 @@ class ChannelArrowItem(ArrowItem):
 			self.arrow.source.setAngle(angle1 + angle2)
 			self.arrow.target.setAngle(angle1 - angle2 + math.pi)
 
+	def release(self):
+		super().release()
+		self.label.release()
+
+	def suspend(self):
+		super().suspend()
+		self.label.suspend()
+
+	def resume(self):
+		super().resume()
+		self.label.resume()
+
+	def refresh(self):
+		super().refresh()
+		self.label.refresh()
+
 	def triggerSource(self):
-		item = MessageAnimItem(self.scene, self.style, self.arrow, False)
-		self.scene.addItem(item)
+		self.pool.start(self.arrow, False)
 
 	def triggerTarget(self):
-		item = MessageAnimItem(self.scene, self.style, self.arrow, True)
+		self.pool.start(self.arrow, True)
+
+
+class MessageAnimPool:
+	"""Creates, reuses and limits the number of :py:class:`MessageAnimItem` objects in a scene"""
+	def __init__(self, scene, style):
+		self.scene = scene
+		self.style = style
+
+		self.limit = config.get("ui.max_animations")
+		self.active = set()
+		self.free = []
+
+	def start(self, arrow, isTarget):
+		"""Animate a message on `arrow`, unless animations are disabled or too many are running already"""
+		if not self.scene.animations.enabled or len(self.active) >= self.limit:
+			return
+
+		if self.free:
+			item = self.free.pop()
+		else:
+			item = MessageAnimItem(self.scene, self.style, self)
+		item.setArrow(arrow, isTarget)
+		self.active.add(item)
 		self.scene.addItem(item)
+		self.scene.animations.start(item)
+
+	def release(self, item):
+		if item in self.active:
+			self.active.remove(item)
+			self.scene.removeItem(item)
+			self.free.append(item)
 
 
 class TemporaryArrowItem(ArrowBase):
@@ -194,9 +275,17 @@ class IndustryController:
 		self.toolbar = window.toolbar
 		self.scene = window.scene
 
+		self.industry = industry
 		self.net = industry.net
 		self.graph = industry.graph
 
+		self.labels = LabelIndex(self.graph)
+		self.messages = MessageIndex(self.graph)
+
+	def disconnect(self):
+		self.labels.disconnect()
+		self.messages.disconnect()
+
 	def startPlacement(self, pos):
 		type = self.toolbar.currentTool("industry")
 		if type == "enterprise":
@@ -220,14 +309,7 @@ class IndustryController:
 			x, y = pos.x(), pos.y()
 
 			if not item.invalid:
-				maxnum = 0
-				for node in self.graph.nodes:
-					prefix = node.label.text[:1]
-					postfix = node.label.text[1:]
-					if prefix == "e" and postfix.isdigit():
-						maxnum = max(int(postfix), maxnum)
-
-				name = "e" + str(maxnum+1)
+				name = self.labels.uniqueName("e")
 
 				enterprise = UIPetriNet()
 				node = UINode(enterprise)
@@ -242,18 +324,7 @@ class IndustryController:
 				source, target = self.fixTransitions(sourceItem, targetItem)
 
 				if self.checkConnection(source, target):
-					dx = target.node.x - source.node.x
-					dy = target.node.y - source.node.y
-					angle = math.atan2(dy, dx)
-
-					source.setAngle(angle)
-					target.setAngle(angle + math.pi)
-
-					channel = Place()
-					self.net.places.add(channel)
-
-					arrow = UIChannelArrow(source, target, channel)
-					self.graph.arrows.add(arrow)
+					createChannel(self.industry, source, target)
 
 		self.scene.setHoverEnabled(True)
 
@@ -390,6 +461,7 @@ class IndustryScene(PetriScene):
 		self.enterpriseSelected = Signal()
 
 	def load(self, industry):
+		self.pool = MessageAnimPool(self.scene, self.style)
 		self.loadPetriNet(industry)
 
 	def registerTools(self, toolbar):
@@ -399,20 +471,16 @@ class IndustryScene(PetriScene):
 	def createController(self):
 		return IndustryController(self.style, self.window, self.net)
 
-	def addNode(self, node):
+	def createNodeItem(self, node):
 		item = EnterpriseItem(self.scene, self.style, node)
 		item.doubleClicked.connect(lambda: self.enterpriseSelected(node))
-		self.scene.addItem(item)
+		return item
 
-	def addArrow(self, arrow):
-		item = ChannelArrowItem(self.scene, self.style, arrow)
-		label = ChannelArrowLabel(self.scene, arrow)
-		self.scene.addItem(item)
-		self.scene.addItem(label)
+	def createArrowItem(self, arrow):
+		return ChannelArrowItem(self.scene, self.pool, arrow)
 
-	def addLooseArrow(self, arrow):
-		item = LooseArrowItem(self.scene, self.style, arrow)
-		self.scene.addItem(item)
+	def createLooseArrowItem(self, arrow):
+		return LooseArrowItem(self.scene, self.style, arrow)
 
 	def createSettingsWidget(self, items):
 		classes = (EnterpriseItem, LooseArrowItem)
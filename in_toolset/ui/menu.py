@@ -17,6 +17,7 @@ class FileMenu(QMenu):
 		self.open = Action("Open", "Ctrl+O")
 		self.save = Action("Save", "Ctrl+S")
 		self.saveAs = Action("Save as", "Ctrl+Shift+S")
+		self.importNet = Action("Import", "Ctrl+Shift+I")
 		self.export = Action("Export", "Ctrl+E")
 		self.exportAs = Action("Export as", "Ctrl+Shift+E")
 		self.quit = Action("Quit", "Ctrl+Q")
@@ -25,6 +26,7 @@ class FileMenu(QMenu):
 		self.addAction(self.open)
 		self.addAction(self.save)
 		self.addAction(self.saveAs)
+		self.addAction(self.importNet)
 		self.addAction(self.export)
 		self.addAction(self.exportAs)
 		self.addAction(self.quit)
@@ -35,10 +37,16 @@ class EditMenu(QMenu):
 		super().__init__("Edit")
 
 		self.selectAll = Action("Select all", "Ctrl+A")
+		self.find = Action("Find", "Ctrl+F")
 		self.setInitialMarking = Action("Set Initial Marking", "Ctrl+M")
+		self.autoLayout = Action("Auto layout", "Ctrl+L")
+		self.autoWire = Action("Connect messages", "Ctrl+K")
 
 		self.addAction(self.selectAll)
+		self.addAction(self.find)
 		self.addAction(self.setInitialMarking)
+		self.addAction(self.autoLayout)
+		self.addAction(self.autoWire)
 
 
 class ViewMenu(QMenu):
@@ -47,10 +55,21 @@ class ViewMenu(QMenu):
 
 		self.showGrid = Action("Show grid", "Ctrl+1", True)
 		self.showGrid.setChecked(True)
+		self.showAnimations = Action("Show animations", "Ctrl+2", True)
+		self.showAnimations.setChecked(True)
+		self.showPerformance = Action("Show performance overlay", "Ctrl+3", True)
+		self.recordTimeline = Action("Record timeline", "Ctrl+4", True)
+		self.showHeatMap = Action("Show firing heat map", "Ctrl+5", True)
+		self.resetStatistics = Action("Reset firing statistics", "Ctrl+6")
 		self.resetCamera = Action("Reset camera", "Ctrl+R")
 		self.editIndustry = Action("Go to industry net", "Ctrl+I")
 
 		self.addAction(self.showGrid)
+		self.addAction(self.showAnimations)
+		self.addAction(self.showPerformance)
+		self.addAction(self.recordTimeline)
+		self.addAction(self.showHeatMap)
+		self.addAction(self.resetStatistics)
 		self.addSeparator()
 		self.addAction(self.resetCamera)
 		self.addAction(self.editIndustry)
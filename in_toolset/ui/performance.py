@@ -0,0 +1,137 @@
+"""Measuring where the editor spends its time, for the performance overlay of the :py:class:`~in_toolset.ui.view.EditorView`.
+
+The editor reports the durations of painting, mouse handling, hover updates, item updates and layout to the
+:py:data:`monitor`, which keeps the ones of the last second for the overlay and, while recording,
+all of them for a timeline that can be opened in the trace viewers of web browsers.
+While the monitor is disabled, the measured code only checks :py:attr:`PerformanceMonitor.enabled`."""
+
+from ..common import Signal
+import collections
+import functools
+import json
+import time
+
+
+class PerformanceMonitor:
+	"""Collects durations of named sections of the editor and the number of emitted signals"""
+	def __init__(self, window=1.0):
+		self.enabled = False #: Whether durations are collected
+		self.recording = False #: Whether durations are also kept for :py:meth:`writeTimeline`
+		self.window = window #: The number of seconds over which :py:meth:`stats` is computed
+
+		self.samples = collections.deque() # (name, end, duration) of the last `window` seconds
+		self.events = [] # (name, start, duration) since recording started
+		self.counters = [] # (time, emits) since recording started
+		self.lastFrame = None
+		self.emits = 0
+		self.emitSamples = collections.deque() # (time, emits) of the last `window` seconds
+		self.saved = None
+
+	def setEnabled(self, enabled):
+		"""Start or stop collecting durations. Signal emissions are only counted while the monitor is enabled."""
+		if enabled == self.enabled:
+			return
+		self.enabled = enabled
+		self.samples.clear()
+		self.emitSamples.clear()
+		self.lastFrame = None
+		if enabled:
+			self.saved = (Signal.emit, Signal.__call__)
+			emit = Signal.emit
+			monitor = self
+			def countedEmit(signal, *args):
+				monitor.emits += 1
+				emit(signal, *args)
+			Signal.emit = Signal.__call__ = countedEmit
+		else:
+			Signal.emit, Signal.__call__ = self.saved
+			self.saved = None
+			self.stopRecording()
+
+	def startRecording(self):
+		"""Keep all durations from now on, enabling the monitor if necessary"""
+		self.setEnabled(True)
+		self.recording = True
+		self.events = []
+		self.counters = []
+
+	def stopRecording(self):
+		self.recording = False
+
+	def record(self, name, start, end=None):
+		"""Record that the section `name` ran from the :py:func:`time.perf_counter` value `start` until `end`, or until now"""
+		if end is None:
+			end = time.perf_counter()
+		self.samples.append((name, end, end - start))
+		if self.recording:
+			self.events.append((name, start, end - start))
+
+	def frame(self):
+		"""Record the end of a frame, i.e. of painting the view. The time between frames is recorded as ``frame``."""
+		now = time.perf_counter()
+		if self.lastFrame is not None:
+			self.record("frame", self.lastFrame, now)
+		self.lastFrame = now
+		self.emitSamples.append((now, self.emits))
+		if self.recording:
+			self.counters.append((now, self.emits))
+		self.expire(now)
+
+	def expire(self, now):
+		limit = now - self.window
+		while self.samples and self.samples[0][1] < limit:
+			self.samples.popleft()
+		while len(self.emitSamples) > 1 and self.emitSamples[0][0] < limit:
+			self.emitSamples.popleft()
+
+	def stats(self):
+		"""Return a dictionary that maps the names of the sections of the last :py:attr:`window` seconds to their
+		number, their average and their largest duration, and the time spent in them per second"""
+		result = {}
+		for name, end, duration in self.samples:
+			count, total, longest = result.get(name, (0, 0, 0))
+			result[name] = (count + 1, total + duration, max(longest, duration))
+		return {
+			name: (count, total / count, longest, total / self.window)
+			for name, (count, total, longest) in result.items()
+		}
+
+	def emitRate(self):
+		"""Return the number of signal emissions per second over the last :py:attr:`window` seconds"""
+		if len(self.emitSamples) < 2:
+			return 0
+		(start, first), (end, last) = self.emitSamples[0], self.emitSamples[-1]
+		return (last - first) / max(end - start, 1e-6)
+
+	def writeTimeline(self, f):
+		"""Write the recorded durations and signal emissions to the text file `f` in the trace event format,
+		which trace viewers like the ones of Chrome and Firefox can open"""
+		events = []
+		for name, start, duration in self.events:
+			events.append({"name": name, "ph": "X", "ts": start * 1e6, "dur": duration * 1e6, "pid": 1, "tid": 1})
+		previous = None
+		for now, emits in self.counters:
+			if previous is not None:
+				rate = (emits - previous[1]) / max(now - previous[0], 1e-6)
+				events.append({"name": "signal emissions per second", "ph": "C", "ts": now * 1e6, "pid": 1, "args": {"emits": rate}})
+			previous = (now, emits)
+		json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def measured(name):
+	"""Decorate a method so that its duration is recorded as `name` while the :py:data:`monitor` is enabled"""
+	def decorator(method):
+		@functools.wraps(method)
+		def wrapper(*args):
+			if not monitor.enabled:
+				return method(*args)
+			start = time.perf_counter()
+			try:
+				return method(*args)
+			finally:
+				monitor.record(name, start)
+		return wrapper
+	return decorator
+
+
+monitor = PerformanceMonitor() #: The monitor of the editor
@@ -2,6 +2,14 @@
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from ..common import Signal, SignalListener
+from ..model.ui import UINode, UIArrow
+from ..model.spatial import GraphIndex
+from .common import NodeItem
+from .view import EditorScene
+from .. import config as config
+
+
+VIRTUAL_MARGIN = .25 #: The part of the width or height of the view by which items are created beyond its edges in a virtual scene
 
 
 class SeparatorLine(QFrame):
@@ -71,7 +79,7 @@ class PetriScene:
 		self.window = window
 		
 		self.toolbar = self.window.toolbar
-		self.scene = self.window.scene
+		self.scene = EditorScene()
 		self.view = self.window.view
 		self.settings = self.window.settings
 		
@@ -79,25 +87,74 @@ class PetriScene:
 		
 		self.signals = SignalListener()
 		
+		self.generalSettings = None
+		self.loaded = False
+		
+		self.net = None
+		self.controller = None
+		self.items = {}
+		self.virtual = False
+		self.graphIndex = None
+		self.populated = QRectF()
+		
+		# While the scene is not shown, its items are suspended and this only notes whether the net changed
+		self.viewState = None
+		self.stale = False
+		self.staleSignals = SignalListener()
+		
 	def loadPetriNet(self, net):
+		self.window.setScene(self.scene)
 		self.scene.clear()
 		self.view.resetTransform()
 		
 		self.net = net
-		self.connect(net.graph.nodes.added, self.addNode)
-		self.connect(net.graph.arrows.added, self.addArrow)
-		self.connect(net.graph.looseArrows.added, self.addLooseArrow)
+		self.items = {}
+		if self.controller:
+			self.controller.disconnect()
 		
-		for node in net.graph.nodes:
-			self.addNode(node)
-		for arrow in net.graph.arrows:
-			self.addArrow(arrow)
-		for arrow in net.graph.looseArrows:
-			self.addLooseArrow(arrow)
+		# Large graphs only get items for the objects around the visible part of the scene
+		threshold = config.get("ui.virtual_scene_threshold")
+		self.virtual = bool(threshold and len(net.graph.nodes) >= threshold)
+		if not self.virtual:
+			self.addObjects()
 		
 		self.controller = self.createController()
 		self.scene.setController(self.controller)
 		
+		self.attach()
+		
+	def activate(self):
+		"""Show the scene again after :py:meth:`cleanup`, with the items, view transform and selection it had.
+		Items are only brought up to date if the net changed in the meantime."""
+		self.window.setScene(self.scene)
+		self.view.setState(self.viewState)
+		
+		self.staleSignals.disconnect()
+		for item in self.items.values():
+			item.resume()
+		if self.stale:
+			if not self.virtual:
+				self.addObjects()
+			for item in self.items.values():
+				item.refresh()
+			self.stale = False
+		
+		self.attach()
+		
+	def attach(self):
+		"""Connect the scene to the net, the view and the toolbar"""
+		if self.virtual:
+			self.graphIndex = GraphIndex(self.net.graph)
+			self.populated = QRectF()
+			self.connect(self.graphIndex.changed, self.scheduleUpdate)
+			self.connect(self.view.viewportChanged, self.updateVisible)
+			self.scene.clusterSource = self
+			self.updateVisible()
+		else:
+			self.connect(self.net.graph.nodes.added, self.addObject)
+			self.connect(self.net.graph.arrows.added, self.addObject)
+			self.connect(self.net.graph.looseArrows.added, self.addObject)
+		
 		self.connect(self.scene.selectionChanged, self.updateSelection)
 		
 		self.view.setHandDrag(False)
@@ -108,28 +165,152 @@ class PetriScene:
 		self.registerTools(self.toolbar)
 		self.connect(self.toolbar.selectionChanged, self.updateTool)
 		
-		self.generalSettings = self.createGeneralSettings()
-		self.settings.setWidget(self.generalSettings)
+		# The settings are built after the scene has been painted, so that they do not delay it
+		self.generalSettings = None
+		self.settings.setWidget(None)
+		self.loaded = True
+		QTimer.singleShot(0, self.showSettings)
 		
 	def cleanup(self):
+		"""Hide the scene, keeping its items so that :py:meth:`activate` can show it again quickly"""
 		self.signals.disconnect()
+		self.loaded = False
+		
+		if self.graphIndex is not None:
+			self.graphIndex.disconnect()
+			self.graphIndex = None
+			self.scene.clusterSource = None
 		
-		self.generalSettings.cleanup()
-		if self.settings.widget() != self.generalSettings:
-			self.settings.widget().cleanup()
+		if self.generalSettings:
+			self.generalSettings.cleanup()
+			self.generalSettings = None
+		self.cleanupSettingsWidget()
+		
+		self.viewState = self.view.state()
+		
+		# Deleted objects keep their items, which are not in the scene
+		self.scene.updates.flush()
+		self.scene.animations.finishAll()
+		for item in self.items.values():
+			item.suspend()
+		self.stale = False
+		self.staleSignals.connect(self.net.changed, self.markStale)
+		
+	def release(self):
+		"""Delete the items of a hidden scene, after which it has to be loaded again"""
+		self.staleSignals.disconnect()
+		for item in self.items.values():
+			item.release()
+		self.items = {}
 		self.scene.cleanup()
+		self.scene.clear()
+		self.controller.disconnect()
+		self.controller = None
+		self.net = None
+		
+	def markStale(self):
+		self.stale = True
+		
+	def itemCount(self):
+		"""Return the number of model objects that have an item in the scene"""
+		return len(self.items)
+		
+	def addObjects(self):
+		"""Create the items for all objects of the graph that do not have one yet"""
+		for node in self.net.graph.nodes:
+			self.addObject(node)
+		for arrow in self.net.graph.arrows:
+			self.addObject(arrow)
+		for arrow in self.net.graph.looseArrows:
+			self.addObject(arrow)
+		
+	def cleanupSettingsWidget(self):
+		widget = self.settings.widget()
+		if widget and widget != self.generalSettings:
+			widget.cleanup()
+		
+	def getGeneralSettings(self):
+		if not self.generalSettings:
+			self.generalSettings = self.createGeneralSettings()
+		return self.generalSettings
+		
+	def showSettings(self):
+		if self.loaded and not self.settings.widget():
+			self.updateSelection()
+		
+	def addObject(self, obj):
+		"""Create the item for `obj`, a node, arrow or loose arrow of the graph, unless it already has one"""
+		if obj not in self.items:
+			if isinstance(obj, UINode):
+				item = self.createNodeItem(obj)
+			elif isinstance(obj, UIArrow):
+				item = self.createArrowItem(obj)
+			else:
+				item = self.createLooseArrowItem(obj)
+			self.items[obj] = item
+			self.scene.addItem(item)
+		
+	def scheduleUpdate(self):
+		self.scene.updates.schedule(self.updateChanged)
+		
+	def updateChanged(self):
+		if self.loaded and self.graphIndex is not None:
+			self.updateVisible(True)
+		
+	def updateVisible(self, force=False):
+		"""Create the items for the objects in and around the visible part of the scene, and release the items of other objects.
+		Nothing is done if the visible part is still inside the area populated last time, unless `force` is set."""
+		visible = self.view.visibleRect()
+		if not force and self.populated.contains(visible):
+			return
+		
+		if self.scene.clustering:
+			# Clusters are drawn from the graph index, so only the selected items are needed
+			self.populated = QRectF()
+			objects = set()
+		else:
+			margin = max(visible.width(), visible.height()) * VIRTUAL_MARGIN
+			self.populated = visible.adjusted(-margin, -margin, margin, margin)
+			objects = self.graphIndex.query(
+				self.populated.left(), self.populated.top(), self.populated.right(), self.populated.bottom()
+			)
+		
+		keep = set(self.scene.selectedItems())
+		keep.update(self.scene.dragger.items)
+		for obj, item in list(self.items.items()):
+			if obj not in objects and item not in keep:
+				item.release()
+				del self.items[obj]
+		
+		for obj in objects:
+			self.addObject(obj)
+		
+	def showNode(self, node):
+		"""Move the view to `node` and select it"""
+		self.view.centerOnPoint(node.x, node.y)
+		self.scene.clearSelection()
+		item = self.items.get(node)
+		if item:
+			item.setSelected(True)
+		
+	def clusterPoints(self, rect):
+		selected = {item.node for item in self.scene.selectedItems() if isinstance(item, NodeItem)}
+		return [
+			(node.x, node.y, node in selected)
+			for node in self.graphIndex.queryNodes(rect.left(), rect.top(), rect.right(), rect.bottom())
+		]
 		
 	def updateSelection(self):
-		if self.settings.widget() != self.generalSettings:
-			self.settings.widget().cleanup()
+		self.cleanupSettingsWidget()
 
 		items = self.scene.selectedItems()
 		widget = self.createSettingsWidget(items)
 		if widget:
 			self.settings.setWidget(widget)
 		else:
-			self.generalSettings.setSelection(items)
-			self.settings.setWidget(self.generalSettings)
+			generalSettings = self.getGeneralSettings()
+			generalSettings.setSelection(items)
+			self.settings.setWidget(generalSettings)
 		
 	def updateTool(self, tool):
 		if tool == "selection":
@@ -142,9 +323,9 @@ class PetriScene:
 		
 	def registerTools(self, toolbar): pass
 	
-	def addNode(self, node): pass
-	def addArrow(self, arrow): pass
-	def addLooseArrow(self, arrow): pass
+	def createNodeItem(self, node): raise NotImplementedError
+	def createArrowItem(self, arrow): raise NotImplementedError
+	def createLooseArrowItem(self, arrow): raise NotImplementedError
 	
 	def createGeneralSettings(self): return GeneralSettings(self.net)
 	def createSettingsWidget(self, items): return None
@@ -3,12 +3,23 @@ from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 from PyQt5.QtCore import *
 from ..common import *
+from ..model.spatial import SpatialHash
+from ..model.ui import GRID_SIZE
+from .performance import monitor, measured
 from .. import config as config
+import collections
 import json
 import math
+import time
 
 
-GRID_SIZE = 20
+# Level of detail thresholds, as the scale at which the scene is drawn
+LOD_LABELS = 0.4    #: Below this scale, labels and token counts are not drawn
+LOD_DETAILS = 0.25  #: Below this scale, arrows are drawn as plain lines and loose arrows are not drawn
+LOD_CLUSTERS = 0.2  #: Below this scale, nodes are drawn as clusters instead of individually
+LOD_GRID = 6        #: The grid is not drawn if its lines would be closer than this number of pixels
+
+CLUSTER_SIZE = 24 #: The size in pixels of the cells in which nodes are clustered
 
 
 def round(value, base):
@@ -23,7 +34,15 @@ def mergeColors(c1, c2, p=.5):
 	r = c1.red() * (1 - p) + c2.red() * p
 	g = c1.green() * (1 - p) + c2.green() * p
 	b = c1.blue() * (1 - p) + c2.blue() * p
-	return QColor(r, g, b)
+	return QColor(int(r), int(g), int(b))
+	
+def levelOfDetail(painter):
+	"""Return the scale at which `painter` draws"""
+	return QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+	
+def zoomBucket(scale):
+	"""Round `scale` to a quarter of a power of two, so that nearby zoom levels share cached pixmaps"""
+	return math.floor(math.log2(max(scale, 1 / 64)) * 4 + .5)
 	
 
 ShapeColors = {
@@ -178,11 +197,16 @@ class ShapePart:
 	
 	
 class Shape:
-	def __init__(self):
+	maxPixmapSize = 256 #: Shapes that would be larger than this on screen are drawn directly instead of from a cached pixmap
+	
+	def __init__(self, name=None):
+		self.name = name #: The name of the shape in the style, only named shapes are cached
+		self.version = 0 #: Incremented whenever the geometry changes, to invalidate cached pixmaps
 		self.parts = []
 		self.path = QPainterPath()
 		self.shapePath = QPainterPath()
 		self.rect = QRectF()
+		self.margin = 0
 		
 	def addPart(self, part):
 		self.parts.append(part)
@@ -198,6 +222,42 @@ class Shape:
 		self.update()
 			
 	def draw(self, painter, filter=None):
+		"""Draw the shape with `painter`, from a cached pixmap if possible"""
+		transform = painter.worldTransform()
+		if self.name and transform.type() <= QTransform.TxScale:
+			if self.drawCached(painter, filter, transform.m11()):
+				return
+		self.drawPaths(painter, filter)
+		
+	def drawCached(self, painter, filter, scale):
+		bucket = zoomBucket(scale)
+		scale = 2 ** (bucket / 4) * painter.device().devicePixelRatioF()
+		
+		rect = self.rect.adjusted(-self.margin, -self.margin, self.margin, self.margin)
+		width = math.ceil(rect.width() * scale)
+		height = math.ceil(rect.height() * scale)
+		if width > self.maxPixmapSize or height > self.maxPixmapSize:
+			return False
+		
+		key = "%s/%i/%i/%s" %(self.name, self.version, bucket, filter.key() if filter else "")
+		pixmap = QPixmapCache.find(key)
+		if pixmap is None:
+			pixmap = QPixmap(max(width, 1), max(height, 1))
+			pixmap.fill(Qt.transparent)
+			
+			pixmapPainter = QPainter(pixmap)
+			pixmapPainter.scale(scale, scale)
+			pixmapPainter.translate(-rect.topLeft())
+			self.drawPaths(pixmapPainter, filter)
+			pixmapPainter.end()
+			
+			QPixmapCache.insert(key, pixmap)
+		
+		painter.setRenderHint(QPainter.SmoothPixmapTransform)
+		painter.drawPixmap(rect, pixmap, QRectF(pixmap.rect()))
+		return True
+			
+	def drawPaths(self, painter, filter=None):
 		painter.setRenderHint(QPainter.Antialiasing)
 		
 		for part in self.parts:
@@ -224,6 +284,59 @@ class Shape:
 			self.path.addPath(part.path)
 			self.shapePath.addPath(part.shapePath)
 		self.rect = self.shapePath.boundingRect()
+		self.margin = max([part.pen.widthF() / 2 for part in self.parts if part.pen.style() != Qt.NoPen], default=0) + 1
+		self.version += 1
+		
+		
+class TextLayout:
+	"""A text laid out once in a font size, with its bounding rectangle when it is centered on the origin"""
+	def __init__(self, text, font):
+		self.font = font
+		
+		self.text = QStaticText(text)
+		self.text.setPerformanceHint(QStaticText.AggressiveCaching)
+		self.text.prepare(QTransform(), font)
+		
+		size = self.text.size()
+		self.offset = QPointF(-size.width() / 2, -size.height() / 2) #: The top left corner of the text when it is centered on the origin
+		
+		rect = QRectF(QFontMetrics(font).boundingRect(text))
+		rect.moveCenter(QPointF(0, 0))
+		rect = rect.united(QRectF(self.offset, size))
+		self.rect = rect.adjusted(-2, -2, 2, 2)
+		
+		
+class TextCache:
+	"""Shares the layouts of texts between items, so that every text is measured and laid out only once for every font size.
+	The least recently requested layouts are dropped when there are more than `limit`, items keep the layouts they use."""
+	def __init__(self, limit=4096):
+		self.limit = limit
+		self.fonts = {}
+		self.layouts = collections.OrderedDict()
+		
+	def font(self, size):
+		font = self.fonts.get(size)
+		if font is None:
+			font = QFont()
+			font.setPixelSize(size)
+			self.fonts[size] = font
+		return font
+		
+	def layout(self, text, size):
+		"""Return the :py:class:`TextLayout` of `text` in the font with pixel size `size`"""
+		key = (text, size)
+		layout = self.layouts.get(key)
+		if layout is None:
+			layout = TextLayout(text, self.font(size))
+			self.layouts[key] = layout
+			if len(self.layouts) > self.limit:
+				self.layouts.popitem(False)
+		else:
+			self.layouts.move_to_end(key)
+		return layout
+		
+		
+textCache = TextCache() #: The text layouts shared by all labels
 		
 		
 class Style:
@@ -231,15 +344,125 @@ class Style:
 		self.shapes = {}
 		
 	def load(self, filename):
+		"""Load the shapes in `filename`. Shapes that were loaded before are updated in place, so that items using them pick up the changes."""
 		with open(filename) as f:
 			info = json.load(f)
 		
 		for name, data in info["shapes"].items():
-			shape = Shape()
+			shape = self.shapes.get(name)
+			if shape is None:
+				shape = Shape(name)
+				self.shapes[name] = shape
 			shape.load(data)
-			self.shapes[name] = shape
 
 			
+class Animation:
+	"""Base class for animations run by an :py:class:`AnimationScheduler`"""
+	duration = 0.5 #: The duration in seconds
+	
+	def __init__(self):
+		self.time = 0 #: The number of seconds since the animation was started
+		
+	def step(self, progress):
+		"""Show the state at `progress`, which goes from 0 to 1"""
+		
+	def finish(self):
+		"""Show the final state, this is called instead of step when the animation ends or is skipped"""
+		
+		
+class AnimationScheduler:
+	"""Advances all running animations of a scene from a single timer, which only runs while there are animations"""
+	interval = 16 #: The time between frames in milliseconds
+	
+	def __init__(self):
+		self.enabled = True
+		self.animations = set()
+		
+		self.clock = QElapsedTimer()
+		self.timer = QTimer()
+		self.timer.setInterval(self.interval)
+		self.timer.timeout.connect(self.tick)
+		
+	def setEnabled(self, enabled):
+		"""Enable or disable animations, when disabled they are finished immediately"""
+		self.enabled = enabled
+		if not enabled:
+			self.finishAll()
+		
+	def start(self, animation):
+		"""Start `animation`, or restart it if it is already running"""
+		if not self.enabled:
+			animation.finish()
+			return
+		
+		animation.time = 0
+		animation.step(0)
+		self.animations.add(animation)
+		if not self.timer.isActive():
+			self.clock.start()
+			self.timer.start()
+			
+	def stop(self, animation):
+		"""Stop `animation` without finishing it"""
+		self.animations.discard(animation)
+		
+	def isRunning(self, animation):
+		return animation in self.animations
+		
+	def finishAll(self):
+		animations = self.animations
+		self.animations = set()
+		for animation in animations:
+			animation.finish()
+			
+	def clear(self):
+		"""Stop all animations, e.g. because the items they animate were removed"""
+		self.animations = set()
+		self.timer.stop()
+		
+	def tick(self):
+		elapsed = self.clock.restart() / 1000
+		for animation in list(self.animations):
+			if animation not in self.animations:
+				continue # Stopped by another animation
+			animation.time += elapsed
+			if animation.time >= animation.duration:
+				self.animations.discard(animation)
+				animation.finish()
+			else:
+				animation.step(animation.time / animation.duration)
+		if not self.animations:
+			self.timer.stop()
+			
+			
+class UpdateQueue:
+	"""Collects the callbacks that bring items up to date after changes of the model, and calls each of them once at the next iteration of the event loop.
+	This way, an item whose model object changes several times while handling one event is only updated once."""
+	def __init__(self):
+		self.pending = {}
+		self.scheduled = False
+		
+	def schedule(self, callback):
+		"""Call `callback` at the next iteration of the event loop, unless it is already scheduled"""
+		self.pending[callback] = None
+		if not self.scheduled:
+			self.scheduled = True
+			QTimer.singleShot(0, self.flush)
+			
+	@measured("updates")
+	def flush(self):
+		"""Call the scheduled callbacks now, including those scheduled by them"""
+		self.scheduled = False
+		while self.pending:
+			pending = self.pending
+			self.pending = {}
+			for callback in pending:
+				callback()
+				
+	def clear(self):
+		self.pending = {}
+			
+
 class DragMode:
 	NONE = 0
 	NORMAL = 1
@@ -247,9 +470,13 @@ class DragMode:
 
 	
 class EditorItem(QGraphicsItem):
+	clustered = False #: Whether the item is counted in the clusters drawn when zoomed out
+	collides = False #: Whether the item is invalid where it overlaps other items that collide
+	
 	def __init__(self, scene):
 		super().__init__()
 		self.setFlag(QGraphicsItem.ItemIsSelectable)
+		self.setFlag(QGraphicsItem.ItemSendsGeometryChanges)
 		
 		self.signals = SignalListener()
 		
@@ -261,6 +488,10 @@ class EditorItem(QGraphicsItem):
 	
 	def connect(self, signal, callback):
 		self.signals.connect(signal, callback)
+		
+	def connectUpdate(self, signal, callback):
+		"""Connect `signal` so that `callback` is called through the update queue of the scene, at most once per iteration of the event loop"""
+		self.signals.connect(signal, lambda *args: self.scene.updates.schedule(callback))
 	
 	def disconnect(self):
 		self.signals.disconnect()
@@ -279,12 +510,54 @@ class EditorItem(QGraphicsItem):
 	def addToScene(self):
 		self.scene.addItem(self)
 		
+	def release(self):
+		"""Disconnect the item from the model and remove it from the scene, because it is no longer needed"""
+		self.disconnect()
+		if QGraphicsItem.scene(self):
+			self.scene.removeItem(self)
+		
+	def suspend(self):
+		"""Stop following the model while the scene is not shown, see :py:meth:`resume`"""
+		self.signals.suspend()
+		
+	def resume(self):
+		"""Follow the model again after :py:meth:`suspend`"""
+		self.signals.resume()
+		
+	def refresh(self):
+		"""Bring the item up to date with changes of the model that it missed while it was suspended"""
+		self.update()
+		
+	def showIf(self, active):
+		"""Add the item to the scene if `active` is set and remove it otherwise"""
+		if active and not QGraphicsItem.scene(self):
+			self.addToScene()
+		elif not active and QGraphicsItem.scene(self):
+			self.removeFromScene()
+		
 	def checkCollisions(self): pass
 	
+	def itemChange(self, change, value):
+		if change == QGraphicsItem.ItemPositionHasChanged or change == QGraphicsItem.ItemSceneHasChanged:
+			self.updateIndex()
+		return super().itemChange(change, value)
+		
+	def updateIndex(self):
+		"""Update the bounding rectangle of the item in the spatial index of the scene, this must be called whenever its geometry changes"""
+		if QGraphicsItem.scene(self) is self.scene:
+			self.scene.indexItem(self)
+		else:
+			self.scene.unindexItem(self)
+	
 	
 class ShapeFilter:
+	"""Changes the pens and brushes of a shape depending on the state of an item.
+	Filters implement :py:meth:`key`, which returns a string that is equal for states in which the filter has the same effect."""
 	def __init__(self, item):
 		self.item = item
+		
+	def key(self):
+		return "%i%i" %(self.item.isSelected(), self.item.hover)
 
 	def applyToPen(self, pen):
 		if self.item.isSelected():
@@ -316,6 +589,7 @@ class EditorShape(EditorItem):
 	def updateShape(self):
 		self.prepareGeometryChange()
 		self.shp.update()
+		self.updateIndex()
 		self.update()
 		
 	def setHover(self, hover):
@@ -344,13 +618,18 @@ class DragParam:
 
 	
 class ObjectDragger:
-	def __init__(self):
+	"""Drags items with the mouse. Items with :py:attr:`DragMode.NORMAL` are moved together by the same offset through their `moveTo` method,
+	only when their position on the grid changes, and their collisions are checked with a single query for all of them."""
+	def __init__(self, scene):
+		self.scene = scene
 		self.reset()
 	
 	def reset(self):
 		self.items = []
 		self.itemBase = []
+		self.positions = []
 		self.dragBase = None
+		self.batch = False
 		
 	def isDragging(self):
 		return self.items and self.dragBase
@@ -362,19 +641,42 @@ class ObjectDragger:
 			item.setZValue(item.zValue() + .5)
 		self.items = items
 		self.itemBase = [item.pos() for item in items]
+		self.positions = [(base.x(), base.y()) for base in self.itemBase]
+		self.batch = all(item.dragMode == DragMode.NORMAL for item in items)
 		
 	def update(self, pos):
 		if self.isDragging():
-			posDiff = pos - self.dragBase
-			for item, base in zip(self.items, self.itemBase):
-				item.drag(DragParam(base + posDiff, pos))
-			for item in self.items:
-				item.checkCollisions()
+			if self.batch:
+				self.moveAll(pos.x() - self.dragBase.x(), pos.y() - self.dragBase.y())
+			else:
+				posDiff = pos - self.dragBase
+				for item, base in zip(self.items, self.itemBase):
+					item.drag(DragParam(base + posDiff, pos))
+				# The items have to be at their new positions for the collision checks
+				self.scene.updates.flush()
+				for item in self.items:
+					item.checkCollisions()
+				
+	def moveAll(self, dx, dy):
+		"""Move the items by (`dx`, `dy`) from where they were when the drag started, aligned to the grid"""
+		positions = [(round(base.x() + dx, GRID_SIZE), round(base.y() + dy, GRID_SIZE)) for base in self.itemBase]
+		if positions != self.positions:
+			for item, (x, y), previous in zip(self.items, positions, self.positions):
+				if (x, y) != previous:
+					item.moveTo(x, y)
+			self.positions = positions
+			
+			self.scene.updates.flush()
+			self.scene.checkCollisions(self.items)
 	
 	def finish(self, pos):
 		if any(item.invalid for item in self.items):
-			for item, base in zip(self.items, self.itemBase):
-				item.drag(DragParam(base, self.dragBase))
+			if self.batch:
+				self.moveAll(0, 0)
+			else:
+				for item, base in zip(self.items, self.itemBase):
+					item.drag(DragParam(base, self.dragBase))
+			for item in self.items:
 				item.setInvalid(False)
 		
 		for item in self.items:
@@ -387,13 +689,15 @@ class ObjectDragger:
 			index = self.items.index(item)
 			self.items.pop(index)
 			self.itemBase.pop(index)
+			self.positions.pop(index)
 
 
 class EditorScene(QGraphicsScene):
 	def __init__(self):
 		super().__init__(-10000, -10000, 20000, 20000)
 		
-		self.dragger = ObjectDragger()
+		self.updates = UpdateQueue()
+		self.dragger = ObjectDragger(self)
 		self.placedItem = None
 		
 		self.hoverEnabled = True
@@ -401,9 +705,76 @@ class EditorScene(QGraphicsScene):
 		
 		self.controller = None
 		
+		# Hover, picking and collision checks use this index instead of looking at every item
+		self.index = SpatialHash(GRID_SIZE * 5)
+		self.hovered = set()
+		self.insertions = 0
+		
+		self.zoom = 1
+		self.clustering = False
+		self.clusterSource = None #: An object with a `clusterPoints` method that is used instead of the items to draw clusters
+		
+		self.animations = AnimationScheduler()
+		
+		self.heatMap = None #: The :py:class:`~in_toolset.model.statistics.HeatMap` by which the items are coloured, if any
+		
 	def cleanup(self):
 		for item in self.items():
 			item.disconnect()
+			
+	def clear(self):
+		super().clear()
+		self.index.clear()
+		self.hovered = set()
+		self.animations.clear()
+		self.updates.clear()
+		
+	def indexItem(self, item):
+		if item not in self.index:
+			# Items added later are drawn on top of earlier ones with the same z value
+			self.insertions += 1
+			item.insertion = self.insertions
+			if self.clustering:
+				item.setFlag(QGraphicsItem.ItemHasNoContents)
+		rect = item.sceneBoundingRect()
+		self.index.insert(item, rect.left(), rect.top(), rect.right(), rect.bottom())
+		
+	def unindexItem(self, item):
+		self.index.remove(item)
+		self.hovered.discard(item)
+		
+	def itemsAt(self, pos, *classes):
+		"""Return the items of one of `classes` whose shape contains `pos`, topmost first"""
+		items = [
+			item for item in self.index.queryPoint(pos.x(), pos.y())
+			if isinstance(item, classes) and item.contains(item.mapFromScene(pos))
+		]
+		items.sort(key=lambda item: (item.zValue(), item.insertion), reverse=True)
+		return items
+		
+	def checkCollisions(self, items):
+		"""Mark the items of `items` that collide with other items as invalid, and the others as valid.
+		Only items whose `collides` attribute is set are checked, and only against items that are not in `items`.
+		The index is queried once, for the rectangle around all items."""
+		items = [item for item in items if item.collides]
+		if not items:
+			return
+		
+		rects = [item.sceneBoundingRect() for item in items]
+		bounds = rects[0]
+		for rect in rects[1:]:
+			bounds = bounds.united(rect)
+		
+		moving = set(items)
+		others = SpatialHash(GRID_SIZE * 5)
+		for other in self.index.query(bounds.left(), bounds.top(), bounds.right(), bounds.bottom()):
+			if other.collides and other not in moving:
+				rect = other.sceneBoundingRect()
+				others.insert(other, rect.left(), rect.top(), rect.right(), rect.bottom())
+		
+		for item, rect in zip(items, rects):
+			candidates = others.query(rect.left(), rect.top(), rect.right(), rect.bottom()) if others else ()
+			item.setInvalid(any(item.collidesWithItem(other) for other in candidates))
 		
 	def setController(self, controller):
 		self.controller = controller
@@ -413,18 +784,21 @@ class EditorScene(QGraphicsScene):
 			item.setSelected(True)
 			
 	def findItem(self, pos, *classes):
-		for item in self.items(pos):
-			if isinstance(item, classes):
-				return item
+		items = self.itemsAt(pos, *classes)
+		if items:
+			return items[0]
 				
+	@measured("hover")
 	def updateHover(self, pos):
-		enabled = self.hoverEnabled and not self.dragger.isDragging()
-		for item in self.items():
-			if isinstance(item, EditorShape):
-				if enabled:
-					item.checkHover(pos)
-				else:
-					item.setHover(False)
+		hovered = set()
+		if self.hoverEnabled and not self.dragger.isDragging():
+			hovered = set(self.itemsAt(pos, EditorShape))
+		
+		for item in self.hovered - hovered:
+			item.setHover(False)
+		for item in hovered:
+			item.setHover(True)
+		self.hovered = hovered
 			
 	def setHoverEnabled(self, hover):
 		self.hoverEnabled = hover
@@ -432,17 +806,89 @@ class EditorScene(QGraphicsScene):
 	def setGridEnabled(self, grid):
 		self.gridEnabled = grid
 		self.update()
+		
+	def setHeatMap(self, heatMap):
+		"""Colour the items by the statistics of `heatMap`, or normally if it is None"""
+		if heatMap is self.heatMap:
+			return
+		if self.heatMap:
+			self.heatMap.changed.disconnect(self.scheduleRepaint)
+		self.heatMap = heatMap
+		if heatMap:
+			heatMap.changed.connect(self.scheduleRepaint)
+		self.update()
+		
+	def scheduleRepaint(self):
+		self.updates.schedule(self.update)
+		
+	def setZoom(self, zoom):
+		"""Tell the scene at which scale it is viewed, to switch between drawing nodes individually and as clusters"""
+		self.zoom = zoom
+		clustering = zoom < LOD_CLUSTERS
+		if clustering != self.clustering:
+			self.clustering = clustering
+			# Items without contents are skipped when painting, which is much faster than returning early from paint
+			for item in self.index.rects:
+				item.setFlag(QGraphicsItem.ItemHasNoContents, clustering)
+			self.update()
 			
 	def drawBackground(self, painter, rect):
-		pen = QPen()
-		pen.setColor(QColor(230, 230, 230))
+		if not self.gridEnabled or GRID_SIZE * levelOfDetail(painter) < LOD_GRID:
+			return
+			
+		pen = QPen(QColor(230, 230, 230))
+		pen.setCosmetic(True)
 		painter.setPen(pen)
 		
-		if self.gridEnabled:
-			for x in range(int(rect.left()) // GRID_SIZE, int(rect.right()) // GRID_SIZE + 1):
-				painter.drawLine(x * GRID_SIZE, rect.top(), x * GRID_SIZE, rect.bottom())
-			for y in range(int(rect.top()) // GRID_SIZE, int(rect.bottom()) // GRID_SIZE + 1):
-				painter.drawLine(rect.left(), y * GRID_SIZE, rect.right(), y * GRID_SIZE)
+		lines = []
+		for x in range(math.floor(rect.left() / GRID_SIZE), math.floor(rect.right() / GRID_SIZE) + 1):
+			lines.append(QLineF(x * GRID_SIZE, rect.top(), x * GRID_SIZE, rect.bottom()))
+		for y in range(math.floor(rect.top() / GRID_SIZE), math.floor(rect.bottom() / GRID_SIZE) + 1):
+			lines.append(QLineF(rect.left(), y * GRID_SIZE, rect.right(), y * GRID_SIZE))
+		painter.drawLines(lines)
+		
+	def drawForeground(self, painter, rect):
+		if self.clustering:
+			self.drawClusters(painter, rect)
+			
+	def drawClusters(self, painter, rect):
+		"""Draw the nodes in `rect` as one circle for every cell of :py:data:`CLUSTER_SIZE` pixels that contains nodes"""
+		size = CLUSTER_SIZE / levelOfDetail(painter)
+		clusters = {}
+		for x, y, selected in self.clusterPoints(rect):
+			key = (math.floor(x / size), math.floor(y / size))
+			cluster = clusters.get(key)
+			if cluster is None:
+				clusters[key] = [x, y, 1, selected]
+			else:
+				cluster[0] += x
+				cluster[1] += y
+				cluster[2] += 1
+				cluster[3] = cluster[3] or selected
+		
+		transform = painter.worldTransform()
+		painter.save()
+		painter.resetTransform()
+		painter.setRenderHint(QPainter.Antialiasing)
+		for x, y, count, selected in clusters.values():
+			center = transform.map(QPointF(x / count, y / count))
+			radius = min(3 + 2 * math.sqrt(count), CLUSTER_SIZE / 2)
+			painter.setPen(QPen(Qt.blue if selected else Qt.black))
+			painter.setBrush(QColor(128, 128, 255, min(64 + 16 * count, 255)))
+			painter.drawEllipse(center, radius, radius)
+		painter.restore()
+		
+	def clusterPoints(self, rect):
+		"""Return the positions of the nodes in `rect` as ``(x, y, selected)`` tuples"""
+		if self.clusterSource:
+			return self.clusterSource.clusterPoints(rect)
+		
+		points = []
+		for item in self.index.query(rect.left(), rect.top(), rect.right(), rect.bottom()):
+			if item.clustered:
+				pos = item.scenePos()
+				points.append((pos.x(), pos.y(), item.isSelected()))
+		return points
 			
 	def keyPressEvent(self, e):
 		super().keyPressEvent(e)
@@ -453,6 +899,7 @@ class EditorScene(QGraphicsScene):
 			if self.placedItem:
 				self.placedItem.checkCollisions()
 			
+	@measured("mouse")
 	def mousePressEvent(self, e):
 		pos = e.scenePos()
 		if self.dragger.isDragging() or self.placedItem:
@@ -474,6 +921,7 @@ class EditorScene(QGraphicsScene):
 					self.addItem(self.placedItem)
 				e.accept()
 					
+	@measured("mouse")
 	def mouseMoveEvent(self, e):
 		super().mouseMoveEvent(e)
 		
@@ -484,6 +932,7 @@ class EditorScene(QGraphicsScene):
 			self.placedItem.drag(DragParam(e.scenePos(), e.scenePos()))
 			self.placedItem.checkCollisions()
 			
+	@measured("mouse")
 	def mouseReleaseEvent(self, e):
 		super().mouseReleaseEvent(e)
 		if e.button() == Qt.LeftButton:
@@ -494,6 +943,7 @@ class EditorScene(QGraphicsScene):
 				self.controller.finishPlacement(e.scenePos(), self.placedItem)
 				self.placedItem = None
 
+	@measured("mouse")
 	def mouseDoubleClickEvent(self, e):
 		pos = e.scenePos()
 		if e.button() == Qt.LeftButton:
@@ -520,6 +970,110 @@ class EditorView(QGraphicsView):
 		
 		self.scrollStep = config.get("ui.keyboard_scroll_speed")
 		
+		self.viewportChanged = Signal() #: Emitted when the visible part of the scene changes
+		
+		# The performance overlay is refreshed by a timer, the item counts are only taken then
+		self.overlayEnabled = False
+		self.overlayRect = QRect()
+		self.overlayItems = (0, 0)
+		self.overlayTimer = QTimer()
+		self.overlayTimer.setInterval(500)
+		self.overlayTimer.timeout.connect(self.refreshOverlay)
+		
+	def setOverlayEnabled(self, enabled):
+		"""Show or hide the performance overlay, which enables the :py:data:`~in_toolset.ui.performance.monitor` while it is shown"""
+		self.overlayEnabled = enabled
+		monitor.setEnabled(enabled or monitor.recording)
+		if enabled:
+			self.refreshOverlay()
+			self.overlayTimer.start()
+		else:
+			self.overlayTimer.stop()
+		self.viewport().update()
+			
+	def refreshOverlay(self):
+		scene = self.scene()
+		self.overlayItems = (len(scene.items()), len(scene.items(self.visibleRect())))
+		self.viewport().update(self.overlayRect.adjusted(0, 0, 200, 40))
+		
+	def paintEvent(self, e):
+		if not monitor.enabled:
+			super().paintEvent(e)
+			return
+			
+		start = time.perf_counter()
+		super().paintEvent(e)
+		monitor.record("paint", start)
+		monitor.frame()
+		if self.overlayEnabled:
+			painter = QPainter(self.viewport())
+			self.drawOverlay(painter)
+			painter.end()
+			
+	def drawOverlay(self, painter):
+		"""Draw the durations of the last second that the :py:data:`~in_toolset.ui.performance.monitor` collected in the top left corner"""
+		stats = monitor.stats()
+		frames, frameTime, longestFrame, share = stats.get("frame", (0, 0, 0, 0))
+		lines = [
+			"frame %6.1f ms, max %6.1f ms" %(frameTime * 1000, longestFrame * 1000),
+			"items %i, visible %i" %self.overlayItems,
+			"signals %i/s" %monitor.emitRate(),
+		]
+		for name in ("paint", "mouse", "hover", "updates", "layout"):
+			count, average, longest, share = stats.get(name, (0, 0, 0, 0))
+			lines.append("%-7s %6.1f ms, max %6.1f ms, %3i%%" %(name, average * 1000, longest * 1000, share * 100))
+		if monitor.recording:
+			lines.append("recording %i events" %len(monitor.events))
+		
+		painter.setFont(QFont("monospace", 8))
+		metrics = painter.fontMetrics()
+		width = max(metrics.boundingRect(line).width() for line in lines) + 12
+		self.overlayRect = QRect(8, 8, width, metrics.lineSpacing() * len(lines) + 8)
+		painter.fillRect(self.overlayRect, QColor(0, 0, 0, 160))
+		painter.setPen(Qt.white)
+		for i, line in enumerate(lines):
+			painter.drawText(14, 12 + metrics.ascent() + i * metrics.lineSpacing(), line)
+			
+	def setZoom(self, zoom):
+		self.zoom = zoom
+		self.scene().setZoom(zoom)
+		
+	def visibleRect(self):
+		"""Return the part of the scene that is visible, in scene coordinates"""
+		return self.mapToScene(self.viewport().rect()).boundingRect()
+		
+	def centerOnPoint(self, x, y):
+		"""Move the view so that the scene point (`x`, `y`) is in the middle of it"""
+		center = self.visibleRect().center()
+		self.translate(center.x() - x, center.y() - y)
+		
+	def state(self):
+		"""Return the transform and zoom of the view, to be restored with :py:meth:`setState`"""
+		return self.transform(), self.zoom
+		
+	def setState(self, state):
+		transform, zoom = state
+		self.setTransform(transform)
+		self.setZoom(zoom)
+		self.viewportChanged.emit()
+		
+	def resetTransform(self):
+		super().resetTransform()
+		self.setZoom(1)
+		self.viewportChanged.emit()
+		
+	def translate(self, dx, dy):
+		super().translate(dx, dy)
+		self.viewportChanged.emit()
+		
+	def scale(self, sx, sy):
+		super().scale(sx, sy)
+		self.viewportChanged.emit()
+		
+	def resizeEvent(self, e):
+		super().resizeEvent(e)
+		self.viewportChanged.emit()
+		
 	def updateDragMode(self):
 		if self.handDrag:
 			self.setDragMode(QGraphicsView.ScrollHandDrag)
@@ -572,7 +1126,7 @@ class EditorView(QGraphicsView):
 		zoom = 1.0008 ** e.angleDelta().y()
 		newZoom = self.zoom * zoom
 		if newZoom > 0.1 and newZoom < 10:
-			self.zoom = newZoom
+			self.setZoom(newZoom)
 			prevPos = self.mapToScene(e.pos())
 			self.scale(zoom, zoom)
 			newPos = self.mapToScene(e.pos())
@@ -4,9 +4,12 @@ from PyQt5.QtCore import *
 from .view import EditorScene, EditorView
 from .tools import ToolBar
 from .menu import MenuBar
+from .performance import monitor
 from . import settings
 from ..common import Signal
-from ..model.project import Project
+from ..model.project import Project, BINARY_EXTENSION
+from ..model.index import SearchIndex
+from ..model.statistics import HeatMap
 import os
 
 
@@ -78,12 +81,101 @@ class NetListWidget(QWidget):
 		self.enterpriseSelected.emit(item.obj)
 
 
+class SearchResultItem(QListWidgetItem):
+	def __init__(self, result):
+		super().__init__()
+		self.result = result
+
+		if result.enterprise is None:
+			self.setText("%s  (enterprise)" %result.text)
+		else:
+			enterprise = result.enterprise.label.text or "Enterprise"
+			self.setText("%s  (%s in %s)" %(result.text, result.kind, enterprise))
+
+
+class SearchPalette(QDialog):
+	"""A dialog that searches the labels and message types of the whole project while typing.
+	The :py:class:`~in_toolset.model.index.SearchIndex` is only built when it is first searched after loading a project."""
+	def __init__(self, parent):
+		super().__init__(parent)
+		self.resultSelected = Signal()
+
+		self.setWindowTitle("Find")
+		self.resize(400, 300)
+
+		self.industry = None
+		self.index = None
+
+		self.query = QLineEdit()
+		self.query.setPlaceholderText("Label or message type")
+		self.query.textEdited.connect(self.updateResults)
+		self.query.returnPressed.connect(self.handleReturn)
+
+		self.results = QListWidget()
+		self.results.itemActivated.connect(self.handleItemActivated)
+
+		layout = QVBoxLayout()
+		layout.addWidget(self.query)
+		layout.addWidget(self.results)
+		self.setLayout(layout)
+
+	def setProject(self, project):
+		if self.index:
+			self.index.disconnect()
+			self.index = None
+		self.industry = project.industry
+		self.results.clear()
+		# The palette is not modal, so it may be open while another project is loaded
+		if self.isVisible():
+			self.updateResults(self.query.text())
+
+	def getIndex(self):
+		if not self.index:
+			self.index = SearchIndex(self.industry)
+		return self.index
+
+	def showPalette(self):
+		self.updateResults(self.query.text())
+		self.query.selectAll()
+		self.query.setFocus()
+		self.show()
+		self.raise_()
+
+	def updateResults(self, text):
+		self.results.clear()
+		for result in self.getIndex().search(text):
+			self.results.addItem(SearchResultItem(result))
+		self.results.setCurrentRow(0)
+
+	def keyPressEvent(self, e):
+		# The query keeps the focus, the arrow keys choose a result
+		if e.key() == Qt.Key_Down:
+			self.results.setCurrentRow(min(self.results.currentRow() + 1, self.results.count() - 1))
+		elif e.key() == Qt.Key_Up:
+			self.results.setCurrentRow(max(self.results.currentRow() - 1, 0))
+		else:
+			super().keyPressEvent(e)
+
+	def handleReturn(self):
+		item = self.results.currentItem()
+		if item:
+			self.handleItemActivated(item)
+
+	def handleItemActivated(self, item):
+		self.hide()
+		self.resultSelected.emit(item.result)
+
+
 class MainWindow(QMainWindow):
 	def __init__(self, style):
 		super().__init__()
 		self.newProject = Signal()
 		self.loadProject = Signal()
+		self.importProject = Signal()
 		self.enterpriseSelected = Signal()
+		self.autoLayout = Signal()
+		self.autoWire = Signal()
+		self.searchResultSelected = Signal()
 
 		self.setContextMenuPolicy(Qt.PreventContextMenu)
 
@@ -92,10 +184,16 @@ class MainWindow(QMainWindow):
 		self.toolbar = ToolBar(style)
 		self.addToolBar(Qt.LeftToolBarArea, self.toolbar)
 
+		# Every petri net scene has its own EditorScene, which is shown through setScene
 		self.scene = EditorScene()
 		self.view = EditorView(self.scene)
 		self.setCentralWidget(self.view)
 
+		self.gridEnabled = True
+		self.animationsEnabled = True
+		self.heatMapEnabled = False
+		self.heatMap = None
+
 		self.settings = QDockWidget("Settings")
 		self.settings.setFixedWidth(200)
 		self.settings.setFeatures(QDockWidget.DockWidgetMovable)
@@ -111,33 +209,112 @@ class MainWindow(QMainWindow):
 		netsDock.setWidget(self.nets)
 		self.addDockWidget(Qt.RightDockWidgetArea, netsDock)
 
+		self.search = SearchPalette(self)
+		self.search.resultSelected.connect(self.searchResultSelected)
+
 		menuBar = MenuBar()
 		menuBar.file.new.triggered.connect(self.handleNew)
 		menuBar.file.open.triggered.connect(self.handleOpen)
 		menuBar.file.save.triggered.connect(self.handleSave)
 		menuBar.file.saveAs.triggered.connect(self.handleSaveAs)
+		menuBar.file.importNet.triggered.connect(self.handleImport)
 		menuBar.file.export.triggered.connect(self.handleExport)
 		menuBar.file.exportAs.triggered.connect(self.handleExportAs)
 		menuBar.file.quit.triggered.connect(self.close)
-		menuBar.edit.selectAll.triggered.connect(self.scene.selectAll)
+		menuBar.edit.selectAll.triggered.connect(self.selectAll)
+		menuBar.edit.find.triggered.connect(self.search.showPalette)
 		menuBar.edit.setInitialMarking.triggered.connect(self.handleSetInitialMarking)
-		menuBar.view.showGrid.toggled.connect(self.scene.setGridEnabled)
+		menuBar.edit.autoLayout.triggered.connect(self.handleAutoLayout)
+		menuBar.edit.autoWire.triggered.connect(self.handleAutoWire)
+		menuBar.view.showGrid.toggled.connect(self.setGridEnabled)
+		menuBar.view.showAnimations.toggled.connect(self.setAnimationsEnabled)
+		menuBar.view.showPerformance.toggled.connect(self.view.setOverlayEnabled)
+		menuBar.view.recordTimeline.toggled.connect(self.handleRecordTimeline)
+		menuBar.view.showHeatMap.toggled.connect(self.setHeatMapEnabled)
+		menuBar.view.resetStatistics.triggered.connect(self.resetStatistics)
 		menuBar.view.resetCamera.triggered.connect(self.view.resetTransform)
 		menuBar.view.editIndustry.triggered.connect(self.selectIndustry)
 		self.setMenuBar(menuBar)
 
-	def setProject(self, project):
+	def setScene(self, scene):
+		"""Show `scene` in the view, with the grid, animation and heat map settings of the menu"""
+		self.scene.setHeatMap(None)
+		self.scene = scene
+		self.view.setScene(scene)
+		scene.setGridEnabled(self.gridEnabled)
+		scene.animations.setEnabled(self.animationsEnabled)
+		scene.setHeatMap(self.heatMap if self.heatMapEnabled else None)
+
+	def selectAll(self):
+		self.scene.selectAll()
+
+	def setGridEnabled(self, enabled):
+		self.gridEnabled = enabled
+		self.scene.setGridEnabled(enabled)
+
+	def setAnimationsEnabled(self, enabled):
+		self.animationsEnabled = enabled
+		self.scene.animations.setEnabled(enabled)
+
+	def setHeatMapEnabled(self, enabled):
+		self.heatMapEnabled = enabled
+		self.scene.setHeatMap(self.heatMap if enabled else None)
+
+	def resetStatistics(self):
+		if self.heatMap:
+			self.heatMap.reset()
+
+	def handleRecordTimeline(self, enabled):
+		"""Start recording a timeline, or stop and save it"""
+		if enabled:
+			monitor.startRecording()
+			return
+
+		monitor.stopRecording()
+		monitor.setEnabled(self.view.overlayEnabled)
+		filename, filter = QFileDialog.getSaveFileName(
+			self, "Save timeline", settings.getLastPath(), "Trace (*.json);;All files (*.*)", "Trace (*.json)",
+			QFileDialog.DontUseNativeDialog
+		)
+		if not filename:
+			return
+		if not '.' in filename:
+			filename += ".json"
+		try:
+			with open(filename, "w") as f:
+				monitor.writeTimeline(f)
+		except OSError as e:
+			QMessageBox.warning(self, "Error", "An error occurred while saving %s:\n%s" %(filename, e))
+
+	def setProject(self, project, journal=None):
 		self.nets.setProject(project)
+		self.search.setProject(project)
+
+		# The statistics are collected from the start, so that the heat map can be shown at any time
+		self.scene.setHeatMap(None)
+		if self.heatMap:
+			self.heatMap.disconnect()
+		self.heatMap = HeatMap(project.industry)
 
 		self.project = project
 		self.project.filenameChanged.connect(self.updateWindowTitle)
 		self.project.unsavedChanged.connect(self.updateWindowTitle)
 
+		self.journal = journal
+		if self.journal:
+			self.journal.saveFailed.connect(self.handleSaveFailed)
+
 		self.updateWindowTitle()
 
 	def handleSetInitialMarking(self):
 		self.project.industry.net.setInitialMarking()
 
+	def handleAutoLayout(self):
+		self.autoLayout.emit()
+
+	def handleAutoWire(self):
+		self.autoWire.emit()
+
 	def selectIndustry(self):
 		self.enterpriseSelected.emit(self.project.industry)
 
@@ -178,7 +355,7 @@ class MainWindow(QMainWindow):
 
 		filename, filter = QFileDialog.getOpenFileName(
 			self, "Load model", settings.getLastPath(),
-			"Workflow model (*.flow);;All files (*.*)"
+			"Workflow model (*.flow *.flowb);;All files (*.*)"
 		)
 		if not filename:
 			return False
@@ -187,10 +364,26 @@ class MainWindow(QMainWindow):
 		self.loadProject.emit(filename)
 		return True
 
+	def saveProject(self, filename):
+		"""Save the project to `filename`, in the background if possible"""
+		if self.journal and not filename.endswith(BINARY_EXTENSION):
+			self.journal.save(filename)
+			self.project.setFilename(filename)
+			self.project.setUnsaved(False)
+		else:
+			self.project.save(filename)
+			if self.journal:
+				self.journal.markSaved(filename)
+
+	def handleSaveFailed(self, filename, error):
+		self.project.setUnsaved(True)
+		text = "An error occurred while saving %s:\n%s" %(filename, error)
+		QMessageBox.warning(self, "Error", text)
+
 	def handleSave(self):
 		if not self.project.filename:
 			return self.handleSaveAs()
-		self.project.save(self.project.filename)
+		self.saveProject(self.project.filename)
 		return True
 
 	def handleSaveAs(self):
@@ -198,17 +391,35 @@ class MainWindow(QMainWindow):
 			self,
 			"Save model",
 			settings.getLastPath(),
-			"Workflow model (*.flow);;All files (*.*)",
+			"Workflow model (*.flow);;Binary workflow model (*.flowb);;All files (*.*)",
 			"Workflow model (*.flow)",
 			QFileDialog.DontUseNativeDialog
 		)
 		if not filename:
 			return False
 		if not '.' in filename:
-			filename += ".flow"
+			if "*.flowb" in filter:
+				filename += BINARY_EXTENSION
+			else:
+				filename += ".flow"
+
+		settings.setLastPath(os.path.dirname(filename))
+		self.saveProject(filename)
+		return True
+
+	def handleImport(self):
+		if not self.checkUnsaved():
+			return False
+
+		filename, filter = QFileDialog.getOpenFileName(
+			self, "Import model", settings.getLastPath(),
+			"PNML (*.pnml);;All files (*.*)"
+		)
+		if not filename:
+			return False
 
 		settings.setLastPath(os.path.dirname(filename))
-		self.project.save(filename)
+		self.importProject.emit(filename)
 		return True
 
 	def handleExport(self):
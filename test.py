@@ -7,12 +7,49 @@ if version < (3, 6):
 	raise RuntimeError(msg)
 
 import unittest
+import tempfile
+import contextlib
+import subprocess
+import importlib.util
+import types
+import io
+import json
+import csv
+import os
+import math
+import random
+import time
 from in_toolset.model.base import *
 from in_toolset.model.ui import *
 from in_toolset.model.project import *
+from in_toolset.model.binary import *
+from in_toolset.model.compiled import *
+from in_toolset.model.journal import *
+from in_toolset.model.spatial import *
+from in_toolset.model.layout import *
+from in_toolset.model.index import *
+from in_toolset.model.wiring import *
+from in_toolset.model.generator import *
+from in_toolset.model.statistics import *
+from in_toolset.model.timed import *
+from in_toolset.commands import isCommand
+from in_toolset import benchmark
+from in_toolset import memory
+from in_toolset.ui.performance import PerformanceMonitor
+from in_toolset.common import *
+from in_toolset import cli
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples")
 
 class TestProject(unittest.TestCase):
 
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, "roy")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
     def testSetFilename(self):
         pro = Project()
         pro.setFilename("peter")
@@ -25,17 +62,17 @@ class TestProject(unittest.TestCase):
 
     def testSave(self):
         pro = Project()
-        pro.save("roy")
-        self.assertTrue(pro.filename == "roy")
+        pro.save(self.filename)
+        self.assertTrue(pro.filename == self.filename)
         self.assertFalse(pro.unsaved)
 
     def testLoad(self):
         pro = Project()
-        pro.save("roy")
+        pro.save(self.filename)
         pro = Project()
         pro.setFilename("peter")
-        pro.load("roy")
-        self.assertTrue(pro.filename == "roy")
+        pro.load(self.filename)
+        self.assertTrue(pro.filename == self.filename)
         self.assertFalse(pro.unsaved)
 
 
@@ -62,6 +99,634 @@ class TestProjectWriter(unittest.TestCase):
         self.assertTrue(len(industry.net.transitions) == 1)   
 
 
+class TestBinaryProject(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def testRoundTrip(self):
+        source = os.path.join(EXAMPLES, "cookies.flow")
+        binary = os.path.join(self.dir.name, "cookies" + BINARY_EXTENSION)
+        target = os.path.join(self.dir.name, "cookies.flow")
+        convertProject(source, binary)
+        self.assertTrue(isBinaryProject(binary))
+        convertProject(binary, target)
+        with open(source) as f:
+            original = json.load(f)
+        with open(target) as f:
+            converted = json.load(f)
+        self.assertTrue(original == converted)
+
+    def testLoadCompiled(self):
+        source = os.path.join(EXAMPLES, "cookies.flow")
+        binary = os.path.join(self.dir.name, "cookies" + BINARY_EXTENSION)
+        convertProject(source, binary)
+        net = BinaryProjectReader().loadCompiled(binary)
+        expected = compileIndustry(loadIndustry(source))
+        self.assertTrue(list(net.marking) == list(expected.marking))
+        self.assertTrue(net.presets == expected.presets)
+        self.assertTrue(net.postsets == expected.postsets)
+        self.assertTrue(list(net.transitionEnterprise) == list(expected.transitionEnterprise))
+
+
+class TestProjectJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, "cookies.flow")
+        convertProject(os.path.join(EXAMPLES, "cookies.flow"), self.filename)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def testRecover(self):
+        pro = Project()
+        pro.load(self.filename)
+        journal = ProjectJournal(pro)
+        node = pro.industry.graph.nodes[0].obj.graph.nodes[0]
+        node.move(100, 200)
+        journal.flush()
+        node.label.setText("renamed")
+        journal.flush()
+        journal.close(False)
+
+        recovered = Project()
+        self.assertTrue(recoverProject(recovered, self.filename))
+        self.assertTrue(recovered.unsaved)
+        writer = ProjectWriter()
+        self.assertTrue(writer.save(recovered.industry) == writer.save(pro.industry))
+
+    def testDirtySections(self):
+        pro = Project()
+        pro.load(self.filename)
+        journal = ProjectJournal(pro)
+        journal.flush(True)
+        enterprise = pro.industry.graph.nodes[0]
+        enterprise.obj.graph.nodes[0].move(100, 200)
+        self.assertTrue(journal.dirtyEnterprises == {enterprise} and not journal.dirtySections and not journal.dirtyAll)
+        journal.flush(True)
+        pro.industry.net.places[0].setTokens(3)
+        self.assertTrue(journal.dirtySections == {"places"} and not journal.dirtyEnterprises)
+        journal.flush(True)
+
+        # Appending keeps the ids of the other objects, so only the changed sections are rebuilt
+        builder = EnterpriseBuilder(pro.industry, enterprise)
+        builder.connect(builder.addPlace(), builder.addTransition())
+        self.assertTrue(journal.dirtySections == {"places", "transitions", "industry"} and not journal.dirtyAll)
+        journal.flush(True)
+        pro.industry.net.places[0].delete()
+        self.assertTrue(journal.dirtyAll)
+        journal.close(False)
+
+        recovered = Project()
+        self.assertTrue(recoverProject(recovered, self.filename))
+        writer = ProjectWriter()
+        self.assertTrue(writer.save(recovered.industry) == writer.save(pro.industry))
+
+    def testSave(self):
+        pro = Project()
+        pro.load(self.filename)
+        journal = ProjectJournal(pro)
+        pro.industry.net.places[0].setTokens(5)
+        journal.flush()
+        self.assertTrue(pro.unsaved)
+        target = os.path.join(self.dir.name, "saved.flow")
+        journal.save(target)
+        journal.close()
+        self.assertFalse(os.path.exists(journalPath(self.filename)))
+        pro = Project()
+        pro.load(target)
+        self.assertTrue(pro.industry.net.places[0].tokens == 5)
+
+    def testRenameEnterprise(self):
+        pro = Project()
+        pro.load(self.filename)
+        journal = ProjectJournal(pro)
+        journal.flush(True)
+        pro.industry.graph.nodes[0].label.setText("renamed")
+        target = os.path.join(self.dir.name, "saved.flow")
+        journal.save(target)
+        journal.close()
+        pro = Project()
+        pro.load(target)
+        self.assertTrue(pro.industry.graph.nodes[0].label.text == "renamed")
+
+    def testUntitled(self):
+        self.assertTrue(str(os.getpid()) in journalPath(None))
+        pro = Project()
+        pro.load(self.filename)
+        journal = ProjectJournal(pro)
+        journal.flush(True)
+        journal.close(False)
+
+        # The journal of a process that exited without removing it
+        process = subprocess.Popen([sys.executable, "-c", "pass"])
+        process.wait()
+        leftover = os.path.join(tempfile.gettempdir(), "%s%i.journal" %(UNTITLED_PREFIX, process.pid))
+        os.replace(journalPath(self.filename), leftover)
+        self.assertTrue(leftover in leftoverJournals())
+
+        recovered = Project()
+        self.assertTrue(recoverProject(recovered, None, leftover))
+        journal = ProjectJournal(recovered)
+        self.assertFalse(journalPath(None) in leftoverJournals())
+        journal.takeOver(leftover)
+        journal.close()
+        self.assertFalse(os.path.exists(leftover) or os.path.exists(journalPath(None)))
+
+    def testSaveBinary(self):
+        pro = Project()
+        pro.load(self.filename)
+        journal = ProjectJournal(pro)
+        pro.industry.net.places[0].setTokens(5)
+        journal.flush()
+        binary = os.path.join(self.dir.name, "saved.flowb")
+        pro.save(binary)
+        journal.markSaved(binary)
+        pro.industry.graph.nodes[0].move(300, 400)
+        journal.flush()
+        journal.close(False)
+        self.assertFalse(os.path.exists(journalPath(self.filename)))
+
+        recovered = Project()
+        recovered.load(binary)
+        self.assertTrue(recoverProject(recovered, binary))
+        node = recovered.industry.graph.nodes[0]
+        self.assertTrue((node.x, node.y) == (300, 400) and recovered.industry.net.places[0].tokens == 5)
+
+
+class TestPNML(unittest.TestCase):
+
+    def testExport(self):
+        pro = Project()
+        pro.load(os.path.join(EXAMPLES, "test1.flow"))
+        stream = io.StringIO()
+        PNMLWriter(pro.industry.net, pro.industry.graph).save(stream)
+        with open(os.path.join(EXAMPLES, "test1.pnml")) as f:
+            expected = f.read()
+        self.assertTrue(stream.getvalue().replace(' initialMarking="0"', "") == expected)
+
+    def testImport(self):
+        net = PNMLReader().load(os.path.join(EXAMPLES, "test.pnml"))
+        self.assertTrue(len(net.places) == 1)
+        self.assertTrue(len(net.transitions) == 1)
+        self.assertTrue(net.places[0].tokens == 5)
+        self.assertTrue(net.transitions[0] in list(net.places[0].postset))
+
+    def testImportStandard(self):
+        data = (
+            '<pnml xmlns="http://www.pnml.org/version-2009/grammar/pnml"><net id="n">'
+            '<place id="p"><name><text>start</text></name><initialMarking><text>2</text></initialMarking></place>'
+            '<arc id="a" source="p" target="t"/><transition id="t"/></net></pnml>'
+        )
+        industry = PNMLReader().loadIndustry(io.BytesIO(data.encode("utf-8")))
+        enterprise = industry.graph.nodes[0].obj
+        self.assertTrue(enterprise.graph.nodes[0].label.text == "start")
+        self.assertTrue(enterprise.net.places[0].tokens == 2)
+        self.assertTrue(len(enterprise.graph.arrows) == 1)
+
+        # Imported transitions get the inactive loose arrows of the editor, which are shown once they send or receive messages
+        self.assertTrue(len(industry.graph.looseArrows) == 0 and len(enterprise.graph.looseArrows) == 0)
+        enterprise.net.transitions[0].setType(TransitionType.OUTPUT)
+        self.assertTrue(len(industry.graph.looseArrows) == 1 and len(enterprise.graph.looseArrows) == 1)
+        self.assertTrue(industry.graph.looseArrows[0].node is industry.graph.nodes[0])
+
+
+class TestCLI(unittest.TestCase):
+
+    def testConvert(self):
+        with tempfile.TemporaryDirectory() as directory:
+            binary = os.path.join(directory, "cookies.flowb")
+            exported = os.path.join(directory, "cookies.pnml")
+            self.assertTrue(cli.run(["convert", os.path.join(EXAMPLES, "cookies.flow"), binary]) == 0)
+            self.assertTrue(cli.run(["convert", binary, exported]) == 0)
+            industry = cli.readIndustry(exported)
+            self.assertTrue(len(industry.net.places) == 18)
+            self.assertTrue(len(industry.graph.nodes) == 1)
+        self.assertTrue("PyQt5.QtCore" not in sys.modules)
+
+    def testLayout(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "cookies.flow")
+            self.assertTrue(cli.run(["layout", os.path.join(EXAMPLES, "cookies.flow"), "-o", output]) == 0)
+            enterprise = cli.readIndustry(output).graph.nodes[0].obj
+            positions = [(node.x, node.y) for node in enterprise.graph.nodes]
+            self.assertTrue(all(x % GRID_SIZE == 0 and y % GRID_SIZE == 0 for x, y in positions))
+            self.assertTrue(len(set(positions)) == len(positions))
+        self.assertTrue("PyQt5.QtCore" not in sys.modules)
+
+    def testBenchmark(self):
+        with tempfile.TemporaryDirectory() as directory:
+            generated = os.path.join(directory, "generated.flowb")
+            self.assertTrue(cli.run(["generate", generated, "-e", "3", "-s", "4"]) == 0)
+            self.assertTrue(len(cli.readIndustry(generated).graph.nodes) == 3)
+
+            results = os.path.join(directory, "results.json")
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                arguments = ["-s", "1,2", "-r", "1", "-n", "20", "-l", "10"]
+                self.assertTrue(cli.run(["benchmark", "-o", results] + arguments) == 0)
+                self.assertTrue(cli.run(["benchmark", "-c", results] + arguments) == 0)
+            with open(results) as f:
+                data = json.load(f)
+            self.assertTrue([result["enterprises"] for result in data["results"]] == [1, 2])
+            self.assertTrue(set(data["results"][0]["timings"]) == set(benchmark.METRICS))
+            self.assertTrue("2 enterprises (old -> new)" in output.getvalue())
+        self.assertTrue("PyQt5.QtCore" not in sys.modules)
+
+    def testIsCommand(self):
+        self.assertTrue(isCommand(["timed", "cookies.flow"]) and isCommand(["--help"]))
+        self.assertFalse(isCommand([]) or isCommand(["cookies.flow"]))
+
+        # Starting the editor only decides whether a command was given, without importing the commands
+        code = "import sys; from in_toolset.commands import isCommand; isCommand(sys.argv[1:]); print(sorted(sys.modules))"
+        output = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+        self.assertTrue("in_toolset.cli" not in output and "in_toolset.model" not in output)
+
+    def testTimed(self):
+        industry = generateIndustry(3, 3, seed=1, layout=False)
+        industry.net.transitions[0].setDelay("uniform 1 2")
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ("timed.flow", "timed.flowb"):
+                filename = os.path.join(directory, name)
+                saveIndustry(industry, filename)
+                self.assertTrue(loadIndustry(filename).net.transitions[0].delay == "uniform 1 2")
+                self.assertTrue(cli.readCompiled(filename).delays[0] == "uniform 1 2")
+            loaded = loadIndustry(filename)
+            self.assertTrue(BinaryProjectReader().loadNames(filename) == compiledNames(loaded, compileIndustry(loaded)))
+
+            results = os.path.join(directory, "results.csv")
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                self.assertTrue(cli.run(["timed", filename, "-c", "4", "-d", "exp 2", "-o", results]) == 0)
+            self.assertTrue("cases: 4," in output.getvalue())
+            with open(results, newline="") as f:
+                rows = list(csv.reader(f))
+            self.assertTrue(rows[0] == ["kind", "name", "metric", "value"])
+            self.assertTrue(["run", "", "cases", "4"] in rows)
+            self.assertTrue(sum(row[0] == "enterprise" for row in rows) == 9)
+        self.assertTrue("PyQt5.QtCore" not in sys.modules)
+
+    def testMemory(self):
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            self.assertTrue(cli.run(["memory", "-e", "2", "-n", "10", "-c", "2"]) == 0)
+        self.assertTrue("no growth" in output.getvalue())
+
+    def testProfile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            stacks = os.path.join(directory, "stacks.txt")
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                self.assertTrue(cli.run(["profile", os.path.join(EXAMPLES, "test1.flow"), "-n", "5", "-o", stacks]) == 0)
+            self.assertTrue("UINode.positionChanged" in output.getvalue())
+            with open(stacks) as f:
+                self.assertTrue(all(line.rsplit(" ", 1)[0].split(";")[0] in ("load", "visit scenes", "move", "token game", "delete and restore") for line in f))
+
+    def testStatistics(self):
+        net = CompiledNet()
+        a = net.addPlace(1)
+        b = net.addPlace()
+        net.addTransition([a], [b])
+        net.addTransition([b], [a])
+        statistics = FiringStatistics.forNet(net)
+        self.assertTrue(net.run(10, random.Random(0), statistics) == 10)
+        self.assertTrue(list(statistics.fired) == [5, 5])
+        self.assertTrue(list(statistics.averageTokens()) == [.5, .5])
+
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            self.assertTrue(cli.run(["simulate", os.path.join(EXAMPLES, "cookies.flow"), "-s", "1", "-t", "3"]) == 0)
+        self.assertTrue("Cookie supplier/flour" in output.getvalue())
+
+    def testExplore(self):
+        net = CompiledNet()
+        a = net.addPlace(2)
+        b = net.addPlace()
+        net.addTransition([a], [b])
+        space = net.explore()
+        self.assertTrue(space.states == 3)
+        self.assertTrue(space.deadlocks == 1)
+        self.assertTrue(space.deadlockExample == (0, 2))
+        self.assertTrue(space.bound == 2)
+        self.assertTrue(net.explore(2).complete == False)
+
+
+class TestLayout(unittest.TestCase):
+
+    def checkDistance(self, positions, distance):
+        for i, (x1, y1) in enumerate(positions):
+            self.assertTrue(x1 % GRID_SIZE == 0 and y1 % GRID_SIZE == 0)
+            for x2, y2 in positions[:i]:
+                self.assertTrue((x1 - x2) ** 2 + (y1 - y2) ** 2 >= distance ** 2)
+
+    def testLayered(self):
+        positions = layeredLayout([(0, 0)] * 4, [(0, 1), (1, 2), (2, 3), (3, 0)])
+        self.assertTrue([x for x, y in positions] == sorted(x for x, y in positions))
+        self.assertTrue(len(set(x for x, y in positions)) == 4)
+        self.checkDistance(positions, NODE_DISTANCE)
+
+        positions = layeredLayout([(0, 0), (0, 100), (0, 50)], [(0, 1), (0, 2)])
+        self.assertTrue(positions[1][0] == positions[2][0] > positions[0][0])
+        self.assertTrue(positions[2][1] < positions[1][1])
+
+    def testForce(self):
+        edges = [(i, i + 1) for i in range(29)] + [(5, 20)]
+        positions = forceLayout([(0, 0)] * 30, edges, iterations=30)
+        self.checkDistance(positions, ENTERPRISE_DISTANCE)
+        self.assertTrue(positions == forceLayout([(0, 0)] * 30, edges, iterations=30))
+
+    def testPlaceOnGrid(self):
+        positions = placeOnGrid([(3, 4)] * 20, 60)
+        self.assertTrue(positions[0] == (0, 0))
+        self.checkDistance(positions, 60)
+
+    def testJob(self):
+        enterprise = loadIndustry(os.path.join(EXAMPLES, "cookies.flow")).graph.nodes[0].obj
+        job = LayoutJob(enterprise.graph, layeredLayout)
+        finished = []
+        job.finished.connect(lambda: finished.append(True))
+        job.thread.join()
+        self.assertTrue(job.poll())
+        self.assertTrue(finished == [True])
+        positions = [(node.x, node.y) for node in enterprise.graph.nodes]
+        self.checkDistance(positions, NODE_DISTANCE)
+
+
+class TestModelIndex(unittest.TestCase):
+
+    def addNode(self, graph, obj, text):
+        node = UINode(obj)
+        node.label.setText(text)
+        graph.nodes.add(node)
+        return node
+
+    def testLabels(self):
+        graph = UIGraph()
+        e1 = self.addNode(graph, UIPetriNet(), "e1")
+        e7 = self.addNode(graph, UIPetriNet(), "e7")
+        self.addNode(graph, UIPetriNet(), "bakery")
+        index = LabelIndex(graph)
+        self.assertTrue(index.uniqueName("e") == "e8")
+        self.assertTrue(index.uniqueName("p") == "p1")
+        self.assertTrue(index.find("e7") == {e7})
+
+        e7.delete()
+        self.assertTrue(index.uniqueName("e") == "e2")
+        e7.restore()
+        e1.label.setText("e12")
+        self.assertTrue(index.uniqueName("e") == "e13")
+        self.assertTrue("e1" not in index and "e12" in index)
+
+        index.disconnect()
+        self.assertTrue(index.find("e12") == set())
+
+    def testMessages(self):
+        industry = UIGraph()
+        enterprise = self.addNode(industry, UIPetriNet(), "e1")
+        transition = UITransition()
+        transition.setType(TransitionType.OUTPUT)
+        transition.setMessage("order")
+        arrow = UILooseArrow(enterprise, transition)
+        industry.looseArrows.add(arrow)
+
+        index = MessageIndex(industry)
+        self.assertTrue(index.find("order", TransitionType.OUTPUT) == {arrow})
+        self.assertTrue(index.find("order", TransitionType.OUTPUT, enterprise) == {arrow})
+        self.assertTrue(index.find("order", TransitionType.INPUT) == set())
+
+        transition.setType(TransitionType.INPUT)
+        self.assertTrue(index.find("order", TransitionType.INPUT, enterprise) == {arrow})
+        transition.setMessage("invoice")
+        self.assertTrue(index.messages() == {"invoice"})
+        transition.setType(TransitionType.INTERNAL)
+        self.assertTrue(len(index) == 0)
+
+    def testArcs(self):
+        graph = UIGraph()
+        place = self.addNode(graph, Place(), "p1")
+        trans = self.addNode(graph, UITransition(), "t1")
+        index = ArcIndex(graph)
+        arrow = UIInternalArrow(place, trans)
+        graph.arrows.add(arrow)
+        self.assertTrue(index.connected(place.obj, trans.obj))
+        self.assertTrue(not index.connected(trans.obj, place.obj))
+        arrow.delete()
+        self.assertTrue(not index.connected(place.obj, trans.obj))
+
+    def testSearch(self):
+        industry = UIPetriNet()
+        bakery = self.addNode(industry.graph, UIPetriNet(), "Bakery")
+        dough = self.addNode(bakery.obj.graph, Place(), "dough")
+        bake = self.addNode(bakery.obj.graph, UITransition(), "bake")
+        bake.obj.setMessage("cookies")
+        index = SearchIndex(industry)
+
+        self.assertTrue([r.node for r in index.search("BAKE")] == [bake, bakery])
+        self.assertTrue([r.kind for r in index.search("bake")] == ["transition", "enterprise"])
+        self.assertTrue(index.search("oug")[0].enterprise == bakery)
+        self.assertTrue(index.search("cokies")[0].kind == "message")
+        self.assertTrue(index.search("xyz") == [])
+
+        dough.label.setText("batter")
+        self.assertTrue(index.search("dough") == [])
+        self.assertTrue(index.search("batt")[0].node == dough)
+
+        shop = self.addNode(industry.graph, UIPetriNet(), "shop")
+        self.addNode(shop.obj.graph, Place(), "shelf")
+        self.assertTrue(len(index.search("sh")) == 2)
+        bakery.delete()
+        self.assertTrue(index.search("bake") == [])
+        self.assertTrue(len(index) == 2)
+
+        index.disconnect()
+        self.assertTrue(len(index) == 0)
+
+
+class TestWiring(unittest.TestCase):
+
+    def addTransition(self, industry, node, type, message):
+        transition = UITransition()
+        transition.setType(type)
+        transition.setMessage(message)
+        arrow = UILooseArrow(node, transition)
+        industry.graph.looseArrows.add(arrow)
+        return arrow
+
+    def createIndustry(self):
+        industry = UIPetriNet()
+        self.nodes = []
+        for i in range(3):
+            node = UINode(UIPetriNet())
+            node.move(i * 200, 0)
+            industry.graph.nodes.add(node)
+            self.nodes.append(node)
+        return industry
+
+    def testAutoWire(self):
+        industry = self.createIndustry()
+        a, b, c = self.nodes
+        order = self.addTransition(industry, a, TransitionType.OUTPUT, "order")
+        received = self.addTransition(industry, b, TransitionType.INPUT, "order")
+        invoices = [self.addTransition(industry, b, TransitionType.OUTPUT, "invoice") for i in range(2)]
+        paid = self.addTransition(industry, a, TransitionType.INPUT, "invoice")
+        self.addTransition(industry, c, TransitionType.INPUT, "complaint")
+
+        report = autoWire(industry)
+        self.assertTrue(len(report.channels) == 1)
+        self.assertTrue(order.transition.channel is received.transition.channel is not None)
+        self.assertTrue(order.angle == 0 and received.angle == math.pi)
+        self.assertTrue(report.ambiguous["invoice"] == (invoices, [paid]))
+        self.assertTrue(list(report.unmatched) == ["complaint"])
+        self.assertTrue(len(industry.net.places) == 1)
+
+        report = autoWire(industry, MessageIndex(industry.graph), pairAmbiguous=True)
+        self.assertTrue(len(report.channels) == 1)
+        self.assertTrue(invoices[0].transition.channel is paid.transition.channel is not None)
+        self.assertTrue(report.ambiguous["invoice"] == ([invoices[1]], []))
+
+    def testNoLoops(self):
+        industry = self.createIndustry()
+        self.addTransition(industry, self.nodes[0], TransitionType.OUTPUT, "order")
+        self.addTransition(industry, self.nodes[0], TransitionType.INPUT, "order")
+        report = autoWire(industry)
+        self.assertTrue(report.channels == [])
+        self.assertTrue(len(report.unmatched["order"]) == 2)
+
+
+class TestGenerator(unittest.TestCase):
+
+    def testShapes(self):
+        sizes = {}
+        for shape in SHAPES[:-1]:
+            industry = generateIndustry(2, 3, shape, branches=2, fanout=0)
+            enterprise = industry.graph.nodes[0].obj
+            sizes[shape] = (len(enterprise.net.places), len(enterprise.net.transitions))
+            self.assertTrue(sum(place.tokens for place in enterprise.net.places) == 1)
+        self.assertTrue(sizes == {"sequence": (4, 3), "choice": (4, 6), "parallel": (16, 12)})
+
+    def testMessages(self):
+        industry = generateIndustry(20, 5, "parallel", fanout=3, density=1, seed=4)
+        self.assertTrue(len(industry.graph.nodes) == 20)
+        channels = list(industry.graph.arrows)
+        self.assertTrue(len(channels) == 60)
+        for arrow in channels:
+            self.assertTrue(arrow.source.node != arrow.target.node)
+            self.assertTrue(arrow.source.transition.message == arrow.target.transition.message)
+            self.assertTrue(arrow.source.transition.type == TransitionType.OUTPUT)
+
+        other = generateIndustry(20, 5, "parallel", fanout=3, density=1, seed=4)
+        self.assertTrue(
+            [node.label.text for node in industry.graph.nodes[3].obj.graph.nodes] ==
+            [node.label.text for node in other.graph.nodes[3].obj.graph.nodes]
+        )
+        self.assertTrue(compileIndustry(industry).presets == compileIndustry(other).presets)
+
+
+class TestFiringRecorder(unittest.TestCase):
+
+    def testRecord(self):
+        industry = generateIndustry(2, 3, "sequence", fanout=0, layout=False)
+        heatMap = HeatMap(industry)
+        recorder = heatMap.recorder
+        first = industry.graph.nodes[0].obj.net.transitions[0]
+        start = first.preset[0]
+        first.trigger()
+        self.assertTrue(recorder.fired(first) == 1 and recorder.statistics.time == 1)
+        self.assertTrue(heatMap.transitionHeat(first) == 1)
+        self.assertTrue(heatMap.enterpriseHeat(industry.graph.nodes[0]) == 1)
+        self.assertTrue(heatMap.enterpriseHeat(industry.graph.nodes[1]) == 0)
+
+        industry.net.triggerRandom()
+        self.assertTrue(recorder.statistics.totalFired() == 2)
+        self.assertTrue(heatMap.transitionHeat(first) in (.5, 1))
+        self.assertTrue(recorder.averageTokens(start) == 0)
+        self.assertTrue(recorder.averageTokens(first.postset[0]) in (.5, 1))
+
+        net = compileIndustry(industry)
+        statistics = FiringStatistics.forNet(net)
+        net.run(4, random.Random(0), statistics)
+        recorder.merge(statistics, net)
+        self.assertTrue(recorder.statistics.totalFired() == 6 and recorder.statistics.time == 6)
+
+        recorder.reset()
+        self.assertTrue(recorder.statistics.totalFired() == 0 and heatMap.transitionHeat(first) == 0)
+        heatMap.disconnect()
+        first.trigger()
+        self.assertTrue(recorder.statistics.totalFired() == 0)
+
+
+class TestTimedSimulation(unittest.TestCase):
+
+    def testParseDelay(self):
+        self.assertTrue(parseDelay("2.5") == ("const", (2.5,)))
+        self.assertTrue(parseDelay(" exp  2 ") == ("exp", (2.0,)))
+        self.assertTrue(parseDelay("triangular 1 2 4") == ("triangular", (1.0, 2.0, 4.0)))
+        for text in ("", "exp", "uniform 3 1", "normal -1 1", "often"):
+            with self.assertRaises(ValueError):
+                parseDelay(text)
+        sampler = delaySampler("uniform 1 3", random.Random(0))
+        self.assertTrue(all(1 <= sampler() <= 3 for i in range(100)))
+
+    def testSimulate(self):
+        net = CompiledNet()
+        a = net.addPlace(2, 0)
+        b = net.addPlace()
+        c = net.addPlace(0, 0)
+        net.addTransition([a], [b], 0, "1")
+        net.addTransition([b], [c], 0, "const 2")
+        result = simulateTimed(net, cases=3)
+        self.assertTrue(list(result.latencies) == [5, 5, 5] and result.time == 15 and result.finished)
+        self.assertTrue(list(result.statistics.fired) == [6, 6] and result.events == 12)
+        self.assertTrue(result.channels == [b] and result.waitingTime(b) == .5)
+        self.assertTrue(result.enterpriseUtilisation(0) == 1 and result.enterpriseThroughput(0) == .8)
+        self.assertTrue(result.transitionUtilisation(0) == .4 and result.transitionUtilisation(1) == .8)
+        self.assertTrue(list(net.marking) == [2, 0, 0])
+
+        result = simulateTimed(net, events=3)
+        self.assertTrue(not result.finished and not result.latencies and result.time == 3)
+        self.assertTrue(simulateTimed(net, until=4).transitionBusy[1] == 3)
+
+        industry = generateIndustry(3, 3, seed=2, layout=False)
+        net = compileIndustry(industry)
+        first = simulateTimed(net, 500, rng=random.Random(3), default="exp 1")
+        second = simulateTimed(net, 500, rng=random.Random(3), default="exp 1")
+        self.assertTrue(first.latencies == second.latencies and first.time == second.time)
+
+
+class TestMemory(unittest.TestCase):
+
+    def testCosts(self):
+        costs = memory.unitCosts(50)
+        self.assertTrue(set(costs) == set(name for name, prepare, build in memory.SAMPLES))
+        self.assertTrue(all(size > 0 for size in costs.values()))
+
+        footprint, industry = memory.projectFootprint(lambda: generateIndustry(3, 2), costs)
+        self.assertTrue(len(footprint.enterprises) == 3)
+        self.assertTrue(footprint.total > 0 and footprint.peak >= footprint.total)
+
+    def testCensus(self):
+        before = memory.signalCensus()
+        signal = Signal()
+        signal.connect(print)
+        signal.connect(print)
+        objects = ObjectList()
+        place = Place()
+        objects.add(place)
+        place.delete()
+        census = memory.signalCensus()
+        self.assertTrue(census["callbacks"] - before["callbacks"] >= 2)
+        self.assertTrue(census["tombstones"] - before["tombstones"] == 1)
+
+    def testGrowth(self):
+        industry = generateIndustry(3, 2)
+        samples = memory.checkGrowth(lambda: memory.visitScenes(industry), 3)
+        self.assertTrue(len(samples) == 3)
+        self.assertTrue(memory.growth(samples) == {})
+
+        leak = Signal()
+        samples = memory.checkGrowth(lambda: leak.connect(print), 3)
+        self.assertTrue(memory.growth(samples) == {"callbacks": 1})
+
+
 #class TestProjectReader(unittest.TestCase):
 
     #def testLoadPlaces(self):
@@ -90,6 +755,21 @@ class TestUITransition(unittest.TestCase):
         self.assertTrue(net.transitions[0].channel == "m1")
 
 
+class TestUIObject(unittest.TestCase):
+
+    def testMove(self):
+        calls = []
+        node = UINode(Place())
+        node.positionChanged.connect(lambda: calls.append((node.x, node.y)))
+        node.move(20, 40)
+        self.assertTrue(calls == [(20, 40)])
+        node.move(20, 40)
+        self.assertTrue(len(calls) == 1)
+        node.move(20, 60)
+        self.assertTrue(calls == [(20, 40), (20, 60)])
+        self.assertTrue(node.label.y == 60)
+
+
 class TestPlace(unittest.TestCase):
 
     def testSetTokens(self):
@@ -159,6 +839,186 @@ class TestTransition(unittest.TestCase):
         self.assertTrue(net.places[1].tokens == 1)
 
 
+class TestSignalListener(unittest.TestCase):
+
+    def testSuspend(self):
+        calls = []
+        signal = Signal()
+        listener = SignalListener()
+        listener.connect(signal, lambda: calls.append(1))
+
+        listener.suspend()
+        listener.suspend()
+        signal.emit()
+        self.assertTrue(len(calls) == 0)
+
+        listener.resume()
+        listener.resume()
+        signal.emit()
+        self.assertTrue(len(calls) == 1)
+
+        listener.suspend()
+        listener.disconnect()
+        listener.resume()
+        signal.emit()
+        self.assertTrue(len(calls) == 1)
+        self.assertTrue(len(signal.callbacks) == 0)
+
+
+class TestSignalProfiler(unittest.TestCase):
+
+    def testProfile(self):
+        emit = Signal.emit
+        node = UINode(Place())
+        calls = []
+        node.changed.connect(lambda: calls.append(1))
+        with profileSignals() as profiler:
+            with profiler.section("edit"):
+                node.x = 10
+                node.move(20, 20)
+        self.assertTrue(Signal.emit is emit and Signal.__call__ is emit)
+        self.assertTrue(len(calls) == 2)
+
+        stats = profiler.byName()
+        self.assertTrue(stats["UINode.positionChanged"].emits == 2)
+        self.assertTrue(stats["UINode.changed"].emits == 2)
+        self.assertTrue(stats["UINode.changed"].depth == 1)
+        self.assertTrue(stats["UINode.positionChanged"].cascade >= 3)
+        self.assertTrue(any(line.startswith("UINode.positionChanged") for line in profiler.report()))
+
+        f = io.StringIO()
+        profiler.writeFolded(f)
+        stacks = [line.rsplit(" ", 1)[0] for line in f.getvalue().splitlines()]
+        self.assertTrue("edit;UINode.x =;UINode.positionChanged;UINode.changed" in stacks)
+        self.assertTrue("edit;UINode.positionChanged;UINode.updateLabel" in stacks)
+
+
+class TestPerformanceMonitor(unittest.TestCase):
+
+    def testMonitor(self):
+        emit = Signal.emit
+        monitor = PerformanceMonitor()
+        signal = Signal()
+        signal.emit()
+        monitor.record("paint", 0, 1)
+        self.assertTrue(monitor.emits == 0)
+
+        monitor.startRecording()
+        self.assertTrue(monitor.enabled)
+        monitor.frame()
+        for i in range(3):
+            signal.emit()
+        start = time.perf_counter()
+        monitor.record("paint", start, start + .002)
+        monitor.record("paint", start, start + .004)
+        monitor.frame()
+        self.assertTrue(monitor.emits == 3)
+        self.assertTrue(monitor.emitRate() > 0)
+
+        count, average, longest, share = monitor.stats()["paint"]
+        self.assertTrue(count == 2 and abs(average - .003) < 1e-9 and abs(longest - .004) < 1e-9)
+        self.assertTrue("frame" in monitor.stats())
+
+        f = io.StringIO()
+        monitor.writeTimeline(f)
+        events = json.loads(f.getvalue())["traceEvents"]
+        self.assertTrue(sum(event["ph"] == "X" for event in events) == 3)
+        self.assertTrue(sum(event["ph"] == "C" for event in events) == 1)
+
+        monitor.setEnabled(False)
+        self.assertTrue(not monitor.recording)
+        self.assertTrue(Signal.emit is emit and Signal.__call__ is emit)
+
+
+class TestSpatialHash(unittest.TestCase):
+
+    def testQuery(self):
+        index = SpatialHash(10)
+        index.insert("a", 0, 0, 5, 5)
+        index.insert("b", 20, 20, 45, 25)
+        index.insert("c", -15, -15, -12, -12)
+        self.assertTrue(index.queryPoint(3, 3) == {"a"})
+        self.assertTrue(index.queryPoint(40, 22) == {"b"})
+        self.assertTrue(index.queryPoint(8, 8) == set())
+        self.assertTrue(index.query(-20, -20, 21, 21) == {"a", "b", "c"})
+        self.assertTrue(index.query(6, 6, 19, 19) == set())
+
+    def testMove(self):
+        index = SpatialHash(10)
+        index.insert("a", 0, 0, 5, 5)
+        index.insert("a", 100, 100, 105, 105)
+        self.assertTrue(index.queryPoint(3, 3) == set())
+        self.assertTrue(index.queryPoint(103, 103) == {"a"})
+        index.remove("a")
+        self.assertTrue(len(index) == 0)
+        self.assertTrue(len(index.cells) == 0)
+
+
+class TestArrowGeometry(unittest.TestCase):
+
+    def testStraight(self):
+        arrow = ArrowGeometry(0, 0, 100, 0)
+        self.assertTrue(arrow.bounds() == (0, 0, 100, 0))
+        self.assertTrue(abs(arrow.distance(50, 5) - 5) < 1e-9)
+        self.assertTrue(abs(arrow.distance(-3, -4) - 5) < 1e-9)
+
+    def testCurve(self):
+        arrow = ArrowGeometry(0, 0, 100, 0, 40)
+        x1, y1, x2, y2 = arrow.bounds()
+        # The curve reaches half of the way to its control point
+        self.assertTrue(abs(y2 - 20) < 1e-9 and y1 == 0)
+        self.assertTrue(arrow.distance(50, 20) < 1)
+        self.assertTrue(arrow.distance(50, 0) > 19)
+
+    def testHead(self):
+        arrow = ArrowGeometry(0, 0, 100, 0, 0, 10)
+        x1, y1, x2, y2 = arrow.bounds()
+        self.assertTrue(y1 < -7 and y2 > 7)
+        self.assertTrue(arrow.distance(95, 5) < 1e-9)
+        self.assertTrue(ArrowGeometry(0, 0, 100, 0).distance(95, 5) > 4)
+
+
+class TestGraphIndex(unittest.TestCase):
+
+    def createGraph(self):
+        graph = UIGraph()
+        self.place = UINode(Place())
+        self.trans = UINode(UITransition())
+        self.trans.move(400, 0)
+        self.arrow = UIInternalArrow(self.place, self.trans)
+        graph.nodes.add(self.place)
+        graph.nodes.add(self.trans)
+        graph.arrows.add(self.arrow)
+        return graph
+
+    def testQuery(self):
+        index = GraphIndex(self.createGraph(), 40)
+        self.assertTrue(index.query(-10, -10, 10, 10) == {self.place, self.arrow})
+        self.assertTrue(index.query(150, -10, 250, 10) == {self.arrow})
+        self.assertTrue(index.query(150, 100, 250, 200) == set())
+        self.assertTrue(index.queryNodes(-10, -10, 500, 10) == {self.place, self.trans})
+
+    def testUpdate(self):
+        graph = self.createGraph()
+        index = GraphIndex(graph, 40)
+        self.trans.move(400, 1000)
+        self.assertTrue(self.trans not in index.query(380, -10, 420, 10))
+        self.assertTrue(index.query(380, 990, 420, 1010) == {self.trans, self.arrow})
+
+        self.arrow.setCurve(400)
+        self.assertTrue(self.arrow in index.query(-200, 0, -190, 10))
+
+        self.place.delete()
+        self.assertTrue(len(index) == 1)
+        self.place.restore()
+        self.assertTrue(self.place in index)
+
+        index.disconnect()
+        self.assertTrue(len(index) == 0)
+        graph.nodes.add(UINode(Place()))
+        self.assertTrue(len(index) == 0)
+
+
 class TestPetriNet(unittest.TestCase):
 
     def testEnabledTransitions(self):
@@ -188,6 +1048,18 @@ class TestPetriNet(unittest.TestCase):
         net.places[0].give()
         net.checkDeadlock()
         self.assertFalse(net.deadlock)
+        net.transitions[0].trigger()
+        self.assertTrue(net.deadlock)
+
+    def testDeleteRestoreDeadlock(self):
+        net = PetriNet()
+        transition = Transition()
+        net.transitions.add(transition)
+        self.assertTrue(transition.enabled and not net.deadlock)
+        transition.delete()
+        self.assertTrue(net.enabledCount == 0 and net.deadlock)
+        transition.restore()
+        self.assertTrue(net.enabledCount == 1 and not net.deadlock)
 
     def testTriggerRandom(self):
         net = PetriNet()
@@ -210,6 +1082,25 @@ class TestPetriNet(unittest.TestCase):
         self.assertTrue(net.places[1].tokens == 1)
 
 
+# Runs after the command-line tests, which check that PyQt5 is not imported
+@unittest.skipUnless(importlib.util.find_spec("PyQt5"), "PyQt5 is not installed")
+class TestUIHeatLevel(unittest.TestCase):
+
+    def testHeatLevel(self):
+        from in_toolset.ui.common import heatLevel, HEAT_LEVELS
+        industry = generateIndustry(2, 3, "sequence", fanout=0, layout=False)
+        scene = types.SimpleNamespace(heatMap=None)
+        self.assertTrue(heatLevel(scene, HeatMap.transitionHeat) is None)
+
+        scene.heatMap = HeatMap(industry)
+        first = industry.graph.nodes[0].obj.net.transitions[0]
+        first.trigger()
+        self.assertTrue(heatLevel(scene, lambda heatMap: heatMap.transitionHeat(first)) == 1)
+        self.assertTrue(heatLevel(scene, lambda heatMap: heatMap.enterpriseHeat(industry.graph.nodes[1])) == 0)
+        self.assertTrue(heatLevel(scene, lambda heatMap: .3) == round(.3 * HEAT_LEVELS) / HEAT_LEVELS)
+        scene.heatMap.disconnect()
+
+
 
 if __name__ == '__main__':
     unittest.main()